@@ -0,0 +1,129 @@
+# 准入控制与内存预算调度
+# 根据图像尺寸和分析类型估算每个请求的峰值内存，只在全局内存预算内接纳计算；
+# 超出预算的请求在有界队列中按先后顺序等待，队列已满或等待超时则拒绝（由路由返回503和Retry-After）
+import collections
+import contextlib
+import math
+import threading
+import time
+
+# 各分析类型每个像素的峰值内存估算（字节）
+# 裂缝分析：灰度/增强/滤波/阈值/形态学等约6个单通道副本、ndimage.label的int32标记图、
+# regionprops使用的int64标记图、单条裂缝掩膜和float32距离变换、3通道结果图，
+# 再加上4张结果图转RGB、PNG编码和Base64的开销
+# 孔洞/粒度分析：约4个单通道副本、3通道结果图和结果图编码开销
+PEAK_BYTES_PER_PIXEL = {
+    'crack': 48,
+    'hole': 20,
+    'grain': 20,
+}
+# 综合分析并发执行三种分析，峰值为三者之和
+PEAK_BYTES_PER_PIXEL['all'] = sum(PEAK_BYTES_PER_PIXEL.values())
+
+
+def estimate_peak_bytes(shape, analysis_type):
+    """估算一次分析的峰值内存（字节），包含已解码的原图"""
+    height, width = shape[:2]
+    channels = shape[2] if len(shape) > 2 else 1
+    pixels = height * width
+    return pixels * (channels + PEAK_BYTES_PER_PIXEL[analysis_type])
+
+
+class AdmissionRejected(Exception):
+    """请求因内存预算不足被拒绝"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        # 建议客户端重试前等待的秒数
+        self.retry_after = retry_after
+
+
+class MemoryBudgetScheduler:
+    """按内存预算接纳计算的调度器
+
+    正在执行的请求的估算内存之和不超过budget_bytes；其余请求按到达顺序排队，
+    队列长度不超过max_queue，排队时间不超过queue_timeout秒。
+    单个请求的估算超过整个预算时按整个预算计，即独占执行而不是永远无法执行。
+    """
+
+    def __init__(self, budget_bytes, max_queue=8, queue_timeout=60.0):
+        self.budget_bytes = int(budget_bytes)
+        self.max_queue = int(max_queue)
+        self.queue_timeout = float(queue_timeout)
+        self._cond = threading.Condition()
+        self._waiters = collections.deque()
+        self._used_bytes = 0
+        self._running = 0
+        # 最近请求占用预算的平均时长（指数滑动平均），用于估算Retry-After
+        self._avg_hold = 1.0
+        # 统计计数
+        self._admitted = 0
+        self._queued = 0
+        self._rejected = 0
+        self._timed_out = 0
+        self._peak_used_bytes = 0
+
+    def _retry_after(self):
+        """估算客户端应等待的秒数"""
+        waves = (len(self._waiters) + 1) / max(1, self._running)
+        return max(1, math.ceil(self._avg_hold * waves))
+
+    def _acquire(self, cost):
+        self._used_bytes += cost
+        self._running += 1
+        self._admitted += 1
+        self._peak_used_bytes = max(self._peak_used_bytes, self._used_bytes)
+
+    @contextlib.contextmanager
+    def admit(self, cost_bytes):
+        """在预算内执行with块，必要时排队；无法接纳时抛出AdmissionRejected"""
+        cost = min(int(cost_bytes), self.budget_bytes)
+        with self._cond:
+            if not self._waiters and self._used_bytes + cost <= self.budget_bytes:
+                self._acquire(cost)
+            else:
+                if len(self._waiters) >= self.max_queue:
+                    self._rejected += 1
+                    raise AdmissionRejected('服务器繁忙，分析队列已满', self._retry_after())
+                ticket = object()
+                self._waiters.append(ticket)
+                self._queued += 1
+                deadline = time.monotonic() + self.queue_timeout
+                while not (self._waiters[0] is ticket and self._used_bytes + cost <= self.budget_bytes):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._waiters.remove(ticket)
+                        self._timed_out += 1
+                        # 队首可能发生变化，唤醒其他等待者
+                        self._cond.notify_all()
+                        raise AdmissionRejected('服务器繁忙，排队等待超时', self._retry_after())
+                    self._cond.wait(remaining)
+                self._waiters.popleft()
+                self._acquire(cost)
+                # 新的队首可能也能被接纳
+                self._cond.notify_all()
+
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._used_bytes -= cost
+                self._running -= 1
+                self._avg_hold = 0.8 * self._avg_hold + 0.2 * (time.monotonic() - start)
+                self._cond.notify_all()
+
+    def stats(self):
+        """返回调度统计，用于/metrics"""
+        with self._cond:
+            return {
+                'budget_bytes': self.budget_bytes,
+                'used_bytes': self._used_bytes,
+                'peak_used_bytes': self._peak_used_bytes,
+                'running': self._running,
+                'waiting': len(self._waiters),
+                'admitted': self._admitted,
+                'queued': self._queued,
+                'rejected': self._rejected,
+                'timed_out': self._timed_out,
+            }
@@ -0,0 +1,67 @@
+# 后台分析任务
+# GUI在Tk主线程之外的工作线程中执行耗时的分析，避免窗口失去响应；
+# 分析函数通过progress回调报告进度，主线程用root.after定时轮询任务状态，
+# 取消采用协作方式：任务被取消后，分析函数下一次报告进度时抛出AnalysisCancelled
+import threading
+
+
+class AnalysisCancelled(Exception):
+    """分析任务已被取消"""
+
+
+class AnalysisJob:
+    """在工作线程中执行fn(*args, progress=..., **kwargs)的分析任务
+
+    状态只在工作线程中写入、在主线程中读取，主线程通过poll()获取最新进度和结果。
+    """
+
+    def __init__(self, fn, *args, **kwargs):
+        self._fn = fn
+        self._args = args
+        self._kwargs = kwargs
+        self._lock = threading.Lock()
+        self._cancelled = threading.Event()
+        self._done = threading.Event()
+        self._fraction = 0.0
+        self._message = ''
+        self.result = None
+        self.error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        """启动工作线程"""
+        self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            self.result = self._fn(*self._args, progress=self.report, **self._kwargs)
+        except BaseException as e:
+            self.error = e
+        finally:
+            self._done.set()
+
+    def report(self, fraction, message=''):
+        """分析函数调用的进度回调，任务被取消时抛出AnalysisCancelled"""
+        if self._cancelled.is_set():
+            raise AnalysisCancelled()
+        with self._lock:
+            self._fraction = min(max(float(fraction), 0.0), 1.0)
+            self._message = message
+
+    def cancel(self):
+        """请求取消任务，任务会在下一次报告进度时结束"""
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def poll(self):
+        """返回 (是否结束, 进度0~1, 进度说明)"""
+        with self._lock:
+            return self._done.is_set(), self._fraction, self._message
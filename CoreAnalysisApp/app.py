@@ -11,7 +11,15 @@ import io
 import base64
 import sys
 import time
+import hashlib
+import math
 import importlib.metadata  # 用于获取Flask版本
+from request_coalescing import SingleFlight, make_request_key
+from admission_control import MemoryBudgetScheduler, AdmissionRejected, estimate_peak_bytes
+from distribution_stats import summarize
+from buffer_pool import BufferPool, give
+from vector_overlay import build_overlay
+from spatial_index import ObjectIndex, ObjectIndexCache, make_result_id
 
 # 尝试导入裂缝分析模块
 print("正在导入裂缝分析模块...")
@@ -24,7 +32,7 @@ except ImportError as e:
     # 如果导入失败，打印错误信息
     print(f"裂缝分析模块导入失败: {e}")
     # 定义一个模拟函数用于测试
-    def process_crack(image, min_area, max_area, threshold):
+    def process_crack(image, min_area, max_area, threshold, pool=None, render=True):
         print("使用模拟裂缝分析函数")
         # 返回模拟的分析结果
         return {
@@ -53,12 +61,16 @@ except ImportError as e:
     # 如果导入失败，打印错误信息
     print(f"粒度分析模块导入失败: {e}")
     # 定义一个模拟函数用于测试
-    def analyze_grains(image):
+    def analyze_grains(image, pool=None, render=True, pixel_size=1.0, separate=False):
         print("使用模拟粒度分析函数")
         # 返回模拟的分析结果
         return {
             '粒子数量': 0,
             '平均面积': 0,
+            '平均等效直径': 0,
+            '平均长宽比': 0,
+            '粒度统计': {'颗粒数': 0},
+            '粘连颗粒团数': 0,
             '面积列表': []
         }, image, image, image
 
@@ -72,7 +84,7 @@ except ImportError as e:
     # 如果导入失败，打印错误信息
     print(f"孔洞分析模块导入失败: {e}")
     # 定义一个模拟函数用于测试
-    def process_stone_holes(image, min_area, max_area, threshold):
+    def process_stone_holes(image, min_area, max_area, threshold, pool=None, render=True, cluster_radius=None):
         print("使用模拟孔洞分析函数")
         # 返回模拟的分析结果
         return {
@@ -80,9 +92,39 @@ except ImportError as e:
             '总面积': 0,
             '平均面积': 0,
             '平均圆形度': 0,
+            '平均等效直径': 0,
+            '空间分布': {'点数': 0},
             '面积列表': []
         }, image, image, image
 
+# 尝试导入综合分析模块
+print("正在导入综合分析模块...")
+try:
+    # 从combined_analysis模块导入analyze_all函数
+    from combined_analysis import analyze_all
+    print("综合分析模块导入成功")
+except ImportError as e:
+    # 如果导入失败，打印错误信息
+    print(f"综合分析模块导入失败: {e}")
+    # 定义一个模拟函数用于测试，依次调用各分析函数
+    def analyze_all(image, hole_params=None, crack_params=None, grain_params=None, max_workers=3, pool=None):
+        print("使用模拟综合分析函数")
+        hole_params = hole_params or {}
+        crack_params = crack_params or {}
+        hole_result, gray, hole_binary, hole_marked = process_stone_holes(
+            image, hole_params.get('min_area', 1), hole_params.get('max_area', 1000),
+            hole_params.get('threshold_val', 100))
+        crack_result = process_crack(
+            image, crack_params.get('min_area', 1000), crack_params.get('max_area', float('inf')),
+            crack_params.get('threshold_val', 100))
+        grain_result, _, grain_binary, grain_marked = analyze_grains(image, **(grain_params or {}))
+        return {
+            '灰度图': gray,
+            '孔洞': {'结果': hole_result, '二值图': hole_binary, '标记图': hole_marked},
+            '裂缝': crack_result,
+            '粒度': {'结果': grain_result, '二值图': grain_binary, '标记图': grain_marked}
+        }
+
 # 配置Flask应用
 app = Flask(__name__)
 # 设置上传文件的保存目录
@@ -93,6 +135,39 @@ app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
 # 确保上传目录存在，如果不存在则创建
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
+# 分析计算的内存预算（MB，每个工作进程），超出预算的请求排队或被拒绝
+app.config['MEMORY_BUDGET_MB'] = int(os.environ.get('CORE_ANALYSIS_MEMORY_BUDGET_MB', 2048))
+# 等待内存预算的最大排队请求数
+app.config['ADMISSION_QUEUE_SIZE'] = int(os.environ.get('CORE_ANALYSIS_ADMISSION_QUEUE_SIZE', 8))
+# 请求排队等待的最长时间（秒）
+app.config['ADMISSION_TIMEOUT'] = float(os.environ.get('CORE_ANALYSIS_ADMISSION_TIMEOUT', 60))
+# 中间数组缓冲池的容量（MB，每个工作进程），0表示不启用，每次分析重新分配数组
+app.config['BUFFER_POOL_MB'] = int(os.environ.get('CORE_ANALYSIS_BUFFER_POOL_MB', 0))
+# 缓存的检测对象空间索引数（每个工作进程），供/objects接口按分析结果编号查询
+app.config['OBJECT_INDEX_CACHE_SIZE'] = int(os.environ.get('CORE_ANALYSIS_OBJECT_INDEX_CACHE_SIZE', 8))
+# 各工作进程共享的检测对象文件目录：分析时写入特征表，其他工作进程缓存未命中时由此重建索引；设为空字符串时不共享
+app.config['OBJECT_INDEX_DIR'] = os.environ.get('CORE_ANALYSIS_OBJECT_INDEX_DIR', 'object_indexes')
+# 共享目录中保留的分析结果数，超出时删除最旧的
+app.config['OBJECT_INDEX_FILES'] = int(os.environ.get('CORE_ANALYSIS_OBJECT_INDEX_FILES', 64))
+# 图像每像素的长度（毫米），用于粒度统计的φ值和D10/D50/D90；未标定时为1，即以像素为单位
+app.config['PIXEL_SIZE_MM'] = float(os.environ.get('CORE_ANALYSIS_PIXEL_SIZE_MM', 1.0))
+# 粒度分析是否用分水岭分离相互接触的颗粒（1启用，默认0）
+app.config['GRAIN_SEPARATION'] = os.environ.get('CORE_ANALYSIS_GRAIN_SEPARATION', '0') == '1'
+
+# 合并并发的相同分析请求：相同图像、分析类型和参数只计算一次
+analysis_flight = SingleFlight()
+# 按内存预算接纳分析计算
+admission = MemoryBudgetScheduler(
+    app.config['MEMORY_BUDGET_MB'] * 1024 * 1024,
+    max_queue=app.config['ADMISSION_QUEUE_SIZE'],
+    queue_timeout=app.config['ADMISSION_TIMEOUT']
+)
+# 复用各分析的中间数组和输出图像，图像编码完成后归还
+buffer_pool = BufferPool(app.config['BUFFER_POOL_MB'] * 1024 * 1024) if app.config['BUFFER_POOL_MB'] > 0 else None
+# 最近分析结果的检测对象空间索引，经共享目录在各工作进程之间共用
+object_indexes = ObjectIndexCache(app.config['OBJECT_INDEX_CACHE_SIZE'], app.config['OBJECT_INDEX_DIR'] or None,
+                                  app.config['OBJECT_INDEX_FILES'])
+
 # 设置matplotlib支持中文
 # 使用黑体字体来显示中文
 plt.rcParams['font.sans-serif'] = ['SimHei']
@@ -126,10 +201,12 @@ def create_histogram(data, title, x_label, y_label):
         if not data or len(data) == 0:
             print("警告: 直方图数据为空")
             return None
+        # 计算20个分箱的计数
+        stats = summarize(data, bins=20, positive_only=False)
         # 创建一个图形和坐标轴对象
         fig, ax = plt.subplots(figsize=(10, 6))
-        # 绘制直方图
-        ax.hist(data, bins=20, alpha=0.7, color='skyblue')
+        # 按预先计算的分箱绘制直方图
+        ax.hist(stats['edges'][:-1], bins=stats['edges'], weights=stats['counts'], alpha=0.7, color='skyblue')
         # 设置图形的标题
         ax.set_title(title)
         # 设置x轴的标签
@@ -183,6 +260,32 @@ def convert_to_serializable(data):
         print(f"序列化数据失败: {e}")
         return None
 
+# 定义一个函数，读取上传目录中的图像文件及其内容摘要
+def load_upload(filename):
+    """读取上传的图像文件，返回(文件字节, SHA-256摘要)，文件不存在时返回(None, None)"""
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    try:
+        with open(filepath, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None, None
+    return data, hashlib.sha256(data).hexdigest()
+
+# 定义一个函数，将文件字节解码为OpenCV图像
+def decode_image(data):
+    """解码图像字节，失败时返回None"""
+    if data is None:
+        return None
+    return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+
+# 定义一个函数，生成请求被准入控制拒绝时的响应
+def overloaded_response(error):
+    """返回503响应，并通过Retry-After告知客户端重试等待时间"""
+    response = jsonify({'error': f'{error}，请{error.retry_after}秒后重试'})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
 # 定义根路由，返回主页面
 @app.route('/')
 def index():
@@ -230,6 +333,122 @@ def upload_file():
         print(f"[文件上传] 错误: {e}")
         return jsonify({'error': f'文件上传失败: {str(e)}'}), 500
 
+# 定义一个函数，解析请求中的叠加层格式
+def parse_overlay_format(value):
+    """返回矢量叠加层格式，None表示返回服务器绘制的标记图PNG，格式无效时抛出ValueError"""
+    if value in (None, '', 'raster'):
+        return None
+    # vector为delta格式的别名
+    if value in ('vector', 'delta'):
+        return 'delta'
+    if value == 'geojson':
+        return 'geojson'
+    raise ValueError(f'不支持的叠加层格式: {value}，可选 raster、vector、geojson')
+
+# 矢量叠加层模式下可按需以PNG返回的图像
+OPTIONAL_IMAGES = ('original', 'gray', 'binary')
+
+# 定义一个函数，解析请求中需要返回的图像
+def parse_image_selection(value, overlay_format):
+    """返回需要以PNG返回的图像名元组，参数无效时抛出ValueError
+
+    栅格模式（overlay_format为None）返回全部图像；矢量叠加层模式默认不返回任何栅格图像，
+    可通过images参数（列表或逗号分隔的字符串）选择 original、gray、binary，响应大小因此不随图像尺寸增长。
+    """
+    if overlay_format is None:
+        return OPTIONAL_IMAGES
+    if value in (None, ''):
+        return ()
+    names = value.split(',') if isinstance(value, str) else value
+    if not isinstance(names, list) or not all(name in OPTIONAL_IMAGES for name in names):
+        raise ValueError(f'不支持的images参数: {value}，可选 original、gray、binary')
+    return tuple(name for name in OPTIONAL_IMAGES if name in names)
+
+# 定义一个函数，将选中的图像编码为PNG
+def encode_images(image_names, original, gray, binary):
+    """返回 {图像名: Base64编码的PNG}，只编码image_names中的图像"""
+    sources = {'original': original, 'gray': gray, 'binary': binary}
+    return {name: image_to_base64(sources[name]) for name in image_names}
+
+# 定义一个函数，转换并校验裂缝分析参数
+def parse_crack_params(min_area, max_area, threshold_val):
+    """返回(最小面积, 最大面积, 阈值)，参数无效时抛出带提示信息的ValueError"""
+    try:
+        # 将最小面积和阈值转换为整数
+        min_area = int(min_area)
+        threshold_val = int(threshold_val)
+        # 处理最大面积参数
+        if max_area is None or (isinstance(max_area, str) and max_area.lower() in ['inf', 'infinity', '']):
+            max_area = float('inf')
+        else:
+            max_area = int(max_area)
+        # 确保最小面积不大于最大面积（除非最大面积是无穷大）
+        if min_area > max_area and max_area != float('inf'):
+            raise ValueError("最小面积不能大于最大面积")
+    except (TypeError, ValueError) as e:
+        raise ValueError(f'参数错误: {str(e)}，请确保输入有效数字或inf')
+    # 参数范围校验
+    if min_area < 1:
+        raise ValueError('最小面积必须≥1')
+    if threshold_val < 0 or threshold_val > 255:
+        raise ValueError('阈值必须在0-255之间')
+    return min_area, max_area, threshold_val
+
+# 定义一个函数，转换并校验孔洞分析参数
+def parse_hole_params(min_area, max_area, threshold_val):
+    """返回(最小面积, 最大面积, 阈值)，参数无效时抛出带提示信息的ValueError"""
+    # 孔洞与裂缝的面积和阈值参数规则相同
+    return parse_crack_params(min_area, max_area, threshold_val)
+
+# 定义裂缝分析结果的构建函数，相同请求合并后只执行一次
+def build_crack_payload(image, min_area, max_area, threshold_val, overlay_format=None, result_id=None,
+                        image_names=OPTIONAL_IMAGES):
+    """执行裂缝分析并生成响应数据，分析返回空结果时返回None
+
+    overlay_format不为None时不绘制结果图，改为返回矢量叠加层，只返回image_names中的栅格图像；
+    result_id不为None时缓存检测对象的空间索引，之后可通过/objects接口按该编号查询。
+    """
+    # 打印图像的尺寸信息
+    print(f"[裂缝分析] 图像尺寸: {image.shape}")
+    # 执行裂缝分析
+    print("[裂缝分析] 开始执行裂缝分析...")
+    result = process_crack(image, min_area, max_area, threshold_val, pool=buffer_pool,
+                           render=overlay_format is None)
+    # 检查分析结果是否为空
+    if result is None:
+        return None
+    # 生成结果图像
+    print("[裂缝分析] 生成结果图像...")
+    images = encode_images(image_names, image, result.get('原图', image), result.get('二值图', image))
+    if overlay_format is None:
+        images['result'] = image_to_base64(result.get('结果图', image))
+    # 图像已编码，归还缓冲池
+    give(buffer_pool, result.pop('原图', None), result.pop('二值图', None), result.pop('结果图', None))
+    # 生成直方图
+    print("[裂缝分析] 生成直方图...")
+    width_data = result.get('裂缝宽度列表', [])
+    histogram = create_histogram(
+        width_data,
+        '裂缝宽度分布',
+        '裂缝宽度(像素)',
+        '数量'
+    )
+    # 将分析结果转换为可序列化格式，响应中只包含裂缝特征
+    print("[裂缝分析] 序列化结果数据...")
+    serializable_result = convert_to_serializable(result.get('特征', {}))
+    payload = {
+        'success': True,
+        'result': serializable_result,
+        'images': images,
+        'histogram': histogram
+    }
+    if overlay_format is not None:
+        payload['overlay'] = build_overlay('crack', result, image.shape, overlay_format)
+    if result_id is not None:
+        object_indexes.put(result_id, ObjectIndex.from_result('crack', result, image.shape), 'crack')
+        payload['result_id'] = result_id
+    return payload
+
 # 定义裂缝分析路由，处理裂缝分析请求
 @app.route('/analyze/cracks', methods=['POST'])
 def analyze_cracks_route():
@@ -250,6 +469,7 @@ def analyze_cracks_route():
         min_area = data.get('min_area', 1000)
         max_area = data.get('max_area', 'inf')
         threshold_val = data.get('threshold', 100)
+        overlay_format = data.get('overlay')
         # 打印参数信息
         print(
             f"[裂缝分析] 参数 - filename: {filename}, min_area: {min_area}, max_area: {max_area}, threshold: {threshold_val}")
@@ -259,77 +479,54 @@ def analyze_cracks_route():
             return jsonify({'error': '缺少文件名参数'}), 400
         # 构建图像文件的路径
         filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        # 读取图像
+        # 读取图像文件
         print(f"[裂缝分析] 读取图像: {filepath}")
-        image = cv2.imread(filepath)
-        # 检查图像是否读取成功
-        if image is None:
+        file_data, digest = load_upload(filename)
+        # 检查图像文件是否读取成功
+        if file_data is None:
             print(f"[裂缝分析] 错误: 无法读取图像: {filepath}")
             return jsonify({'error': f'无法读取图像: {filepath}'}), 400
-        # 打印图像的尺寸信息
-        print(f"[裂缝分析] 图像尺寸: {image.shape}")
         # 参数类型转换与校验
         try:
-            # 将最小面积和阈值转换为整数
-            min_area = int(min_area)
-            threshold_val = int(threshold_val)
-            # 处理最大面积参数
-            if max_area is None or (isinstance(max_area, str) and max_area.lower() in ['inf', 'infinity', '']):
-                max_area = float('inf')
-            else:
-                max_area = int(max_area)
-            # 确保最小面积不大于最大面积（除非最大面积是无穷大）
-            if min_area > max_area and max_area != float('inf'):
-                raise ValueError("最小面积不能大于最大面积")
+            min_area, max_area, threshold_val = parse_crack_params(min_area, max_area, threshold_val)
+            overlay_format = parse_overlay_format(overlay_format)
+            image_names = parse_image_selection(data.get('images'), overlay_format)
         except ValueError as e:
-            # 如果参数类型错误，打印错误信息并返回错误响应
-            print(f"[裂缝分析] 参数类型错误: {e}")
-            return jsonify({'error': f'参数错误: {str(e)}，请确保输入有效数字或inf'}), 400
-        # 参数范围校验
-        if min_area < 1:
-            print("[裂缝分析] 错误: 最小面积必须≥1")
-            return jsonify({'error': '最小面积必须≥1'}), 400
-        if threshold_val < 0 or threshold_val > 255:
-            print("[裂缝分析] 错误: 阈值必须在0-255之间")
-            return jsonify({'error': '阈值必须在0-255之间'}), 400
-        # 执行裂缝分析
-        print("[裂缝分析] 开始执行裂缝分析...")
-        result = process_crack(image, min_area, max_area, threshold_val)
-        # 检查分析结果是否为空
-        if result is None:
-            print("[裂缝分析] 错误: 分析返回空结果")
-            return jsonify({'error': '裂缝分析返回空结果，请检查图像质量或参数设置'}), 500
-        # 生成结果图像
-        print("[裂缝分析] 生成结果图像...")
-        images = {
-            'original': image_to_base64(image),
-            'gray': image_to_base64(result.get('原图', image)),
-            'binary': image_to_base64(result.get('二值图', image)),
-            'result': image_to_base64(result.get('结果图', image))
-        }
-        # 生成直方图
-        print("[裂缝分析] 生成直方图...")
-        width_data = result.get('裂缝宽度列表', [])
-        histogram = create_histogram(
-            width_data,
-            '裂缝宽度分布',
-            '裂缝宽度(像素)',
-            '数量'
-        )
-        # 将分析结果转换为可序列化格式
-        print("[裂缝分析] 序列化结果数据...")
-        serializable_result = convert_to_serializable(result)
+            # 如果参数错误，打印错误信息并返回错误响应
+            print(f"[裂缝分析] 参数错误: {e}")
+            return jsonify({'error': str(e)}), 400
+
+        def compute():
+            # 解码图像，只有实际执行计算的请求才需要解码
+            image = decode_image(file_data)
+            if image is None:
+                return {'error': f'无法读取图像: {filepath}'}, 400
+            # 在内存预算内执行分析
+            with admission.admit(estimate_peak_bytes(image.shape, 'crack')):
+                payload = build_crack_payload(image, min_area, max_area, threshold_val, overlay_format,
+                                              make_result_id(key), image_names)
+            if payload is None:
+                return {'error': '裂缝分析返回空结果，请检查图像质量或参数设置'}, 500
+            return payload, 200
+
+        # 合并相同的并发请求
+        key = make_request_key(digest, 'crack', {
+            'min_area': min_area, 'max_area': max_area, 'threshold': threshold_val, 'overlay': overlay_format,
+            'images': image_names})
+        payload, status = analysis_flight.do(key, compute)
+        if status != 200:
+            print(f"[裂缝分析] 错误: {payload['error']}")
+            return jsonify(payload), status
         # 计算分析耗时
         elapsed_time = time.time() - start_time
         print(f"[裂缝分析] 分析完成，耗时: {elapsed_time:.2f}秒")
         print("=" * 50 + "\n")
         # 返回分析结果
-        return jsonify({
-            'success': True,
-            'result': serializable_result.get('特征', {}),
-            'images': images,
-            'histogram': histogram
-        })
+        return jsonify(payload)
+    except AdmissionRejected as e:
+        # 内存预算不足，拒绝请求
+        print(f"[裂缝分析] 拒绝请求: {e}")
+        return overloaded_response(e)
     except Exception as e:
         # 如果出现未捕获的异常，打印详细异常信息并返回错误响应
         import traceback
@@ -337,6 +534,51 @@ def analyze_cracks_route():
         traceback.print_exc()
         return jsonify({'error': f'服务器内部错误: {str(e)}'}), 500
 
+# 定义粒度分析结果的构建函数，相同请求合并后只执行一次
+def build_grain_payload(image, overlay_format=None, result_id=None, image_names=OPTIONAL_IMAGES):
+    """执行粒度分析并生成响应数据，overlay_format不为None时返回矢量叠加层而不是标记图，只返回image_names中的栅格图像
+
+    result_id不为None时缓存检测对象的空间索引，之后可通过/objects接口按该编号查询。
+    """
+    # 执行粒度分析
+    print("[粒度分析] 开始执行粒度分析...")
+    result, gray, binary, marked = analyze_grains(image, pool=buffer_pool, render=overlay_format is None,
+                                                  pixel_size=app.config['PIXEL_SIZE_MM'],
+                                                  separate=app.config['GRAIN_SEPARATION'])
+    # 生成结果图像
+    print("[粒度分析] 生成结果图像...")
+    images = encode_images(image_names, image, gray, binary)
+    if overlay_format is None:
+        images['marked'] = image_to_base64(marked)
+    # 图像已编码，归还缓冲池
+    give(buffer_pool, gray, binary, marked)
+    overlay = build_overlay('grain', result, image.shape, overlay_format) if overlay_format else None
+    if result_id is not None:
+        object_indexes.put(result_id, ObjectIndex.from_result('grain', result, image.shape), 'grain')
+    # 轮廓数组和特征表不直接返回给前端（需要时以矢量叠加层返回）
+    result.pop('轮廓列表', None)
+    result.pop('对象表', None)
+    # 生成直方图
+    print("[粒度分析] 生成直方图...")
+    area_data = result.get('面积列表', [])
+    histogram = create_histogram(
+        area_data,
+        '粒度分布',
+        '粒度面积(像素²)',
+        '数量'
+    )
+    payload = {
+        'success': True,
+        'result': result,
+        'images': images,
+        'histogram': histogram
+    }
+    if overlay is not None:
+        payload['overlay'] = overlay
+    if result_id is not None:
+        payload['result_id'] = result_id
+    return payload
+
 # 定义粒度分析路由，处理粒度分析请求
 @app.route('/analyze/grains', methods=['POST'])
 def analyze_grains_route():
@@ -352,44 +594,43 @@ def analyze_grains_route():
         if not filename:
             print("[粒度分析] 错误: 缺少文件名")
             return jsonify({'error': '缺少文件名参数'}), 400
+        # 叠加层格式校验
+        try:
+            overlay_format = parse_overlay_format(data.get('overlay'))
+            image_names = parse_image_selection(data.get('images'), overlay_format)
+        except ValueError as e:
+            print(f"[粒度分析] 参数错误: {e}")
+            return jsonify({'error': str(e)}), 400
         # 构建图像文件的路径
         filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        # 读取图像
+        # 读取图像文件
         print(f"[粒度分析] 读取图像: {filepath}")
-        image = cv2.imread(filepath)
+        file_data, digest = load_upload(filename)
+
+        def compute():
+            # 解码图像，只有实际执行计算的请求才需要解码
+            image = decode_image(file_data)
+            if image is None:
+                return None
+            # 在内存预算内执行分析
+            with admission.admit(estimate_peak_bytes(image.shape, 'grain')):
+                return build_grain_payload(image, overlay_format, make_result_id(key), image_names)
+
+        # 合并相同的并发请求
+        key = make_request_key(digest, 'grain', {'overlay': overlay_format, 'images': image_names})
+        payload = analysis_flight.do(key, compute)
         # 检查图像是否读取成功
-        if image is None:
+        if payload is None:
             print(f"[粒度分析] 错误: 无法读取图像: {filepath}")
             return jsonify({'error': '无法读取图像'}), 400
-        # 执行粒度分析
-        print("[粒度分析] 开始执行粒度分析...")
-        result, gray, binary, marked = analyze_grains(image)
-        # 生成结果图像
-        print("[粒度分析] 生成结果图像...")
-        images = {
-            'original': image_to_base64(image),
-            'gray': image_to_base64(gray),
-            'binary': image_to_base64(binary),
-            'marked': image_to_base64(marked)
-        }
-        # 生成直方图
-        print("[粒度分析] 生成直方图...")
-        area_data = result.get('面积列表', [])
-        histogram = create_histogram(
-            area_data,
-            '粒度分布',
-            '粒度面积(像素²)',
-            '数量'
-        )
         print("[粒度分析] 分析完成")
         print("=" * 50 + "\n")
         # 返回分析结果
-        return jsonify({
-            'success': True,
-            'result': result,
-            'images': images,
-            'histogram': histogram
-        })
+        return jsonify(payload)
+    except AdmissionRejected as e:
+        # 内存预算不足，拒绝请求
+        print(f"[粒度分析] 拒绝请求: {e}")
+        return overloaded_response(e)
     except Exception as e:
         # 如果出现错误，打印错误信息并返回错误响应
         print(f"[粒度分析] 错误: {e}")
@@ -397,6 +638,52 @@ def analyze_grains_route():
         traceback.print_exc()
         return jsonify({'error': f'粒度分析失败: {str(e)}'}), 500
 
+# 定义孔洞分析结果的构建函数，相同请求合并后只执行一次
+def build_hole_payload(image, min_area, max_area, threshold_val, overlay_format=None, result_id=None,
+                       image_names=OPTIONAL_IMAGES):
+    """执行孔洞分析并生成响应数据，overlay_format不为None时返回矢量叠加层而不是标记图，只返回image_names中的栅格图像
+
+    result_id不为None时缓存检测对象的空间索引，之后可通过/objects接口按该编号查询。
+    """
+    # 执行孔洞分析
+    print("[孔洞分析] 开始执行孔洞分析...")
+    result, gray, binary, marked = process_stone_holes(image, min_area, max_area, threshold_val, pool=buffer_pool,
+                                                       render=overlay_format is None)
+    # 生成结果图像
+    print("[孔洞分析] 生成结果图像...")
+    images = encode_images(image_names, image, gray, binary)
+    if overlay_format is None:
+        images['marked'] = image_to_base64(marked)
+    # 图像已编码，归还缓冲池
+    give(buffer_pool, gray, binary, marked)
+    overlay = build_overlay('hole', result, image.shape, overlay_format) if overlay_format else None
+    if result_id is not None:
+        object_indexes.put(result_id, ObjectIndex.from_result('hole', result, image.shape), 'hole')
+    # 轮廓数组和特征表不直接返回给前端（需要时以矢量叠加层返回）
+    result.pop('轮廓列表', None)
+    result.pop('对象表', None)
+    result.pop('点分布', None)
+    # 生成直方图
+    print("[孔洞分析] 生成直方图...")
+    area_data = result.get('面积列表', [])
+    histogram = create_histogram(
+        area_data,
+        '孔洞面积分布',
+        '孔洞面积(像素²)',
+        '数量'
+    )
+    payload = {
+        'success': True,
+        'result': result,
+        'images': images,
+        'histogram': histogram
+    }
+    if overlay is not None:
+        payload['overlay'] = overlay
+    if result_id is not None:
+        payload['result_id'] = result_id
+    return payload
+
 # 定义孔洞分析路由，处理孔洞分析请求
 @app.route('/analyze/holes', methods=['POST'])
 def analyze_holes_route():
@@ -415,44 +702,47 @@ def analyze_holes_route():
         if not filename:
             print("[孔洞分析] 错误: 缺少文件名")
             return jsonify({'error': '缺少文件名参数'}), 400
+        # 参数类型转换与校验
+        try:
+            min_area, max_area, threshold_val = parse_hole_params(min_area, max_area, threshold_val)
+            overlay_format = parse_overlay_format(data.get('overlay'))
+            image_names = parse_image_selection(data.get('images'), overlay_format)
+        except ValueError as e:
+            print(f"[孔洞分析] 参数错误: {e}")
+            return jsonify({'error': str(e)}), 400
         # 构建图像文件的路径
         filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        # 读取图像
+        # 读取图像文件
         print(f"[孔洞分析] 读取图像: {filepath}")
-        image = cv2.imread(filepath)
+        file_data, digest = load_upload(filename)
+
+        def compute():
+            # 解码图像，只有实际执行计算的请求才需要解码
+            image = decode_image(file_data)
+            if image is None:
+                return None
+            # 在内存预算内执行分析
+            with admission.admit(estimate_peak_bytes(image.shape, 'hole')):
+                return build_hole_payload(image, min_area, max_area, threshold_val, overlay_format,
+                                          make_result_id(key), image_names)
+
+        # 合并相同的并发请求
+        key = make_request_key(digest, 'hole', {
+            'min_area': min_area, 'max_area': max_area, 'threshold': threshold_val, 'overlay': overlay_format,
+            'images': image_names})
+        payload = analysis_flight.do(key, compute)
         # 检查图像是否读取成功
-        if image is None:
+        if payload is None:
             print(f"[孔洞分析] 错误: 无法读取图像: {filepath}")
             return jsonify({'error': '无法读取图像'}), 400
-        # 执行孔洞分析
-        print("[孔洞分析] 开始执行孔洞分析...")
-        result, gray, binary, marked = process_stone_holes(image, min_area, max_area, threshold_val)
-        # 生成结果图像
-        print("[孔洞分析] 生成结果图像...")
-        images = {
-            'original': image_to_base64(image),
-            'gray': image_to_base64(gray),
-            'binary': image_to_base64(binary),
-            'marked': image_to_base64(marked)
-        }
-        # 生成直方图
-        print("[孔洞分析] 生成直方图...")
-        area_data = result.get('面积列表', [])
-        histogram = create_histogram(
-            area_data,
-            '孔洞面积分布',
-            '孔洞面积(像素²)',
-            '数量'
-        )
         print("[孔洞分析] 分析完成")
         print("=" * 50 + "\n")
         # 返回分析结果
-        return jsonify({
-            'success': True,
-            'result': result,
-            'images': images,
-            'histogram': histogram
-        })
+        return jsonify(payload)
+    except AdmissionRejected as e:
+        # 内存预算不足，拒绝请求
+        print(f"[孔洞分析] 拒绝请求: {e}")
+        return overloaded_response(e)
     except Exception as e:
         # 如果出现错误，打印错误信息并返回错误响应
         print(f"[孔洞分析] 错误: {e}")
@@ -460,8 +750,254 @@ def analyze_holes_route():
         traceback.print_exc()
         return jsonify({'error': f'孔洞分析失败: {str(e)}'}), 500
 
-# 主程序入口
-if __name__ == '__main__':
+# 定义综合分析结果的构建函数，相同请求合并后只执行一次
+def build_all_payload(image, hole_params, crack_params, result_ids=None):
+    """一次解码、共享灰度图，并发执行三种分析并生成合并的响应数据
+
+    result_ids为可选的 {分析类型: 结果编号}，缓存各分析检测对象的空间索引，之后可通过/objects接口按编号查询。
+    """
+    # 并发执行孔洞、裂缝和粒度分析
+    print("[综合分析] 开始执行孔洞、裂缝和粒度分析...")
+    combined = analyze_all(image, hole_params=hole_params, crack_params=crack_params,
+                           grain_params={'pixel_size': app.config['PIXEL_SIZE_MM'],
+                                         'separate': app.config['GRAIN_SEPARATION']}, pool=buffer_pool)
+    hole = combined['孔洞']
+    crack = combined['裂缝']
+    grain = combined['粒度']
+    # 生成结果图像，原图和灰度图只编码一次
+    print("[综合分析] 生成结果图像...")
+    images = {
+        'original': image_to_base64(image),
+        'gray': image_to_base64(combined['灰度图']),
+        'hole_binary': image_to_base64(hole['二值图']),
+        'hole_marked': image_to_base64(hole['标记图']),
+        'crack_binary': image_to_base64(crack.get('二值图', image)),
+        'crack_result': image_to_base64(crack.get('结果图', image)),
+        'grain_binary': image_to_base64(grain['二值图']),
+        'grain_marked': image_to_base64(grain['标记图'])
+    }
+    # 图像已编码，归还缓冲池（裂缝结果中的原图即共用的灰度图）
+    give(buffer_pool, combined['灰度图'], hole['二值图'], hole['标记图'], crack.pop('二值图', None),
+         crack.pop('结果图', None), grain['二值图'], grain['标记图'])
+    indexed = {}
+    if result_ids is not None:
+        for analysis_type, result in (('hole', hole['结果']), ('crack', crack), ('grain', grain['结果'])):
+            # 分析返回空结果时没有特征表
+            if not isinstance(result, dict) or '对象表' not in result:
+                continue
+            object_indexes.put(result_ids[analysis_type],
+                               ObjectIndex.from_result(analysis_type, result, image.shape), analysis_type)
+            indexed[analysis_type] = result_ids[analysis_type]
+    # 轮廓数组和特征表不直接返回给前端
+    for key in ('轮廓列表', '对象表', '点分布'):
+        hole['结果'].pop(key, None)
+        grain['结果'].pop(key, None)
+    # 生成直方图
+    print("[综合分析] 生成直方图...")
+    histograms = {
+        'hole': create_histogram(hole['结果'].get('面积列表', []), '孔洞面积分布', '孔洞面积(像素²)', '数量'),
+        'crack': create_histogram(crack.get('裂缝宽度列表', []), '裂缝宽度分布', '裂缝宽度(像素)', '数量'),
+        'grain': create_histogram(grain['结果'].get('面积列表', []), '粒度分布', '粒度面积(像素²)', '数量')
+    }
+    payload = {
+        'success': True,
+        'result': {
+            'hole': hole['结果'],
+            'crack': convert_to_serializable(crack.get('特征', {})),
+            'grain': grain['结果']
+        },
+        'images': images,
+        'histograms': histograms
+    }
+    if result_ids is not None:
+        payload['result_ids'] = indexed
+    return payload
+
+# 定义综合分析路由，对同一幅图像同时执行孔洞、裂缝和粒度分析
+@app.route('/analyze/all', methods=['POST'])
+def analyze_all_route():
+    """处理综合分析请求"""
+    try:
+        start_time = time.time()
+        print("\n" + "=" * 50)
+        print("[综合分析] 接收到分析请求")
+        # 获取请求数据
+        data = request.get_json()
+        if not data:
+            print("[综合分析] 错误: 空请求数据")
+            return jsonify({'error': '请求数据为空'}), 400
+        # 提取请求数据中的参数，孔洞和裂缝参数分别放在hole和crack对象中
+        filename = data.get('filename')
+        hole_data = data.get('hole') or {}
+        crack_data = data.get('crack') or {}
+        # 检查文件名是否为空
+        if not filename:
+            print("[综合分析] 错误: 缺少文件名")
+            return jsonify({'error': '缺少文件名参数'}), 400
+        # 孔洞参数与孔洞分析路由使用相同的默认值和校验
+        try:
+            hole_min_area, hole_max_area, hole_threshold = parse_hole_params(
+                hole_data.get('min_area', 1), hole_data.get('max_area', 1000), hole_data.get('threshold', 100))
+        except ValueError as e:
+            print(f"[综合分析] 孔洞参数错误: {e}")
+            return jsonify({'error': f'孔洞{str(e)}'}), 400
+        hole_params = {'min_area': hole_min_area, 'max_area': hole_max_area, 'threshold_val': hole_threshold}
+        # 裂缝参数转换与校验
+        try:
+            crack_min_area, crack_max_area, crack_threshold = parse_crack_params(
+                crack_data.get('min_area', 1000), crack_data.get('max_area', 'inf'), crack_data.get('threshold', 100))
+        except ValueError as e:
+            print(f"[综合分析] 裂缝参数错误: {e}")
+            return jsonify({'error': f'裂缝{str(e)}'}), 400
+        crack_params = {'min_area': crack_min_area, 'max_area': crack_max_area, 'threshold_val': crack_threshold}
+        # 构建图像文件的路径
+        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+        # 读取图像文件
+        print(f"[综合分析] 读取图像: {filepath}")
+        file_data, digest = load_upload(filename)
+
+        def compute():
+            # 只解码一次图像，三种分析共用
+            image = decode_image(file_data)
+            if image is None:
+                return None
+            # 三种分析并发执行，按三者峰值内存之和申请预算
+            with admission.admit(estimate_peak_bytes(image.shape, 'all')):
+                return build_all_payload(image, hole_params, crack_params,
+                                         {analysis_type: make_result_id((key, analysis_type))
+                                          for analysis_type in ('hole', 'crack', 'grain')})
+
+        # 合并相同的并发请求
+        key = make_request_key(digest, 'all', {'hole': hole_params, 'crack': crack_params})
+        payload = analysis_flight.do(key, compute)
+        # 检查图像是否读取成功
+        if payload is None:
+            print(f"[综合分析] 错误: 无法读取图像: {filepath}")
+            return jsonify({'error': '无法读取图像'}), 400
+        elapsed_time = time.time() - start_time
+        print(f"[综合分析] 分析完成，耗时: {elapsed_time:.2f}秒")
+        print("=" * 50 + "\n")
+        # 返回分析结果
+        return jsonify(payload)
+    except AdmissionRejected as e:
+        # 内存预算不足，拒绝请求
+        print(f"[综合分析] 拒绝请求: {e}")
+        return overloaded_response(e)
+    except Exception as e:
+        # 如果出现错误，打印错误信息并返回错误响应
+        print(f"[综合分析] 错误: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': f'综合分析失败: {str(e)}'}), 500
+
+# 对象查询一次最多返回的对象数
+MAX_OBJECTS_PER_QUERY = 5000
+
+# 定义一个函数，取得分析结果的空间索引
+def lookup_object_index(result_id):
+    """返回 (分析类型, 索引)，结果编号缺失或已过期时返回错误响应"""
+    if not result_id:
+        return None, (jsonify({'error': '缺少result_id参数'}), 400)
+    entry = object_indexes.get(result_id)
+    if entry is None:
+        return None, (jsonify({'error': '分析结果不存在或已过期，请重新分析'}), 404)
+    return entry, None
+
+# 定义一个函数，解析视野区域参数
+def parse_bbox(value, index):
+    """解析bbox参数 x0,y0,x1,y1，未提供时为整幅图像；格式错误或含nan、inf时抛出ValueError"""
+    if not value:
+        return 0, 0, index.width, index.height
+    x0, y0, x1, y1 = (float(v) for v in value.split(','))
+    if not all(math.isfinite(v) for v in (x0, y0, x1, y1)):
+        raise ValueError(value)
+    return x0, y0, x1, y1
+
+# 定义视野对象查询路由：/objects?result_id=...&bbox=x0,y0,x1,y1
+@app.route('/objects')
+def objects_route():
+    """返回外接矩形与bbox区域相交的对象，未指定bbox时返回全部对象"""
+    entry, error = lookup_object_index(request.args.get('result_id'))
+    if error:
+        return error
+    analysis_type, index = entry
+    try:
+        x0, y0, x1, y1 = parse_bbox(request.args.get('bbox'), index)
+        limit = min(int(request.args.get('limit', MAX_OBJECTS_PER_QUERY)), MAX_OBJECTS_PER_QUERY)
+    except ValueError:
+        return jsonify({'error': 'bbox格式应为 x0,y0,x1,y1，limit应为整数'}), 400
+    ids = index.query_bbox(x0, y0, x1, y1)
+    return jsonify({
+        'result_id': request.args.get('result_id'),
+        'analysis': analysis_type,
+        'count': len(ids),
+        'truncated': len(ids) > limit,
+        'objects': [index.record(i) for i in ids[:max(limit, 0)]]
+    })
+
+# 定义点查询路由：/objects/at?result_id=...&x=...&y=...
+@app.route('/objects/at')
+def object_at_route():
+    """返回图像像素 (x, y) 处的对象，没有对象时object为null"""
+    entry, error = lookup_object_index(request.args.get('result_id'))
+    if error:
+        return error
+    analysis_type, index = entry
+    try:
+        x, y = float(request.args['x']), float(request.args['y'])
+        if not (math.isfinite(x) and math.isfinite(y)):
+            raise ValueError
+    except (KeyError, ValueError):
+        return jsonify({'error': '缺少或无效的x、y参数'}), 400
+    object_id = index.object_at(x, y)
+    return jsonify({
+        'result_id': request.args.get('result_id'),
+        'analysis': analysis_type,
+        'object': index.record(object_id) if object_id is not None else None
+    })
+
+# 定义空间分布查询路由：/objects/spatial?result_id=...&bbox=x0,y0,x1,y1&radius=...
+@app.route('/objects/spatial')
+def object_spatial_route():
+    """返回质心在bbox区域内的对象的最近邻距离、Clark-Evans比和聚集团统计，未指定bbox时为整幅图像"""
+    entry, error = lookup_object_index(request.args.get('result_id'))
+    if error:
+        return error
+    analysis_type, index = entry
+    pattern = index.point_pattern()
+    try:
+        x0, y0, x1, y1 = parse_bbox(request.args.get('bbox'), index)
+        radius = request.args.get('radius')
+        # 半径过大时邻接点对数按对象数的平方增长，超过上限直接拒绝
+        radius = pattern.check_radius(radius) if radius else None
+    except ValueError:
+        return jsonify({'error': 'bbox格式应为 x0,y0,x1,y1，radius应为不超过 %.4g 的正数' % pattern.max_radius}), 400
+    try:
+        statistics = index.spatial_statistics(x0, y0, x1, y1, radius)
+    except ValueError as e:
+        # 对象高度聚集时指定半径内的点对数超过上限
+        return jsonify({'error': str(e)}), 400
+    return jsonify({
+        'result_id': request.args.get('result_id'),
+        'analysis': analysis_type,
+        'statistics': statistics
+    })
+
+# 定义运行指标路由，返回请求合并等统计信息
+@app.route('/metrics')
+def metrics():
+    """返回服务运行指标"""
+    return jsonify({
+        'pid': os.getpid(),
+        'coalescing': analysis_flight.stats(),
+        'admission': admission.stats(),
+        'buffer_pool': buffer_pool.stats() if buffer_pool is not None else None,
+        'object_index': object_indexes.stats()
+    })
+
+# 开发环境入口（单进程调试服务器），生产环境请使用server.py
+def main():
+    """启动开发服务器"""
     print("\n" + "=" * 50)
     print("地质岩心图文分析系统启动中...")
     # 打印Python版本信息
@@ -479,4 +1015,9 @@ if __name__ == '__main__':
         print(f"Flask版本: {flask.__version__}")
     print("=" * 50 + "\n")
     # 启动Flask应用，开启调试模式，监听5000端口
-    app.run(debug=True, port=5000)
\ No newline at end of file
+    app.run(debug=True, port=5000)
+
+
+# 主程序入口
+if __name__ == '__main__':
+    main()
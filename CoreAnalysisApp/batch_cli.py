@@ -0,0 +1,360 @@
+# 命令行批量分析
+# 不依赖Tkinter、Flask和matplotlib，在无界面的服务器上对目录或通配符匹配的岩心图像
+# 批量执行孔洞/裂缝/粒度分析：图像在进程池中按块调度，每张图像的结果一完成就追加写入
+# CSV或JSONL文件；再次运行时跳过输出文件中已成功处理的图像，中断后可以继续
+import argparse
+import csv
+import glob
+import importlib.util
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+
+from server import cpu_count, limit_native_threads
+
+# 支持的图像扩展名（与GUI的打开图像对话框一致）
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff')
+# 支持的分析类型
+ANALYSIS_TYPES = ('hole', 'crack', 'grain')
+# 每种分析写入输出文件的汇总字段（与各分析函数返回结果的键一致）
+# 粒度分析结果中“粒度统计”的标量项，展开为单独的字段（累积曲线只写入--grain-size-out的直方图文件）
+GRAIN_SIZE_FIELDS = ['D10', 'D50', 'D90', '平均粒径φ', '分选系数', '偏度', '峰度', '分选等级']
+SUMMARY_FIELDS = {
+    'hole': ['孔洞数量', '总面积', '平均面积', '平均圆形度', '平均等效直径'],
+    'crack': ['数量', '总面积', '平均面积', '最大裂缝方向', '最大裂缝长度', '最大裂缝最大宽度',
+              '最大裂缝最小宽度', '最大裂缝平均宽度', '平均宽度', '长度宽度比'],
+    'grain': ['粒子数量', '平均面积', '平均等效直径', '平均长宽比', '粘连颗粒团数'] + GRAIN_SIZE_FIELDS,
+}
+# 只测量汇总数值和特征表时附加给分析函数的参数（不计入分析参数）：孔洞不计算汇总中没有的空间分布
+MEASURE_OPTIONS = {'hole': {'spatial': False}}
+# 每条记录的基本字段
+BASE_FIELDS = ['path', 'analysis', 'status', 'elapsed', 'error']
+
+
+def csv_fields():
+    """CSV文件的列：基本字段 + 各分析汇总字段（去重并保持顺序）"""
+    fields = list(BASE_FIELDS)
+    for analysis_type in ANALYSIS_TYPES:
+        fields.extend(name for name in SUMMARY_FIELDS[analysis_type] if name not in fields)
+    return fields
+
+
+def find_images(inputs, recursive=False):
+    """展开输入的文件、目录和通配符，返回去重排序后的图像绝对路径"""
+    paths = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            pattern = os.path.join(item, '**', '*') if recursive else os.path.join(item, '*')
+            candidates = glob.glob(pattern, recursive=recursive)
+        elif os.path.isfile(item):
+            candidates = [item]
+        else:
+            candidates = glob.glob(item, recursive=recursive)
+        paths.update(os.path.abspath(path) for path in candidates
+                     if os.path.isfile(path) and path.lower().endswith(IMAGE_EXTENSIONS))
+    return sorted(paths)
+
+
+def _to_builtin(value):
+    """将numpy标量等转换为可写入JSON/CSV的Python类型"""
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+
+def _truncate_partial_line(path):
+    """上次运行在写入一行的中途被中断时，截掉末尾不完整的一行"""
+    with open(path, 'rb+') as f:
+        data = f.read()
+        if data and not data.endswith(b'\n'):
+            f.truncate(data.rfind(b'\n') + 1)
+
+
+def load_completed(output_path, output_format):
+    """读取已有输出文件中成功处理的 (图像路径, 分析类型)"""
+    if not os.path.exists(output_path) or os.path.getsize(output_path) == 0:
+        return set()
+    _truncate_partial_line(output_path)
+    completed = set()
+    with open(output_path, encoding='utf-8-sig', newline='') as f:
+        if output_format == 'csv':
+            records = csv.DictReader(f)
+        else:
+            records = (json.loads(line) for line in f if line.strip())
+        for record in records:
+            if record.get('status') == 'ok':
+                completed.add((record['path'], record['analysis']))
+    return completed
+
+
+def _read_header(path):
+    """读取已有CSV文件的表头"""
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        return next(csv.reader(f), None) or csv_fields()
+
+
+class ResultWriter:
+    """逐条追加写入分析记录，每条记录写入后立即刷新到磁盘"""
+
+    def __init__(self, output_path, output_format):
+        self.output_format = output_format
+        is_new = not os.path.exists(output_path) or os.path.getsize(output_path) == 0
+        # CSV使用带BOM的UTF-8，便于Excel正确显示中文；追加时不能重复写入BOM
+        encoding = 'utf-8-sig' if output_format == 'csv' and is_new else 'utf-8'
+        self._file = open(output_path, 'a', encoding=encoding, newline='')
+        if output_format == 'csv':
+            # 续写已有的CSV文件时沿用其表头，旧版本写入的文件中没有的字段不写入，各行的列保持对齐
+            fields = csv_fields() if is_new else _read_header(output_path)
+            self._writer = csv.DictWriter(self._file, fieldnames=fields, extrasaction='ignore')
+            if is_new:
+                self._writer.writeheader()
+
+    def write(self, record):
+        if self.output_format == 'csv':
+            row = {key: _to_builtin(value) if hasattr(value, 'item') else value for key, value in record.items()}
+            self._writer.writerow(row)
+        else:
+            self._file.write(json.dumps(record, ensure_ascii=False, default=_to_builtin) + '\n')
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def _init_worker(native_threads):
+    """工作进程初始化：限制每个进程内OpenCV/BLAS的线程数，避免与进程池争用CPU"""
+    limit_native_threads(native_threads)
+
+
+def _summarize(analysis_type, output):
+    """从分析函数的返回值中提取汇总字段"""
+    if analysis_type == 'crack':
+        result = output.get('特征', {}) if isinstance(output, dict) else {}
+        if not result:
+            # 未检测到符合条件的裂缝
+            result = {'数量': 0}
+    else:
+        result = output[0] if isinstance(output[0], dict) else {}
+        if analysis_type == 'grain':
+            # 粒度统计是嵌套的字典，其中的标量项展开到汇总中
+            result = {**result, **{name: value for name, value in result.get('粒度统计', {}).items()
+                                   if name in GRAIN_SIZE_FIELDS}}
+    return {name: result[name] for name in SUMMARY_FIELDS[analysis_type] if name in result}
+
+
+def _save_features(path, analysis_type, table, features):
+    """将对象特征表保存到 特征目录/<图像文件名>_<分析类型>.<格式>"""
+    directory, features_format = features
+    name = f"{os.path.splitext(os.path.basename(path))[0]}_{analysis_type}.{features_format}"
+    table.save(os.path.join(directory, name))
+
+
+def parse_depth_range(path, pattern):
+    """用含两个分组的正则表达式从图像文件名中解析 (顶深, 底深)，不匹配时返回 (None, None)"""
+    match = re.search(pattern, os.path.basename(path)) if pattern else None
+    if match is None:
+        return None, None
+    return float(match.group(1)), float(match.group(2))
+
+
+def analyze_image(task):
+    """在工作进程中分析一张图像，返回该图像各分析类型的记录列表"""
+    path, analysis_types, params, options = task
+    # 在工作进程中导入分析模块，使线程数限制在导入numpy/cv2之前生效
+    import cv2
+    from hole_analysis import process_stone_holes
+    from crack_analysis import process_crack
+    from grain_analysis import analyze_grains
+    from feature_table import table_from_output
+    analyzers = {'hole': process_stone_holes, 'crack': process_crack, 'grain': analyze_grains}
+
+    records = []
+    image = cv2.imread(path)
+    if image is None:
+        return [{'path': path, 'analysis': analysis_type, 'status': 'error', 'elapsed': 0.0,
+                 'error': '无法读取图像文件'} for analysis_type in analysis_types]
+    # 同一张图像的多种分析共用一次灰度转换
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    for analysis_type in analysis_types:
+        start = time.perf_counter()
+        record = {'path': path, 'analysis': analysis_type}
+        try:
+            # 只需要汇总数值，跳过标记图的复制和绘制
+            output = analyzers[analysis_type](image, gray=gray, render=False, **params.get(analysis_type, {}),
+                                              **MEASURE_OPTIONS.get(analysis_type, {}))
+            record.update(status='ok', error='')
+            record.update(_summarize(analysis_type, output))
+            table = table_from_output(analysis_type, output)
+            if table is not None and options['features'] is not None:
+                _save_features(path, analysis_type, table, options['features'])
+            if options['store']:
+                # 特征表交给主进程写入结果库，不写入输出文件
+                record.update({'对象表': table, '图像尺寸': image.shape[:2]})
+            if options['grain_size'] and analysis_type == 'grain' and table is not None:
+                # 只把固定分箱的计数直方图交给主进程合并
+                from grain_size import GrainSizeHistogram, phi_scale
+                pixel_size = params['grain'].get('pixel_size', 1.0)
+                histogram = GrainSizeHistogram.from_phi(phi_scale(table['equivalent_diameter'], pixel_size))
+                record['粒度直方图'] = histogram.to_dict()
+        except Exception as e:
+            record.update(status='error', error=str(e))
+        record['elapsed'] = round(time.perf_counter() - start, 4)
+        records.append(record)
+    return records
+
+
+def parse_args(argv=None):
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='地质岩心图文分析系统 - 命令行批量分析')
+    parser.add_argument('inputs', nargs='+', help='图像文件、目录或通配符（如 "cores/*.jpg"）')
+    parser.add_argument('-o', '--output', required=True, help='结果文件路径，扩展名为.csv或.jsonl')
+    parser.add_argument('-a', '--analysis', action='append', choices=ANALYSIS_TYPES,
+                        help='分析类型，可重复指定（默认全部）')
+    parser.add_argument('-r', '--recursive', action='store_true', help='递归查找子目录中的图像')
+    parser.add_argument('--format', choices=('csv', 'jsonl'), help='输出格式（默认按扩展名判断）')
+    parser.add_argument('--workers', type=int, default=0, help='工作进程数（默认按CPU数量）')
+    parser.add_argument('--native-threads', type=int, default=1, help='每个工作进程的OpenCV/BLAS线程数')
+    parser.add_argument('--chunksize', type=int, default=0, help='每次分派给工作进程的图像数（默认自动）')
+    parser.add_argument('--restart', action='store_true', help='忽略已有结果，重新处理全部图像')
+    parser.add_argument('--features-dir', help='保存每张图像每种分析的对象特征表的目录（同名图像会相互覆盖）')
+    parser.add_argument('--features-format', choices=('npz', 'parquet', 'csv'), default='npz',
+                        help='对象特征表格式（parquet需要安装pyarrow）')
+    parser.add_argument('--store', help='同时写入SQLite结果库（.db），可用result_store.py查询')
+    parser.add_argument('--well', help='写入结果库的井名')
+    parser.add_argument('--grain-size-out',
+                        help='逐图像追加写入颗粒φ直方图的JSONL文件，结束时输出合并后的粒度统计'
+                             '（可用grain_size.py合并多个文件）')
+    parser.add_argument('--depth-pattern',
+                        help=r'从文件名解析深度区间的正则表达式，两个分组分别为顶深和底深，如 "(\d+\.?\d*)-(\d+\.?\d*)m"')
+    add_analysis_arguments(parser)
+    return parser.parse_args(argv)
+
+
+def add_analysis_arguments(parser):
+    """添加各分析类型的参数选项（批量分析和流式分析共用）"""
+    parser.add_argument('--hole-min-area', type=float, default=1, help='孔洞最小面积')
+    parser.add_argument('--hole-max-area', type=float, default=1000, help='孔洞最大面积')
+    parser.add_argument('--hole-threshold', type=int, default=100, help='孔洞阈值')
+    parser.add_argument('--crack-min-area', type=float, default=1000, help='裂缝最小面积')
+    parser.add_argument('--crack-max-area', type=float, default=float('inf'), help='裂缝最大面积')
+    parser.add_argument('--crack-threshold', type=int, default=100, help='裂缝阈值')
+    parser.add_argument('--grain-min-area', type=float, default=5, help='颗粒最小面积')
+    parser.add_argument('--grain-max-area', type=float, default=5000, help='颗粒最大面积')
+    parser.add_argument('--grain-threshold', type=int, default=120, help='颗粒阈值')
+    parser.add_argument('--grain-separate', action='store_true', help='用分水岭分离相互接触的颗粒')
+    parser.add_argument('--pixel-size', type=float, default=1.0,
+                        help='每像素的长度（毫米），用于粒度统计的φ值和D10/D50/D90（默认1，即以像素为单位）')
+
+
+def analysis_params(args):
+    """由命令行参数得到 {分析类型: 分析函数的参数字典}"""
+    return {
+        'hole': {'min_area': args.hole_min_area, 'max_area': args.hole_max_area,
+                 'threshold_val': args.hole_threshold},
+        'crack': {'min_area': args.crack_min_area, 'max_area': args.crack_max_area,
+                  'threshold_val': args.crack_threshold},
+        'grain': {'min_area': args.grain_min_area, 'max_area': args.grain_max_area,
+                  'threshold_val': args.grain_threshold, 'pixel_size': args.pixel_size,
+                  'separate': args.grain_separate},
+    }
+
+
+def main(argv=None):
+    """批量分析入口，存在失败的分析时返回非0退出码"""
+    args = parse_args(argv)
+    analysis_types = tuple(dict.fromkeys(args.analysis or ANALYSIS_TYPES))
+    output_format = args.format or ('csv' if args.output.lower().endswith('.csv') else 'jsonl')
+    params = analysis_params(args)
+
+    images = find_images(args.inputs, args.recursive)
+    features = None
+    if args.features_dir:
+        if args.features_format == 'parquet' and importlib.util.find_spec('pyarrow') is None:
+            print("[批量分析] 保存Parquet特征表需要安装pyarrow：pip install pyarrow")
+            return 2
+        os.makedirs(args.features_dir, exist_ok=True)
+        features = (os.path.abspath(args.features_dir), args.features_format)
+    options = {'features': features, 'store': bool(args.store), 'grain_size': bool(args.grain_size_out)}
+    if args.restart and os.path.exists(args.output):
+        os.remove(args.output)
+    if args.restart and args.grain_size_out and os.path.exists(args.grain_size_out):
+        os.remove(args.grain_size_out)
+    completed = load_completed(args.output, output_format)
+    # 每张图像只执行尚未成功完成的分析
+    tasks = []
+    for path in images:
+        pending = tuple(t for t in analysis_types if (path, t) not in completed)
+        if pending:
+            tasks.append((path, pending, params, options))
+    print(f"[批量分析] 共 {len(images)} 张图像，跳过已完成 {len(images) - len(tasks)} 张，待处理 {len(tasks)} 张")
+    if not tasks:
+        return 0
+
+    native_threads = max(1, args.native_threads)
+    workers = args.workers if args.workers > 0 else max(1, cpu_count() // native_threads)
+    workers = min(workers, len(tasks))
+    # 每个进程约分到4块，兼顾负载均衡和进程间通信开销
+    chunksize = args.chunksize if args.chunksize > 0 else max(1, len(tasks) // (workers * 4))
+    print(f"[批量分析] 工作进程数: {workers}，每块图像数: {chunksize}，输出: {args.output} ({output_format})")
+
+    # 主进程同样限制线程数，fork出的工作进程会继承该设置
+    limit_native_threads(native_threads)
+    writer = ResultWriter(args.output, output_format)
+    grain_sizes = None
+    if args.grain_size_out:
+        # 与结果文件一样逐行追加；重新处理的图像追加新行，合并时同一图像只取最后一行
+        if os.path.exists(args.grain_size_out):
+            _truncate_partial_line(args.grain_size_out)
+        grain_sizes = open(args.grain_size_out, 'a', encoding='utf-8')
+    store = None
+    if args.store:
+        # 在限制线程数之后导入（结果库依赖numpy）
+        from result_store import ResultStore
+        store = ResultStore(args.store)
+    failures = 0
+    start = time.perf_counter()
+    try:
+        with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(native_threads,)) as pool:
+            for done, records in enumerate(pool.imap_unordered(analyze_image, tasks, chunksize=chunksize), 1):
+                for record in records:
+                    table, shape = record.pop('对象表', None), record.pop('图像尺寸', None)
+                    histogram = record.pop('粒度直方图', None)
+                    # 先写直方图再写记录：中断在二者之间时该图像会被重新处理，合并时去重而不会漏计
+                    if histogram is not None:
+                        grain_sizes.write(json.dumps({'path': record['path'], 'histogram': histogram}) + '\n')
+                        grain_sizes.flush()
+                    writer.write(record)
+                    if store is not None and record['status'] == 'ok':
+                        analysis_type = record['analysis']
+                        summary = {name: record[name] for name in SUMMARY_FIELDS[analysis_type] if name in record}
+                        depth_top, depth_bottom = parse_depth_range(record['path'], args.depth_pattern)
+                        store.ingest(record['path'], analysis_type, params[analysis_type], summary, table,
+                                     args.well, depth_top, depth_bottom, shape)
+                    if record['status'] != 'ok':
+                        failures += 1
+                        print(f"[批量分析] 失败: {record['path']} ({record['analysis']}): {record['error']}")
+                print(f"[批量分析] {done}/{len(tasks)} {records[0]['path']}")
+    except KeyboardInterrupt:
+        # 已完成的结果已经写入，下次运行会从中断处继续
+        print("[批量分析] 已中断，再次运行相同命令可继续处理剩余图像")
+        return 130
+    finally:
+        writer.close()
+        if store is not None:
+            store.close()
+        if grain_sizes is not None:
+            grain_sizes.close()
+            from grain_size import merge_files
+            statistics = merge_files([args.grain_size_out]).statistics()
+            if statistics['颗粒数']:
+                print(f"[批量分析] 粒度统计: 颗粒 {statistics['颗粒数']} 个，D50 {statistics['D50']:.4g}，"
+                      f"分选系数 {statistics['分选系数']:.2f}（{statistics['分选等级']}）")
+    print(f"[批量分析] 完成，用时 {time.perf_counter() - start:.1f} 秒，失败 {failures} 项")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,105 @@
+# 中间数组缓冲池
+# 每次分析都会为灰度图、模糊图、阈值图、形态学结果和结果图副本重新分配整幅图像大小的数组，
+# 大图像上频繁的大块分配会带来额外的缺页和内存清零开销。
+# 缓冲池按 (形状, 数据类型) 缓存用完归还的数组，下一次分析直接复用，并通过OpenCV的dst参数写入。
+# 缓冲池是可选的：各分析函数的pool参数为None时，所有数组仍由OpenCV/numpy自行分配
+import threading
+
+import numpy as np
+
+# 缓冲池默认最多缓存的字节数
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+class BufferPool:
+    """按形状和数据类型复用numpy数组的缓冲池（线程安全）
+
+    acquire()取得的数组内容未初始化；用完后通过release()归还，未归还的数组照常被垃圾回收。
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # {(形状, 数据类型): [空闲数组]}
+        self._free = {}
+        self._free_bytes = 0
+        # 统计计数
+        self._acquired = 0
+        self._allocations = 0
+        self._allocated_bytes = 0
+        self._reused_bytes = 0
+        self._discarded = 0
+
+    def acquire(self, shape, dtype=np.uint8):
+        """取得一个指定形状和数据类型的数组，优先复用空闲数组"""
+        key = (tuple(shape), np.dtype(dtype).str)
+        with self._lock:
+            self._acquired += 1
+            free = self._free.get(key)
+            if free:
+                array = free.pop()
+                self._free_bytes -= array.nbytes
+                self._reused_bytes += array.nbytes
+                return array
+        array = np.empty(shape, dtype=dtype)
+        with self._lock:
+            self._allocations += 1
+            self._allocated_bytes += array.nbytes
+        return array
+
+    def release(self, *arrays):
+        """归还不再使用的数组；None、视图和超出缓存上限的数组会被忽略"""
+        with self._lock:
+            for array in arrays:
+                # 只缓存自身拥有数据的连续数组，视图归还后原数组可能仍在使用
+                if array is None or array.base is not None or not array.flags.c_contiguous:
+                    continue
+                free = self._free.setdefault((array.shape, array.dtype.str), [])
+                if any(cached is array for cached in free):
+                    continue
+                if self._free_bytes + array.nbytes > self.max_bytes:
+                    self._discarded += 1
+                    continue
+                free.append(array)
+                self._free_bytes += array.nbytes
+
+    def clear(self):
+        """释放所有缓存的数组"""
+        with self._lock:
+            self._free.clear()
+            self._free_bytes = 0
+
+    def stats(self):
+        """返回缓冲池统计：取用次数、实际分配次数和字节数、复用节省的字节数等"""
+        with self._lock:
+            return {
+                'acquired': self._acquired,
+                'allocations': self._allocations,
+                'reused': self._acquired - self._allocations,
+                'allocated_bytes': self._allocated_bytes,
+                'bytes_saved': self._reused_bytes,
+                'free_buffers': sum(len(free) for free in self._free.values()),
+                'free_bytes': self._free_bytes,
+                'discarded': self._discarded,
+                'max_bytes': self.max_bytes,
+            }
+
+
+def take(pool, shape, dtype=np.uint8):
+    """从缓冲池取得数组作为OpenCV的dst参数；pool为None时返回None，由OpenCV自行分配"""
+    return None if pool is None else pool.acquire(shape, dtype)
+
+
+def give(pool, *arrays):
+    """将数组归还缓冲池；pool为None时不做任何事"""
+    if pool is not None:
+        pool.release(*arrays)
+
+
+def copy(pool, array):
+    """复制数组，目标数组从缓冲池取得"""
+    if pool is None:
+        return array.copy()
+    out = pool.acquire(array.shape, array.dtype)
+    np.copyto(out, array)
+    return out
@@ -0,0 +1,131 @@
+# 画布增量绘制（blitting）
+# 画笔、平移和缩放在每个鼠标事件上完整重绘四幅全分辨率图像会使交互只有几帧每秒，
+# 这里缓存完整绘制后的画布背景，只重绘发生变化的部分并复制到屏幕：
+# - 画笔：每一笔是一条不断延长的Line2D（动画对象），绘制时恢复背景后只画这条线
+# - 平移/缩放：只重绘坐标范围发生变化的子图区域
+# - 限速：鼠标事件只更新状态，实际绘制合并到定时器中，最多每interval_ms毫秒一次（约等于屏幕刷新率）
+from matplotlib.lines import Line2D
+
+# 默认的最小重绘间隔（毫秒），约60Hz
+DEFAULT_INTERVAL_MS = 16
+
+
+class BlitManager:
+    """管理一个matplotlib画布的背景缓存和限速的增量重绘"""
+
+    def __init__(self, canvas, interval_ms=DEFAULT_INTERVAL_MS, before_redraw=None):
+        self.canvas = canvas
+        self.figure = canvas.figure
+        self.interval_ms = interval_ms
+        # 重绘子图前调用的回调before_redraw(子图)，例如按新的视野更新显示的图像
+        self.before_redraw = before_redraw
+        # 完整绘制后的画布背景（不含正在绘制的笔画）
+        self._background = None
+        # 等待重绘的子图
+        self._pending_axes = set()
+        # 正在绘制的笔画有新的点等待绘制
+        self._stroke_dirty = False
+        # 是否已安排了一次重绘
+        self._scheduled = False
+        # 正在绘制的笔画：(子图, Line2D, x坐标列表, y坐标列表)
+        self._stroke = None
+        # 每次完整绘制（打开图像、显示分析结果、窗口缩放等）后重新缓存背景
+        self.canvas.mpl_connect('draw_event', self._on_draw)
+
+    def _on_draw(self, event):
+        # 完整绘制不包含动画对象，缓存背景后补画正在进行的笔画
+        self._background = self.canvas.copy_from_bbox(self.figure.bbox)
+        if self._stroke is not None:
+            ax, line = self._stroke[:2]
+            ax.draw_artist(line)
+
+    def _schedule(self):
+        """安排一次重绘，限制重绘频率"""
+        if self._scheduled:
+            return
+        self._scheduled = True
+        timer = self.canvas.new_timer(interval=self.interval_ms)
+        timer.single_shot = True
+        timer.add_callback(self.flush)
+        timer.start()
+        # 保留定时器的引用，避免被提前回收
+        self._timer = timer
+
+    @property
+    def stroke_axes(self):
+        """正在绘制的笔画所在的子图，没有笔画时为None"""
+        return self._stroke[0] if self._stroke is not None else None
+
+    def begin_stroke(self, ax, x, y, color, linewidth):
+        """开始一笔新的笔画"""
+        self.end_stroke()
+        line = Line2D([x], [y], color=color, linewidth=linewidth, animated=True)
+        ax.add_line(line)
+        self._stroke = (ax, line, [x], [y])
+
+    def extend_stroke(self, x, y):
+        """向当前笔画追加一个点"""
+        if self._stroke is None:
+            return
+        _, line, xs, ys = self._stroke
+        xs.append(x)
+        ys.append(y)
+        line.set_data(xs, ys)
+        self._stroke_dirty = True
+        self._schedule()
+
+    def end_stroke(self):
+        """结束当前笔画，将其并入背景"""
+        if self._stroke is None:
+            return
+        self.flush()
+        ax, line = self._stroke[:2]
+        self._stroke = None
+        line.set_animated(False)
+        if self._background is None:
+            self.canvas.draw_idle()
+            return
+        # 在背景上画出完成的笔画并重新缓存，无需完整重绘
+        self.canvas.restore_region(self._background)
+        ax.draw_artist(line)
+        self.canvas.blit(ax.bbox)
+        self._background = self.canvas.copy_from_bbox(self.figure.bbox)
+
+    def redraw_axes(self, ax):
+        """子图的坐标范围发生变化，安排重绘该子图"""
+        self._pending_axes.add(ax)
+        self._schedule()
+
+    def flush(self):
+        """执行等待中的重绘"""
+        self._scheduled = False
+        if self._background is None:
+            # 画布尚未完整绘制过，无法增量绘制
+            if self._pending_axes or self._stroke_dirty:
+                self._pending_axes.clear()
+                self._stroke_dirty = False
+                self.canvas.draw_idle()
+            return
+
+        axes_redrawn = bool(self._pending_axes)
+        if axes_redrawn:
+            renderer = self.canvas.get_renderer()
+            for ax in self._pending_axes:
+                if self.before_redraw is not None:
+                    self.before_redraw(ax)
+                # 坐标轴已关闭时不会绘制子图背景，先用背景色覆盖旧内容
+                ax.patch.draw(renderer)
+                # 只重绘子图框内的内容（图像和已完成的笔画），不重绘标题和刻度
+                ax.redraw_in_frame()
+                self.canvas.blit(ax.bbox)
+            self._pending_axes.clear()
+            # 更新背景缓存
+            self._background = self.canvas.copy_from_bbox(self.figure.bbox)
+
+        if self._stroke is not None and (self._stroke_dirty or axes_redrawn):
+            # 恢复背景后只画正在绘制的笔画
+            ax, line = self._stroke[:2]
+            self.canvas.restore_region(self._background)
+            ax.draw_artist(line)
+            self.canvas.blit(ax.bbox)
+        self._stroke_dirty = False
@@ -0,0 +1,48 @@
+# 导入必要的库
+# cv2是OpenCV库，用于图像处理和计算机视觉任务
+import cv2
+# 线程池用于并发执行三种分析，OpenCV在计算时会释放GIL
+from concurrent.futures import ThreadPoolExecutor
+
+from hole_analysis import process_stone_holes
+from crack_analysis import process_crack
+from grain_analysis import analyze_grains
+from buffer_pool import take
+
+
+# 定义综合分析函数
+# 对同一幅图像同时执行孔洞、裂缝和粒度分析，只做一次灰度转换，三种分析共享同一灰度图
+# 参数字典的键与各分析函数的参数名一致，例如 {'min_area': 1, 'max_area': 1000, 'threshold_val': 100}
+# pool为可选的缓冲池（buffer_pool.BufferPool），三种分析的中间数组和输出图像从中取得
+def analyze_all(image, hole_params=None, crack_params=None, grain_params=None, max_workers=3, pool=None):
+    # 如果输入图像为空，返回空字典
+    if image is None:
+        return {}
+
+    # 三种分析共用的灰度图
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY, dst=take(pool, image.shape[:2]))
+
+    # 在线程池中并发执行三种分析
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        hole_future = executor.submit(process_stone_holes, image, gray=gray, pool=pool, **(hole_params or {}))
+        crack_future = executor.submit(process_crack, image, gray=gray, pool=pool, **(crack_params or {}))
+        grain_future = executor.submit(analyze_grains, image, gray=gray, pool=pool, **(grain_params or {}))
+        hole_result, _, hole_binary, hole_marked = hole_future.result()
+        crack_result = crack_future.result()
+        grain_result, _, grain_binary, grain_marked = grain_future.result()
+
+    # 汇总分析结果
+    return {
+        '灰度图': gray,
+        '孔洞': {
+            '结果': hole_result,
+            '二值图': hole_binary,
+            '标记图': hole_marked
+        },
+        '裂缝': crack_result,
+        '粒度': {
+            '结果': grain_result,
+            '二值图': grain_binary,
+            '标记图': grain_marked
+        }
+    }
@@ -0,0 +1,348 @@
+# 按深度登记的岩心测井曲线
+# 每张岩心照片原先只得到一个汇总数值，无法得到沿深度连续变化的裂缝密度、孔洞面积占比和粒度曲线。
+# CoreLog 把每张图像登记到其深度区间，并把图像覆盖的长度和面积、每个对象（按质心深度）的计数和测量值
+# 累加到固定间距的深度分箱中；各分箱量的前缀和在查询时才（从第一个变化的分箱起）重新计算，
+# 任意深度窗口的统计量由前缀和相减得到，每个窗口的计算量与窗口大小无关。
+# 新图像到达时只更新其覆盖的分箱；同一图像再次加入时先减去旧的贡献，因此可以边分析边更新曲线
+import argparse
+import csv
+import json
+import math
+import os
+import sys
+
+import numpy as np
+
+# 默认分箱间距（米）
+DEFAULT_BIN_SIZE = 0.01
+# 各分箱累加的量（按此顺序存放在二维数组的各行）
+CHANNELS = (
+    'covered_length',  # 图像覆盖的岩心长度（米）
+    'covered_area',  # 图像覆盖的面积（像素²）
+    'hole_count', 'hole_area',
+    'crack_count', 'crack_length',
+    # 颗粒等效圆直径（像素）的和与平方和，用于计算平均值和标准差
+    'grain_count', 'grain_size', 'grain_size_sq',
+)
+_CHANNEL_INDEX = {name: index for index, name in enumerate(CHANNELS)}
+# 窗口统计输出的列
+CURVE_COLUMNS = ('depth', 'covered_length', 'hole_count', 'hole_area_fraction', 'crack_count', 'crack_density',
+                 'crack_intensity', 'grain_count', 'grain_size_mean', 'grain_size_std')
+# 深度换算成分箱编号时的容差，避免 1200.0 / 0.01 这类浮点误差落入前一个分箱
+_EPSILON = 1e-9
+
+
+def object_depths(centroid_y, depth_top, depth_bottom, height):
+    """由对象质心所在的行在图像深度区间内线性插值得到对象深度（像素行的中心为 行号+0.5）"""
+    return depth_top + (np.asarray(centroid_y, dtype=np.float64) + 0.5) / height * (depth_bottom - depth_top)
+
+
+def _window_statistics(sums, depth):
+    """由窗口内各量的和（CHANNELS×窗口数）计算统计曲线，没有图像覆盖的窗口为NaN"""
+    values = dict(zip(CHANNELS, sums))
+    covered = values['covered_length'] > 0
+    length = np.where(covered, values['covered_length'], 1)
+    area = np.where(values['covered_area'] > 0, values['covered_area'], 1)
+    grains = np.where(values['grain_count'] > 0, values['grain_count'], 1)
+    has_grains = values['grain_count'] > 0
+    grain_mean = values['grain_size'] / grains
+    grain_var = np.maximum(values['grain_size_sq'] / grains - grain_mean ** 2, 0)
+
+    def covered_only(curve):
+        return np.where(covered, curve, np.nan)
+
+    return {
+        'depth': depth,
+        'covered_length': values['covered_length'],
+        'hole_count': covered_only(values['hole_count']),
+        # 孔洞面积占比（孔隙度的近似）
+        'hole_area_fraction': covered_only(values['hole_area'] / area),
+        'crack_count': covered_only(values['crack_count']),
+        # 每米岩心的裂缝条数
+        'crack_density': covered_only(values['crack_count'] / length),
+        # 单位面积的裂缝长度（像素/像素²）
+        'crack_intensity': covered_only(values['crack_length'] / area),
+        'grain_count': covered_only(values['grain_count']),
+        'grain_size_mean': np.where(covered & has_grains, grain_mean, np.nan),
+        'grain_size_std': np.where(covered & has_grains, np.sqrt(grain_var), np.nan),
+    }
+
+
+class CoreLog:
+    """岩心测井曲线的累加器
+
+    bin_size为分箱间距（米），窗口边界按分箱对齐。对象的测量值使用特征表中的像素单位。
+    """
+
+    def __init__(self, bin_size=DEFAULT_BIN_SIZE):
+        if bin_size <= 0:
+            raise ValueError("分箱间距必须大于0")
+        self.bin_size = float(bin_size)
+        # 第一个分箱的全局编号（深度 = 编号 × 分箱间距），数组按需向两端扩展
+        self._start = 0
+        self._bins = np.zeros((len(CHANNELS), 0), dtype=np.float64)
+        self._prefix = np.zeros((len(CHANNELS), 1), dtype=np.float64)
+        # 前缀和从该分箱起需要重新计算，None表示前缀和是最新的
+        self._dirty = None
+        # 每张图像的贡献：键 -> (第一个分箱的全局编号, CHANNELS×分箱数的数组)
+        self._images = {}
+
+    def __len__(self):
+        """已登记的图像数"""
+        return len(self._images)
+
+    def __contains__(self, key):
+        return key in self._images
+
+    @property
+    def depth_range(self):
+        """已登记图像覆盖的深度范围 (顶深, 底深)（按分箱边界对齐），没有图像时为None"""
+        if not self._images:
+            return None
+        first = min(first for first, _ in self._images.values())
+        last = max(first + block.shape[1] for first, block in self._images.values())
+        return first * self.bin_size, last * self.bin_size
+
+    def _bin_of(self, depth):
+        """深度所在分箱的全局编号"""
+        return np.floor(np.asarray(depth, dtype=np.float64) / self.bin_size + _EPSILON).astype(np.int64)
+
+    def _reserve(self, first, last):
+        """确保全局编号 [first, last) 的分箱已分配，扩展时两端按现有长度的一倍预留"""
+        count = self._bins.shape[1]
+        if count and first >= self._start and last <= self._start + count:
+            return
+        if count == 0:
+            start, end = first, last
+        else:
+            margin = max(count, last - first)
+            start = first - margin if first < self._start else self._start
+            end = last + margin if last > self._start + count else self._start + count
+        bins = np.zeros((len(CHANNELS), end - start), dtype=np.float64)
+        bins[:, self._start - start:self._start - start + count] = self._bins
+        self._bins, self._start = bins, start
+        self._prefix = np.zeros((len(CHANNELS), bins.shape[1] + 1), dtype=np.float64)
+        self._dirty = 0
+
+    def _apply(self, first, block, sign):
+        """把一张图像的贡献加到（sign为-1时减去）分箱中"""
+        offset = first - self._start
+        self._bins[:, offset:offset + block.shape[1]] += sign * block
+        self._dirty = offset if self._dirty is None else min(self._dirty, offset)
+
+    def add_image(self, key, depth_top, depth_bottom, shape, tables):
+        """登记一张图像及其检测对象
+
+        key为图像的唯一标识（如路径），已登记时替换旧的贡献；shape为图像形状 (高, 宽)；
+        tables为 {分析类型: 特征表} 字典（'hole'、'crack'、'grain'，可只给出其中一部分），
+        对象深度由质心所在行插值得到。
+        """
+        height = shape[0]
+        objects = {analysis_type: (object_depths(table['centroid_y'], depth_top, depth_bottom, height), table)
+                   for analysis_type, table in tables.items() if table is not None}
+        self.add_objects(key, depth_top, depth_bottom, shape, objects)
+
+    def add_objects(self, key, depth_top, depth_bottom, shape, objects):
+        """登记一张图像，objects为 {分析类型: (对象深度数组, 列字典)}
+
+        列字典需要面积列area（孔洞、颗粒）或周长列perimeter（裂缝），特征表和结果库查询的列均可直接使用。
+        """
+        if not depth_bottom > depth_top:
+            raise ValueError(f"图像深度区间无效: {depth_top} ~ {depth_bottom}")
+        height, width = shape[:2]
+        first = int(self._bin_of(depth_top))
+        # 底深恰好落在分箱边界上时不占用下一个分箱
+        last = int(np.ceil(depth_bottom / self.bin_size - _EPSILON))
+        block = np.zeros((len(CHANNELS), last - first), dtype=np.float64)
+
+        # 图像覆盖的长度按每个分箱与深度区间的重叠部分计算，面积按长度比例分配
+        edges = np.arange(first, last + 1) * self.bin_size
+        overlap = np.clip(np.minimum(edges[1:], depth_bottom) - np.maximum(edges[:-1], depth_top), 0, None)
+        block[_CHANNEL_INDEX['covered_length']] = overlap
+        block[_CHANNEL_INDEX['covered_area']] = overlap / (depth_bottom - depth_top) * (width * height)
+
+        for analysis_type, (depths, columns) in objects.items():
+            depths = np.asarray(depths, dtype=np.float64)
+            if len(depths) == 0:
+                continue
+            # 质心在图像边缘时插值深度可能恰好等于底深，归入图像范围内的分箱
+            local = np.clip(self._bin_of(depths) - first, 0, last - first - 1)
+
+            def accumulate(channel, weights=None):
+                block[_CHANNEL_INDEX[channel]] += np.bincount(local, weights=weights, minlength=last - first)
+
+            if analysis_type == 'hole':
+                accumulate('hole_count')
+                accumulate('hole_area', np.asarray(columns['area'], dtype=np.float64))
+            elif analysis_type == 'crack':
+                accumulate('crack_count')
+                accumulate('crack_length', np.asarray(columns['perimeter'], dtype=np.float64))
+            elif analysis_type == 'grain':
+                # 等效圆直径
+                sizes = np.sqrt(4 * np.asarray(columns['area'], dtype=np.float64) / np.pi)
+                accumulate('grain_count')
+                accumulate('grain_size', sizes)
+                accumulate('grain_size_sq', sizes ** 2)
+            else:
+                raise ValueError(f"不支持的分析类型: {analysis_type}")
+
+        self.remove_image(key)
+        self._reserve(first, last)
+        self._apply(first, block, 1)
+        self._images[key] = (first, block)
+
+    def remove_image(self, key):
+        """移除一张图像的贡献，图像未登记时不做任何操作"""
+        entry = self._images.pop(key, None)
+        if entry is not None:
+            self._apply(entry[0], entry[1], -1)
+
+    def _prefix_sums(self):
+        """返回各量的前缀和（CHANNELS×(分箱数+1)），只重新计算第一个变化的分箱之后的部分"""
+        if self._dirty is not None:
+            start = self._dirty
+            np.cumsum(self._bins[:, start:], axis=1, out=self._prefix[:, start + 1:])
+            self._prefix[:, start + 1:] += self._prefix[:, start:start + 1]
+            self._dirty = None
+        return self._prefix
+
+    def _sums(self, tops, bottoms):
+        """深度窗口 [tops, bottoms) 内各量的和，窗口边界取最近的分箱边界"""
+        count = self._bins.shape[1]
+        first = np.clip(np.rint(np.asarray(tops) / self.bin_size).astype(np.int64) - self._start, 0, count)
+        last = np.clip(np.rint(np.asarray(bottoms) / self.bin_size).astype(np.int64) - self._start, 0, count)
+        last = np.maximum(first, last)
+        prefix = self._prefix_sums()
+        return prefix[:, last] - prefix[:, first]
+
+    def window(self, depth_top, depth_bottom):
+        """深度窗口内的统计量字典（标量），没有图像覆盖时各统计量为NaN"""
+        sums = self._sums(np.array([depth_top]), np.array([depth_bottom]))
+        curve = _window_statistics(sums, np.array([(depth_top + depth_bottom) / 2]))
+        return {name: float(values[0]) for name, values in curve.items()}
+
+    def curve(self, window, step=None, depth_top=None, depth_bottom=None):
+        """以window为窗口长度、step为间距（默认为分箱间距）的滑动窗口统计曲线
+
+        返回 {列名: 数组} 字典，depth为窗口中心深度，列名见CURVE_COLUMNS；深度范围默认为已登记的全部图像。
+        """
+        if window <= 0:
+            raise ValueError("窗口长度必须大于0")
+        step = step or self.bin_size
+        if not self._images:
+            return {name: np.empty(0) for name in CURVE_COLUMNS}
+        top, bottom = self.depth_range
+        top = top if depth_top is None else depth_top
+        bottom = bottom if depth_bottom is None else depth_bottom
+        count = max(int(math.floor((bottom - top) / step + _EPSILON)) + 1, 1)
+        centers = top + np.arange(count) * step
+        sums = self._sums(centers - window / 2, centers + window / 2)
+        return _window_statistics(sums, centers)
+
+    @classmethod
+    def from_store(cls, store, well=None, params=None, bin_size=DEFAULT_BIN_SIZE):
+        """由结果库中已登记深度的图像和对象建立测井曲线
+
+        params为 {分析类型: 参数字典}，指定时只使用该参数的结果。未指定参数的分析类型中，
+        同一图像有多组参数的结果时抛出ValueError（否则计数和面积会重复累加），错误信息列出可选的参数。
+        """
+        log = cls(bin_size)
+        samples = {row['path']: row for row in store.query_samples(well)}
+        objects = {path: {} for path in samples}
+        for analysis_type in ('hole', 'crack', 'grain'):
+            type_params = (params or {}).get(analysis_type)
+            if type_params is not None:
+                # 按值比较（1与1.0相同），换成库中保存的参数，使结果库按参数键精确匹配
+                type_params = next((row['params'] for row in store.query_summaries(analysis_type, well)
+                                    if row['params'] == type_params), type_params)
+            # {图像路径: 分析结果编号}，同一参数在每张图像上只有一个分析结果
+            analysis_ids = {}
+            for row in store.query_objects(analysis_type, well, params=type_params):
+                if analysis_ids.setdefault(row['path'], row['analysis_id']) != row['analysis_id']:
+                    choices = sorted({json.dumps(summary['params'], sort_keys=True, ensure_ascii=False)
+                                      for summary in store.query_summaries(analysis_type, well)})
+                    raise ValueError(f"图像 {row['path']} 有多组参数的{analysis_type}分析结果，"
+                                     f"请指定其中一组参数: {'; '.join(choices)}")
+                if row['path'] in objects and row['depth'] is not None:
+                    columns = objects[row['path']].setdefault(analysis_type, ([], {'area': [], 'perimeter': []}))
+                    columns[0].append(row['depth'])
+                    columns[1]['area'].append(row['area'])
+                    columns[1]['perimeter'].append(row['perimeter'])
+        for path, sample in samples.items():
+            if sample['width'] and sample['height']:
+                log.add_objects(path, sample['depth_top'], sample['depth_bottom'],
+                                (sample['height'], sample['width']), objects[path])
+        return log
+
+
+def write_curve(curve, out):
+    """将曲线字典写为CSV（每行一个窗口），返回行数"""
+    writer = csv.writer(out)
+    writer.writerow(CURVE_COLUMNS)
+    rows = zip(*(curve[name].tolist() for name in CURVE_COLUMNS))
+    count = 0
+    for row in rows:
+        writer.writerow(['' if isinstance(value, float) and math.isnan(value) else value for value in row])
+        count += 1
+    return count
+
+
+def parse_params(text):
+    """解析 --params 参数 "分析类型=JSON参数"，返回 (分析类型, 参数字典)"""
+    analysis_type, _, value = text.partition('=')
+    if analysis_type not in ('hole', 'crack', 'grain'):
+        raise argparse.ArgumentTypeError(f"分析类型应为 hole、crack 或 grain: {text}")
+    try:
+        params = json.loads(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"参数应为JSON对象: {text}")
+    if not isinstance(params, dict):
+        raise argparse.ArgumentTypeError(f"参数应为JSON对象: {text}")
+    return analysis_type, params
+
+
+def main(argv=None):
+    """命令行入口：由结果库生成测井曲线CSV"""
+    parser = argparse.ArgumentParser(description='由分析结果库生成沿深度的滑动窗口统计曲线')
+    parser.add_argument('database', help='结果库文件（.db），由批量分析的 --store 生成')
+    parser.add_argument('--well', help='井名')
+    parser.add_argument('--window', type=float, default=0.5, help='窗口长度（米，默认0.5）')
+    parser.add_argument('--step', type=float, help='输出间距（米，默认为分箱间距）')
+    parser.add_argument('--bin-size', type=float, default=DEFAULT_BIN_SIZE, help='分箱间距（米，默认0.01）')
+    parser.add_argument('--depth', nargs=2, type=float, metavar=('顶深', '底深'), help='输出的深度范围（米）')
+    parser.add_argument('--params', action='append', default=[], type=parse_params, metavar='类型=JSON',
+                        help='只使用该组参数的分析结果，如 \'hole={"max_area": 1000, "min_area": 1, '
+                             '"threshold_val": 90}\'，可按分析类型重复指定；同一图像有多组参数的结果时必须指定')
+    parser.add_argument('-o', '--output', help='输出CSV文件（默认输出到终端）')
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.database):
+        print(f"[测井曲线] 文件不存在: {args.database}")
+        return 1
+    from result_store import ResultStore
+    with ResultStore(args.database) as store:
+        try:
+            log = CoreLog.from_store(store, args.well, dict(args.params), args.bin_size)
+        except ValueError as e:
+            print(f"[测井曲线] {e}")
+            return 2
+    if not len(log):
+        print("[测井曲线] 结果库中没有已登记深度的图像")
+        return 1
+    depth_top, depth_bottom = args.depth if args.depth else (None, None)
+    curve = log.curve(args.window, args.step, depth_top, depth_bottom)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8-sig', newline='') as out:
+            count = write_curve(curve, out)
+        print(f"[测井曲线] {len(log)} 张图像，已导出 {count} 个深度点到 {args.output}")
+    else:
+        try:
+            write_curve(curve, sys.stdout)
+        except BrokenPipeError:
+            # 输出到head等提前退出的管道时静默结束
+            sys.stderr.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
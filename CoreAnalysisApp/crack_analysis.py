@@ -7,61 +7,125 @@ import numpy as np
 from scipy import ndimage
 # measure是skimage库中的一个模块，用于图像特征测量
 from skimage import measure
+# buffer_pool用于复用中间数组
+from buffer_pool import take, give
+# overlay用于绘制标记图
+import overlay
+# feature_table用于保存每条裂缝的特征
+from feature_table import FeatureTable
 
-# 定义裂缝处理函数
-# 该函数用于处理图像中的裂缝，输入参数包括图像、最小面积、最大面积和阈值
-def process_crack(image, min_area=1000, max_area=np.inf, threshold_val=100):
-    # 如果输入图像为空，返回空字典
-    if image is None:
-        return {}
-
-    # 使用更高效的灰度转换方法
-    # 灰度图只包含一个通道，便于后续处理
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-
+# 定义裂缝图像增强函数
+# 对比度增强和双边滤波较为耗时且与阈值无关，调整阈值预览时可以缓存增强结果
+# pool为可选的缓冲池，输出数组从缓冲池取得
+# clahe_tile为可选的均衡化分块边长（像素），默认将图像划分为8x8块；
+# 指定时分块大小与图像尺寸无关，流式分析中不同高度的窗口得到一致的增强结果
+def crack_enhance(gray, pool=None, clahe_tile=None):
     # 自适应直方图均衡化增强对比度
     # 可以使图像的亮度分布更均匀
-    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
-    enhanced_gray = clahe.apply(gray)
+    grid = (8, 8)
+    source = gray
+    if clahe_tile:
+        # 尺寸不能被分块数整除时OpenCV在右侧和下方补 分块数-余数 行列（整除的方向也补），实际分块边长
+        # 随图像尺寸变化；这里先按相同方式（BORDER_REFLECT_101）补到clahe_tile的整数倍，分块边长恰为clahe_tile
+        height, width = gray.shape[:2]
+        pad_y, pad_x = -height % clahe_tile, -width % clahe_tile
+        if pad_y or pad_x:
+            source = cv2.copyMakeBorder(gray, 0, pad_y, 0, pad_x, cv2.BORDER_REFLECT_101)
+        grid = (source.shape[1] // clahe_tile, source.shape[0] // clahe_tile)
+    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=grid)
+    if source is gray:
+        enhanced_gray = clahe.apply(gray, dst=take(pool, gray.shape))
+    else:
+        # 补边部分的结果丢弃
+        enhanced_gray = take(pool, gray.shape)
+        cropped = clahe.apply(source)[:gray.shape[0], :gray.shape[1]]
+        if enhanced_gray is None:
+            enhanced_gray = np.ascontiguousarray(cropped)
+        else:
+            np.copyto(enhanced_gray, cropped)
 
     # 优化高斯模糊参数，使用双边滤波保留边缘
-    # 双边滤波可以在去除噪声的同时保留图像的边缘信息
-    blurred = cv2.bilateralFilter(enhanced_gray, 9, 75, 75)
+    # 双边滤波可以在去除噪声的同时保留图像的边缘信息（双边滤波不能原地执行）
+    blurred = cv2.bilateralFilter(enhanced_gray, 9, 75, 75, dst=take(pool, gray.shape))
+    give(pool, enhanced_gray)
+    return blurred
+
 
+# 定义裂缝阈值与形态学处理函数
+# pool为可选的缓冲池，输出数组从缓冲池取得
+def crack_threshold(blurred, threshold_val, pool=None):
     # 自适应阈值处理
     # 根据图像的局部特征进行阈值处理
     thresh = cv2.adaptiveThreshold(blurred, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-                                   cv2.THRESH_BINARY_INV, 11, 2)
+                                   cv2.THRESH_BINARY_INV, 11, 2, dst=take(pool, blurred.shape))
 
     # 结合全局阈值作为备用方案
     # 确保在自适应阈值处理效果不好时也能得到较好的结果
-    _, global_thresh = cv2.threshold(blurred, threshold_val, 255, cv2.THRESH_BINARY_INV)
-    thresh = cv2.bitwise_or(thresh, global_thresh)
+    _, global_thresh = cv2.threshold(blurred, threshold_val, 255, cv2.THRESH_BINARY_INV,
+                                     dst=take(pool, blurred.shape))
+    cv2.bitwise_or(thresh, global_thresh, dst=thresh)
+    give(pool, global_thresh)
 
     # 优化形态学操作
-    # 开操作去除小噪声，闭操作填充小孔洞
+    # 开操作去除小噪声，闭操作填充小孔洞；原地执行，不再分配新数组
     kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
-    thresh = cv2.morphologyEx(thresh, cv2.MORPH_OPEN, kernel, iterations=1)
-    thresh = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel, iterations=2)
+    cv2.morphologyEx(thresh, cv2.MORPH_OPEN, kernel, dst=thresh, iterations=1)
+    return cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel, dst=thresh, iterations=2)
+
+
+# 定义裂缝处理函数
+# 该函数用于处理图像中的裂缝，输入参数包括图像、最小面积、最大面积和阈值
+# gray为可选的预先计算好的灰度图，多个分析共用同一幅图像时可避免重复转换
+# progress为可选的进度回调progress(进度0~1, 说明)，后台任务可在回调中抛出异常以取消分析
+# pool为可选的缓冲池（buffer_pool.BufferPool），中间数组从中取得并归还；
+# 返回的灰度图、二值图和结果图同样来自缓冲池，调用者用完后可以归还
+# render为False时只测量不绘制，返回的结果图为None，需要时可用overlay.render('crack', image, 结果['裂缝轮廓'])绘制
+# clahe_tile为可选的对比度均衡化分块边长（像素），见crack_enhance
+def process_crack(image, min_area=1000, max_area=np.inf, threshold_val=100, gray=None, progress=None,
+                  pool=None, render=True, clahe_tile=None):
+    # 如果输入图像为空，返回空字典
+    if image is None:
+        return {}
+
+    # 未提供进度回调时使用空函数
+    progress = progress or (lambda fraction, message='': None)
+    progress(0.0, "灰度转换与增强")
+
+    # 使用更高效的灰度转换方法
+    # 灰度图只包含一个通道，便于后续处理
+    if gray is None:
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY, dst=take(pool, image.shape[:2]))
+
+    # 对比度增强与保边滤波
+    blurred = crack_enhance(gray, pool, clahe_tile)
+
+    # 阈值与形态学处理
+    progress(0.2, "阈值与形态学处理")
+    closed = crack_threshold(blurred, threshold_val, pool)
+    give(pool, blurred)
 
     # 使用区域生长法去除小噪声
     # 标记连通区域，并计算每个区域的大小
-    labeled, num_features = ndimage.label(thresh)
-    sizes = ndimage.sum(thresh, labeled, range(num_features + 1))
-    # 筛选出面积大于最小面积/10的区域
-    mask = sizes > min_area / 10
-    thresh = mask[labeled]
+    progress(0.3, "连通区域标记")
+    labeled = take(pool, closed.shape, np.int32)
+    if labeled is None:
+        labeled, num_features = ndimage.label(closed)
+    else:
+        num_features = ndimage.label(closed, output=labeled)
+    sizes = ndimage.sum(closed, labeled, range(num_features + 1))
+    # 筛选出面积大于最小面积/10的区域，按标记查表得到0/1的二值图
+    mask = (sizes > min_area / 10).astype(np.uint8)
+    thresh = np.take(mask, labeled, out=take(pool, closed.shape))
+    give(pool, closed)
 
     # 使用更精确的轮廓分析方法
     # 查找二值图像中的轮廓
-    contours, _ = cv2.findContours(thresh.astype(np.uint8), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
 
     # 初始化裂缝计数
     crack_count = 0
     # 初始化总裂缝面积
     total_crack_area = 0
-    # 复制原始图像用于绘制结果
-    result_img = image.copy()
     # 初始化裂缝轮廓列表
     crack_contours = []
     # 初始化裂缝宽度列表
@@ -70,9 +134,13 @@ def process_crack(image, min_area=1000, max_area=np.inf, threshold_val=100):
     crack_lengths = []
     # 初始化裂缝宽度分布列表
     crack_width_distributions = []
+    # 初始化与裂缝轮廓一一对应的 (最小宽度, 最大宽度, 平均宽度) 列表
+    crack_width_stats = []
 
     # 遍历每个轮廓
-    for contour in contours:
+    for index, contour in enumerate(contours):
+        # 逐个裂缝计算距离变换较为耗时，每个轮廓报告一次进度
+        progress(0.4 + 0.5 * index / len(contours), "裂缝宽度测量")
         # 计算轮廓面积
         area = cv2.contourArea(contour)
         # 筛选面积在指定范围内的裂缝
@@ -91,16 +159,16 @@ def process_crack(image, min_area=1000, max_area=np.inf, threshold_val=100):
                 crack_count += 1
                 # 总裂缝面积增加
                 total_crack_area += area
-                # 将裂缝轮廓添加到列表中
+                # 将裂缝轮廓添加到列表中，测量完成后统一绘制
                 crack_contours.append(contour)
 
-                # 绘制轮廓
-                # 绘制绿色的轮廓线
-                cv2.drawContours(result_img, [contour], -1, (0, 255, 0), 2)
-
                 # 创建仅包含当前裂缝的二值图像
-                crack_mask = np.zeros_like(thresh, dtype=np.uint8)
-                cv2.drawContours(crack_mask, [contour], -1, 1, -1)
+                # 只需覆盖裂缝所在的行并在上下各留出1行背景（图像边界处不留），距离变换结果与
+                # 整幅图像上完全相同，避免每条裂缝都分配和扫描整幅图像大小的掩膜
+                _, y, _, h = cv2.boundingRect(contour)
+                row0, row1 = max(0, y - 1), min(thresh.shape[0], y + h + 1)
+                crack_mask = np.zeros((row1 - row0, thresh.shape[1]), dtype=np.uint8)
+                cv2.drawContours(crack_mask, [contour], -1, 1, -1, offset=(0, -row0))
 
                 # 对单个裂缝进行距离变换
                 # 计算每个像素到裂缝边界的距离
@@ -126,27 +194,23 @@ def process_crack(image, min_area=1000, max_area=np.inf, threshold_val=100):
 
                     # 使用最大宽度作为该裂缝的代表宽度
                     crack_widths.append(max_width)
+                    crack_width_stats.append((min_width, max_width, mean_width))
                 else:
                     # 如果没有宽度值，将宽度设为0
                     crack_widths.append(0)
+                    crack_width_stats.append((0, 0, 0))
 
                 # 计算裂缝长度，使用轮廓的弧长
                 length = cv2.arcLength(contour, True)
                 # 将裂缝长度添加到长度列表中
                 crack_lengths.append(length)
 
-                # 优化多边形近似绘制
-                # 简化轮廓，减少绘制的点数
-                epsilon = 0.005 * cv2.arcLength(contour, True)
-                approx = cv2.approxPolyDP(contour, epsilon, True)
-                # 绘制红色的近似多边形
-                cv2.polylines(result_img, [approx], True, (0, 0, 255), 2)
-
     # 初始化裂缝特征字典
+    progress(0.9, "最大裂缝特征计算")
     crack_features = {}
     if crack_count > 0:
         # 使用区域属性分析最大裂缝
-        props = measure.regionprops(labeled.astype(int))
+        props = measure.regionprops(labeled)
         # 找到面积最大的区域
         largest_prop = max(props, key=lambda x: x.area) if props else None
 
@@ -177,11 +241,24 @@ def process_crack(image, min_area=1000, max_area=np.inf, threshold_val=100):
                 if largest_crack_widths['max'] > 0 else 0
             }
 
+    # 每条裂缝一行的特征表，轮廓改为引用特征表中连续存放的坐标
+    table = FeatureTable.from_contours(crack_contours, crack_width_stats)
+    crack_contours = table.contours()
+
+    # 标记图只在本函数内使用
+    give(pool, labeled)
+    # 0/1二值图原地放大为0/255
+    np.multiply(thresh, 255, out=thresh)
+    # 在原图副本上绘制绿色的裂缝轮廓和红色的近似多边形
+    result_img = overlay.render('crack', image, crack_contours, pool) if render else None
+    progress(1.0, "完成")
     return {
         '原图': gray,
-        '二值图': thresh.astype(np.uint8) * 255,
+        '二值图': thresh,
         '结果图': result_img,
         '裂缝轮廓': crack_contours,
+        # 与裂缝轮廓一一对应的特征表（feature_table.FeatureTable）
+        '对象表': table,
         '特征': crack_features,
         '裂缝宽度列表': crack_widths,
         '裂缝宽度分布': crack_width_distributions
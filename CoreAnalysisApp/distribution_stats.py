@@ -0,0 +1,74 @@
+# 分布统计
+# GUI图表和Web直方图共用的统计计算：对数据只排序一次，
+# 在有序数组上得到分箱、四分位数、IQR显示范围和大小分组，避免在Python列表上逐元素重复计算
+import numpy as np
+
+# 直方图最多的分箱数
+MAX_BINS = 20
+
+
+def _quantile(sorted_values, q):
+    """有序数组的分位数，与np.percentile的默认线性插值一致"""
+    position = (len(sorted_values) - 1) * q
+    lower = int(np.floor(position))
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def choose_bins(count, unique_count, max_bins=MAX_BINS):
+    """根据数据量和不同取值的个数确定合适的分箱数"""
+    if count < 10:
+        return count
+    if count < 50:
+        return min(10, unique_count)
+    return min(max_bins, unique_count)
+
+
+def summarize(data, bins=None, positive_only=True):
+    """计算一组测量值（面积、宽度等）的分布统计
+
+    positive_only为True时只统计大于0的值；bins为None时按数据量自动确定分箱数。返回字典：
+    total 输入数据个数，count 有效数据个数，values 有序的有效数据，mean 平均值，
+    q1/q3/iqr 四分位数，lower/upper 排除极端值后的显示范围，
+    counts/edges 直方图计数和分箱边界，buckets 按平均值划分的 (小, 中, 大) 数量
+    """
+    values = np.asarray(data, dtype=float).ravel()
+    total = len(values)
+    if positive_only:
+        # 过滤掉零值和负值
+        values = values[values > 0]
+    values = np.sort(values)
+    count = len(values)
+    summary = {'total': total, 'count': count, 'values': values}
+    if count == 0:
+        return summary
+
+    mean = float(values.mean())
+    q1, q3 = float(_quantile(values, 0.25)), float(_quantile(values, 0.75))
+    iqr = q3 - q1
+    lower, upper = max(0.0, q1 - 1.5 * iqr), q3 + 1.5 * iqr
+    # 如果数据分布比较集中，稍微扩大范围
+    if upper - lower < mean * 0.1:
+        margin = mean * 0.1
+        lower, upper = max(0.0, mean - margin), mean + margin
+
+    # 有序数组中相邻不等的元素个数即为不同取值的个数
+    unique_count = 1 + int(np.count_nonzero(np.diff(values)))
+    counts, edges = np.histogram(values, bins=bins or choose_bins(count, unique_count))
+
+    # 小于平均值一半为小，不小于平均值两倍为大，其余为中
+    small = int(np.searchsorted(values, mean / 2, side='left'))
+    large = count - int(np.searchsorted(values, mean * 2, side='left'))
+
+    summary.update({
+        'mean': mean,
+        'q1': q1,
+        'q3': q3,
+        'iqr': iqr,
+        'lower': lower,
+        'upper': upper,
+        'counts': counts,
+        'edges': edges,
+        'buckets': (small, count - small - large, large),
+    })
+    return summary
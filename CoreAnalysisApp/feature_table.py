@@ -0,0 +1,393 @@
+# 按对象存储的列式特征表
+# 分析结果原先以Python列表（面积列表、裂缝宽度列表）和逐个轮廓数组的列表返回，
+# 同一对象的面积、周长、圆形度和位置分散在不同列表中，大量小数组和Python浮点数也占用较多内存。
+# FeatureTable 每个对象一行，以numpy结构化数组保存各列；所有轮廓的坐标连续存放在一个数组中，
+# 第i个对象的轮廓为 coords[offsets[i]:offsets[i + 1]]。
+# 导出为.npz时直接写出这三个数组；导出Parquet（需要安装pyarrow）时坐标和偏移数组不经复制地转换为Arrow数组，
+# 各数值列在结构化数组中是跨行的步长视图，转换时各复制一次为连续的列
+import csv
+
+import numpy as np
+
+# 每个对象一行的列定义；裂缝以外的对象宽度列为NaN
+FEATURE_DTYPE = np.dtype([
+    ('id', np.int32),
+    # 外接矩形
+    ('bbox_x', np.int32), ('bbox_y', np.int32), ('bbox_w', np.int32), ('bbox_h', np.int32),
+    # 质心
+    ('centroid_x', np.float64), ('centroid_y', np.float64),
+    ('area', np.float64),
+    ('perimeter', np.float64),
+    ('circularity', np.float64),
+    # 主轴方向（度，与x轴的夹角，范围(-90, 90]，y轴向下）
+    ('orientation', np.float64),
+    # 等效圆直径（面积相同的圆的直径）
+    ('equivalent_diameter', np.float64),
+    # 等效椭圆（二阶矩相同的椭圆）的长轴、短轴长度和长宽比（短轴为0时为NaN）
+    ('major_axis', np.float64), ('minor_axis', np.float64), ('aspect_ratio', np.float64),
+    # 最小、最大卡尺（Feret）直径：各方向上投影宽度的最小值和最大值
+    ('feret_min', np.float64), ('feret_max', np.float64),
+    # 宽度（像素）
+    ('width_min', np.float64), ('width_max', np.float64), ('width_mean', np.float64),
+])
+
+def polygon_moments(coords, offsets):
+    """按多边形（格林公式）计算每个轮廓的矩，与cv2.moments对轮廓的结果相同
+
+    coords为所有轮廓连续存放的 M×2 坐标，offsets为长度N+1的偏移数组，每个轮廓至少有一个点。
+    返回 {'m00', 'm10', 'm01', 'mu20', 'mu11', 'mu02'}，每项为长度N的数组，面积为正。
+    """
+    starts = offsets[:-1]
+    # 每个顶点的下一个顶点，轮廓的最后一个点连回第一个点
+    following = np.arange(1, len(coords) + 1)
+    following[offsets[1:] - 1] = starts
+    x0 = coords[:, 0].astype(np.float64)
+    y0 = coords[:, 1].astype(np.float64)
+    x1, y1 = x0[following], y0[following]
+    cross = x0 * y1 - x1 * y0
+
+    def total(values):
+        return np.add.reduceat(values, starts)
+
+    m00 = total(cross) / 2
+    m10 = total((x0 + x1) * cross) / 6
+    m01 = total((y0 + y1) * cross) / 6
+    m20 = total((x0 * x0 + x0 * x1 + x1 * x1) * cross) / 12
+    m02 = total((y0 * y0 + y0 * y1 + y1 * y1) * cross) / 12
+    m11 = total((x0 * y1 + 2 * x0 * y0 + 2 * x1 * y1 + x1 * y0) * cross) / 24
+    # 顺时针轮廓的有向面积为负，与OpenCV一样统一为正
+    sign = np.where(m00 < 0, -1.0, 1.0)
+    m00, m10, m01, m20, m02, m11 = (sign * m for m in (m00, m10, m01, m20, m02, m11))
+    # 中心矩
+    safe = np.where(m00 != 0, m00, 1)
+    cx, cy = m10 / safe, m01 / safe
+    return {'m00': m00, 'm10': m10, 'm01': m01,
+            'mu20': m20 - cx * m10, 'mu11': m11 - cx * m01, 'mu02': m02 - cy * m01}
+
+
+def polygon_perimeters(coords, offsets):
+    """每个闭合轮廓的周长，与cv2.arcLength(轮廓, True)相同"""
+    starts = offsets[:-1]
+    following = np.arange(1, len(coords) + 1)
+    following[offsets[1:] - 1] = starts
+    step = (coords[following] - coords).astype(np.float64)
+    return np.add.reduceat(np.hypot(step[:, 0], step[:, 1]), starts)
+
+
+def _orientation(moments):
+    """由二阶中心矩计算主轴方向（度，范围(-90, 90]）"""
+    mu11, mu20, mu02 = moments['mu11'], moments['mu20'], moments['mu02']
+    angle = np.degrees(0.5 * np.arctan2(2 * mu11, mu20 - mu02))
+    # 各向同性（如正方形、圆）的对象没有主轴方向，舍入误差不应决定角度，统一为0
+    isotropic = np.hypot(2 * mu11, mu20 - mu02) <= 1e-6 * (mu20 + mu02)
+    # -90度与90度是同一方向
+    return np.where(isotropic, 0.0, np.where(angle <= -90, angle + 180, angle))
+
+
+def ellipse_axes(moments):
+    """由二阶中心矩计算等效椭圆的长轴和短轴长度（与skimage.measure.regionprops的定义相同）"""
+    area = moments['m00']
+    safe = np.where(area > 0, area, 1)
+    a, b, c = moments['mu20'] / safe, moments['mu11'] / safe, moments['mu02'] / safe
+    # 协方差矩阵的两个特征值
+    half_sum = (a + c) / 2
+    radius = np.sqrt(((a - c) / 2) ** 2 + b ** 2)
+    major = np.where(area > 0, 4 * np.sqrt(np.clip(half_sum + radius, 0, None)), 0.0)
+    minor = np.where(area > 0, 4 * np.sqrt(np.clip(half_sum - radius, 0, None)), 0.0)
+    return major, minor
+
+
+def convex_hulls(coords, offsets):
+    """所有轮廓的凸包（快速凸包算法，所有轮廓同时逐轮处理）
+
+    以每个轮廓按(x, y)字典序最小和最大的两点分出两条初始边，每轮对每条边取外侧最远的点作为新的凸包顶点，
+    把边分成两条，落在新三角形内的点不再参与后续各轮。全部计算为整数运算，结果与cv2.convexHull的顶点相同。
+    返回 (hull_x, hull_y, hull_offsets)：第i个轮廓的凸包顶点为 hull_x/hull_y[hull_offsets[i]:hull_offsets[i + 1]]，
+    按绕凸包内一点的角度递增排列；所有点共线时凸包只有两个端点，单点轮廓只有一个顶点。
+    """
+    count = len(offsets) - 1
+    starts = offsets[:-1]
+    lengths = np.diff(offsets)
+    x, y = coords[:, 0], coords[:, 1]
+    y_min, y_max = np.minimum.reduceat(y, starts), np.maximum.reduceat(y, starts)
+    extent = max(int((np.maximum.reduceat(x, starts) - np.minimum.reduceat(x, starts)).max()),
+                 int((y_max - y_min).max()))
+    # 坐标相对于各轮廓的点，叉积不超过 2×extent²，轮廓较小时用int32减少内存带宽
+    dtype = np.int32 if extent < 2 ** 15 else np.int64
+    # 字典序最小、最大的点 A、B 必为凸包顶点
+    base_y = int(y_min.min())
+    span = int(y_max.max()) - base_y + 1
+    key = x.astype(np.int64) * span + (y - base_y)
+    low, high = np.minimum.reduceat(key, starts), np.maximum.reduceat(key, starts)
+    ax, ay = (low // span).astype(dtype), (low % span + base_y).astype(dtype)
+    bx, by = (high // span).astype(dtype), (high % span + base_y).astype(dtype)
+    distinct = np.flatnonzero(low != high)
+    hull_owner, hull_x, hull_y = [np.arange(count), distinct], [ax, bx[distinct]], [ay, by[distinct]]
+
+    # 边 2i 为 A→B，2i+1 为 B→A；每个候选点保存所属边、相对边起点的坐标和到边的有向距离（叉积，外侧为正）
+    edge_x, edge_y = np.stack([ax, bx], 1).ravel(), np.stack([ay, by], 1).ravel()
+    edge_dx, edge_dy = np.stack([bx - ax, ax - bx], 1).ravel(), np.stack([by - ay, ay - by], 1).ravel()
+    edge_owner = np.repeat(np.arange(count), 2)
+    rx = x.astype(dtype) - np.repeat(ax, lengths)
+    ry = y.astype(dtype) - np.repeat(ay, lengths)
+    cross = np.repeat(bx - ax, lengths) * ry - np.repeat(by - ay, lengths) * rx
+    right = cross < 0
+    edge = 2 * np.repeat(np.arange(count, dtype=np.int64), lengths) + right
+    # 在直线AB上的点不是凸包顶点，排到最后丢弃
+    edge[cross == 0] = 2 * count
+    order = np.argsort(edge, kind='stable')[:np.count_nonzero(cross)]
+    edge, right = edge[order], right[order]
+    rx = rx[order] - np.where(right, edge_dx[edge - right], 0).astype(dtype)
+    ry = ry[order] - np.where(right, edge_dy[edge - right], 0).astype(dtype)
+    cross = np.abs(cross[order])
+
+    while len(edge):
+        first = np.flatnonzero(np.r_[True, edge[1:] != edge[:-1]])
+        counts = np.diff(np.r_[first, len(edge)])
+        active = edge[first]
+        # 每条边外侧最远的点 F（并列时取第一个）
+        farthest = np.maximum.reduceat(cross, first)
+        farthest_rep = np.repeat(farthest, counts)
+        hits = np.flatnonzero(cross == farthest_rep)
+        pick = hits[np.r_[True, edge[hits[1:]] != edge[hits[:-1]]]]
+        fx, fy = rx[pick], ry[pick]
+        px, py = edge_x[active], edge_y[active]
+        hull_owner.append(edge_owner[active])
+        hull_x.append(px + fx)
+        hull_y.append(py + fy)
+        # 边 P→Q 分为 P→F 和 F→Q，点到两条新边的有向距离由到原边的距离递推
+        fx_rep, fy_rep = np.repeat(fx, counts), np.repeat(fy, counts)
+        outside_first = fx_rep * ry - fy_rep * rx
+        outside_second = cross - outside_first - farthest_rep
+        right = outside_second > 0
+        edge = 2 * np.repeat(np.arange(len(first)), counts) + right
+        edge[(outside_first <= 0) & ~right] = 2 * len(first)
+        order = np.argsort(edge, kind='stable')[:np.count_nonzero(edge < 2 * len(first))]
+        edge, right = edge[order], right[order]
+        rx = rx[order] - fx_rep[order] * right
+        ry = ry[order] - fy_rep[order] * right
+        cross = np.where(right, outside_second[order], outside_first[order])
+        edge_x, edge_y = np.stack([px, px + fx], 1).ravel(), np.stack([py, py + fy], 1).ravel()
+        edge_dx = np.stack([fx, edge_dx[active] - fx], 1).ravel()
+        edge_dy = np.stack([fy, edge_dy[active] - fy], 1).ravel()
+        edge_owner = np.repeat(edge_owner[active], 2)
+
+    # 各轮廓的凸包顶点按绕顶点平均位置的角度排序
+    owner = np.concatenate(hull_owner)
+    hull_x = np.concatenate(hull_x).astype(np.float64)
+    hull_y = np.concatenate(hull_y).astype(np.float64)
+    sizes = np.bincount(owner, minlength=count)
+    center_x = np.bincount(owner, hull_x, minlength=count) / sizes
+    center_y = np.bincount(owner, hull_y, minlength=count) / sizes
+    order = np.argsort(owner * 8.0 + np.arctan2(hull_y - center_y[owner], hull_x - center_x[owner]))
+    hull_offsets = np.zeros(count + 1, dtype=np.int64)
+    np.cumsum(sizes, out=hull_offsets[1:])
+    return hull_x[order], hull_y[order], hull_offsets
+
+
+def feret_diameters(coords, offsets):
+    """每个轮廓的最小和最大卡尺直径（旋转卡壳，精确值）
+
+    卡尺直径只取决于凸包。最小宽度必在某条凸包边与其对踵顶点之间取得，最大直径必在某对对踵顶点之间取得；
+    每条边的对踵顶点按边方向角在同一凸包各边方向角中二分查找，所有轮廓一次完成，不逐个轮廓循环。
+    顶点少于3个（共线或单点）的轮廓最小直径为0。
+    """
+    x, y, hull_offsets = convex_hulls(coords, offsets)
+    count = len(hull_offsets) - 1
+    starts = hull_offsets[:-1]
+    sizes = np.diff(hull_offsets)
+    owner = np.repeat(np.arange(count), sizes)
+    following = np.arange(1, len(x) + 1)
+    following[hull_offsets[1:] - 1] = starts
+    preceding = np.arange(-1, len(x) - 1)
+    preceding[starts] = hull_offsets[1:] - 1
+    dx, dy = x[following] - x, y[following] - y
+    # 凸包各边方向角按顶点顺序单调递增，跨过±π处加2π展开，再以每个凸包第一条边为0
+    angle = np.arctan2(dy, dx)
+    wrapped = np.r_[False, angle[1:] < angle[:-1]]
+    wrapped[starts] = False
+    turns = np.cumsum(wrapped)
+    angle = angle + 2 * np.pi * (turns - np.repeat(turns[starts], sizes)) - np.repeat(angle[starts], sizes)
+    # 与边i反向的方向角所在位置即对踵顶点，端点处有并列，检查其前后各一个顶点
+    opposite = angle + np.pi
+    opposite = np.where(opposite >= 2 * np.pi, opposite - 2 * np.pi, opposite)
+    antipode = np.searchsorted(owner * 8.0 + angle, owner * 8.0 + opposite)
+    antipode = np.where(antipode >= hull_offsets[owner + 1], antipode - sizes[owner], antipode)
+    height = np.zeros(len(x))
+    distance = np.zeros(len(x))
+    next_x, next_y = x[following], y[following]
+    for vertex in (preceding[antipode], antipode, following[antipode]):
+        vx, vy = x[vertex], y[vertex]
+        height = np.maximum(height, np.abs(dx * (vy - y) - dy * (vx - x)))
+        distance = np.maximum(distance, np.maximum((vx - x) ** 2 + (vy - y) ** 2,
+                                                   (vx - next_x) ** 2 + (vy - next_y) ** 2))
+    length = np.hypot(dx, dy)
+    width = np.where(length > 0, height / np.where(length > 0, length, 1), np.inf)
+    feret_min = np.where(sizes >= 3, np.minimum.reduceat(width, starts), 0.0)
+    feret_max = np.sqrt(np.maximum.reduceat(distance, starts))
+    return feret_min, feret_max
+
+
+class FeatureTable:
+    """检测对象的特征表
+
+    records为FEATURE_DTYPE的结构化数组，coords为所有轮廓的 M×2 int32 坐标，
+    offsets为长度N+1的偏移数组，第i个对象的轮廓为 coords[offsets[i]:offsets[i + 1]]。
+    """
+
+    def __init__(self, records, coords, offsets):
+        self.records = records
+        self.coords = coords
+        self.offsets = offsets
+
+    @classmethod
+    def from_contours(cls, contours, widths=None):
+        """由轮廓列表建立特征表
+
+        widths为可选的 (最小宽度, 最大宽度, 平均宽度) 元组列表，与轮廓一一对应（裂缝分析使用）。
+        """
+        count = len(contours)
+        lengths = np.fromiter((len(contour) for contour in contours), dtype=np.int64, count=count)
+        offsets = np.zeros(count + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        coords = (np.concatenate(contours).reshape(-1, 2).astype(np.int32, copy=False) if count
+                  else np.empty((0, 2), dtype=np.int32))
+
+        records = np.zeros(count, dtype=FEATURE_DTYPE)
+        records['id'] = np.arange(count)
+        table = cls(records, coords, offsets)
+        if count:
+            # 所有轮廓在连续的坐标数组上按段归约，一次计算全部对象
+            starts = offsets[:-1]
+            xs, ys = coords[:, 0], coords[:, 1]
+            x_min, y_min = np.minimum.reduceat(xs, starts), np.minimum.reduceat(ys, starts)
+            records['bbox_x'], records['bbox_y'] = x_min, y_min
+            records['bbox_w'] = np.maximum.reduceat(xs, starts) - x_min + 1
+            records['bbox_h'] = np.maximum.reduceat(ys, starts) - y_min + 1
+            moments = polygon_moments(coords, offsets)
+            area = moments['m00']
+            perimeter = polygon_perimeters(coords, offsets)
+            # 面积为0的轮廓（线段或单点）质心取顶点的平均值
+            safe_area = np.where(area > 0, area, 1)
+            mean_x = np.add.reduceat(xs.astype(np.float64), starts) / lengths
+            mean_y = np.add.reduceat(ys.astype(np.float64), starts) / lengths
+            records['centroid_x'] = np.where(area > 0, moments['m10'] / safe_area, mean_x)
+            records['centroid_y'] = np.where(area > 0, moments['m01'] / safe_area, mean_y)
+            records['area'] = area
+            records['perimeter'] = perimeter
+            records['circularity'] = np.where(perimeter > 0, (4 * np.pi * area) / (perimeter ** 2 + 1e-10), 0.0)
+            records['orientation'] = _orientation(moments)
+            records['equivalent_diameter'] = np.sqrt(4 * area / np.pi)
+            major, minor = ellipse_axes(moments)
+            records['major_axis'], records['minor_axis'] = major, minor
+            records['aspect_ratio'] = np.where(minor > 0, major / np.where(minor > 0, minor, 1), np.nan)
+            records['feret_min'], records['feret_max'] = feret_diameters(coords, offsets)
+        if widths is not None and count:
+            records['width_min'], records['width_max'], records['width_mean'] = np.asarray(widths, dtype=np.float64).T
+        else:
+            for name in ('width_min', 'width_max', 'width_mean'):
+                records[name] = np.nan
+        return table
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, name):
+        """按列名取得一列（数组视图）"""
+        return self.records[name]
+
+    @property
+    def columns(self):
+        return self.records.dtype.names
+
+    def contour(self, index):
+        """第index个对象的轮廓，形状为 n×1×2 的视图，可直接传给OpenCV"""
+        return self.coords[self.offsets[index]:self.offsets[index + 1]].reshape(-1, 1, 2)
+
+    def contours(self):
+        """所有对象的轮廓视图列表"""
+        return [self.contour(index) for index in range(len(self))]
+
+    def select(self, indices):
+        """取出部分对象组成新的特征表（indices为序号数组或布尔掩码），id按新表中的位置重新编号"""
+        indices = np.asarray(indices)
+        indices = np.flatnonzero(indices) if indices.dtype == bool else indices.astype(np.int64)
+        lengths = self.offsets[indices + 1] - self.offsets[indices]
+        offsets = np.zeros(len(indices) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        # 每个坐标在原数组中的位置：所在对象的原起点 + 在对象内的序号
+        positions = np.repeat(self.offsets[indices] - offsets[:-1], lengths) + np.arange(offsets[-1])
+        records = self.records[indices]
+        records['id'] = np.arange(len(indices))
+        return FeatureTable(records, self.coords[positions], offsets)
+
+    def translate(self, dx, dy):
+        """所有坐标平移 (dx, dy) 后的新特征表（例如把分块内的坐标换算为整幅图像的坐标）"""
+        records = self.records.copy()
+        records['bbox_x'] += dx
+        records['bbox_y'] += dy
+        records['centroid_x'] += dx
+        records['centroid_y'] += dy
+        return FeatureTable(records, self.coords + np.array([dx, dy], dtype=self.coords.dtype), self.offsets)
+
+    @property
+    def nbytes(self):
+        return self.records.nbytes + self.coords.nbytes + self.offsets.nbytes
+
+    def to_npz(self, path):
+        """保存为.npz文件（不压缩，数组直接写出）"""
+        np.savez(path, records=self.records, coords=self.coords, offsets=self.offsets)
+
+    @classmethod
+    def load_npz(cls, path):
+        """读取to_npz保存的特征表"""
+        with np.load(path) as data:
+            return cls(data['records'], data['coords'], data['offsets'])
+
+    def to_arrow(self):
+        """转换为pyarrow.Table，轮廓坐标和偏移直接引用numpy数组的内存，各数值列复制为连续的Arrow数组
+
+        轮廓列contour为 large_list<fixed_size_list<int32, 2>>，即每个对象的 [x, y] 坐标列表。
+        """
+        try:
+            import pyarrow as pa
+        except ImportError as e:
+            raise RuntimeError("导出Parquet需要安装pyarrow：pip install pyarrow") from e
+        columns = {name: pa.array(self.records[name]) for name in self.columns}
+        points = pa.FixedSizeListArray.from_arrays(pa.array(self.coords.reshape(-1)), 2)
+        columns['contour'] = pa.LargeListArray.from_arrays(pa.array(self.offsets), points)
+        return pa.table(columns)
+
+    def to_parquet(self, path):
+        """保存为Parquet文件（需要安装pyarrow）"""
+        table = self.to_arrow()
+        import pyarrow.parquet as pq
+        pq.write_table(table, path)
+
+    def to_csv(self, path):
+        """保存各列为CSV文件（不含轮廓坐标），使用带BOM的UTF-8便于Excel打开"""
+        with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(self.columns)
+            writer.writerows(self.records.tolist())
+
+    def save(self, path):
+        """按扩展名（.npz、.parquet、.csv）保存特征表"""
+        lower = path.lower()
+        if lower.endswith('.parquet'):
+            self.to_parquet(path)
+        elif lower.endswith('.csv'):
+            self.to_csv(path)
+        elif lower.endswith('.npz'):
+            self.to_npz(path)
+        else:
+            raise ValueError(f"不支持的特征表文件格式: {path}，可选 .npz、.parquet、.csv")
+
+
+def table_from_output(analysis_type, output):
+    """从分析函数的返回值中取得对象特征表，没有时返回None
+
+    裂缝分析返回结果字典，孔洞和粒度分析返回 (结果, 灰度图, 二值图, 标记图)。
+    """
+    result = output if analysis_type == 'crack' else output[0]
+    return result.get('对象表') if isinstance(result, dict) else None
@@ -3,48 +3,127 @@
 import cv2
 # numpy是Python的一个科学计算库，用于处理数组和矩阵
 import numpy as np
+# tiling用于将大图像分块并行处理
+import tiling
+# buffer_pool用于复用中间数组
+from buffer_pool import take, give
+# overlay用于绘制标记图
+import overlay
+# feature_table用于保存每个颗粒的特征
+from feature_table import FeatureTable
+# grain_size用于计算粒度分布和分选统计
+from grain_size import grain_size_statistics
+# grain_separation用于分离粘连的颗粒
+from grain_separation import separate_touching
+
+# 颗粒二值化各步骤的邻域影响半径之和：5x5中值滤波2 + 3x3开运算2
+GRAIN_BINARY_HALO = 4
+
+
+# 定义颗粒滤波函数
+# 滤波与阈值无关，调整阈值预览时可以缓存滤波结果
+# dst为可选的输出数组（来自缓冲池）
+def grain_blur(gray, dst=None):
+    # 使用中值滤波去除噪声
+    # 中值滤波可以有效地去除椒盐噪声
+    return cv2.medianBlur(gray, 5, dst=dst)
+
+
+# 定义颗粒阈值与开运算函数
+# pool为可选的缓冲池，输出数组从缓冲池取得
+def grain_threshold(blurred, threshold_val, pool=None):
+    # 使用固定阈值进行二值化
+    # 二值化将图像转换为只有0和255两种像素值的图像
+    _, binary = cv2.threshold(blurred, threshold_val, 255, cv2.THRESH_BINARY_INV,
+                              dst=take(pool, blurred.shape))
+
+    # 使用开操作去除小颗粒
+    # 开操作先腐蚀后膨胀，可以去除小的噪声点；原地执行，不再分配新数组
+    kernel = np.ones((3, 3), np.uint8)
+    return cv2.morphologyEx(binary, cv2.MORPH_OPEN, kernel, dst=binary, iterations=1)
+
+
+# 定义颗粒二值化函数
+# 滤波、阈值和开运算都是邻域操作，可以对整幅灰度图或带边缘的分块执行
+def grain_binary(gray, threshold_val, pool=None):
+    blurred = grain_blur(gray, take(pool, gray.shape))
+    opened = grain_threshold(blurred, threshold_val, pool)
+    # 滤波图只是中间结果，归还缓冲池
+    give(pool, blurred)
+    return opened
+
 
 # 定义粒度分析函数
 # 该函数用于分析图像中的颗粒，输入参数包括图像、阈值、最小面积和最大面积
-def analyze_grains(image, threshold_val=120, min_area=5, max_area=5000):
+# gray为可选的预先计算好的灰度图，多个分析共用同一幅图像时可避免重复转换
+# parallel为True时将图像分块，在max_workers个线程中并行处理，结果与串行模式完全相同
+# progress为可选的进度回调progress(进度0~1, 说明)，后台任务可在回调中抛出异常以取消分析
+# pool为可选的缓冲池（buffer_pool.BufferPool），中间数组从中取得并归还；
+# 返回的灰度图、二值图和结果图同样来自缓冲池，调用者用完后可以归还
+# render为False时只测量不绘制，返回的结果图为None，需要时可用overlay.render('grain', image, 结果['轮廓列表'])绘制
+# pixel_size为每像素的长度（毫米），用于换算粒度统计中的φ值和D10/D50/D90
+# separate为True时对凸度低的轮廓做分水岭分割，分离相互接触的颗粒（grain_separation.separate_touching），
+# 返回的二值图中被分割的颗粒团沿分割线断开，连通区域与颗粒轮廓一致
+def analyze_grains(image, threshold_val=120, min_area=5, max_area=5000, gray=None,
+                   parallel=False, tile_size=tiling.DEFAULT_TILE_SIZE, max_workers=None, progress=None,
+                   pool=None, render=True, pixel_size=1.0, separate=False):
     # 如果输入图像为空，返回空字典和None值
     if image is None:
         return {}, None, None, None
 
+    # 未提供进度回调时使用空函数
+    progress = progress or (lambda fraction, message='': None)
+
     # 将图像转换为灰度图
     # 灰度图只包含一个通道，便于后续处理
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    # 使用中值滤波去除噪声
-    # 中值滤波可以有效地去除椒盐噪声
-    blurred = cv2.medianBlur(gray, 5)
-    # 使用固定阈值进行二值化
-    # 二值化将图像转换为只有0和255两种像素值的图像
-    _, binary = cv2.threshold(blurred, threshold_val, 255, cv2.THRESH_BINARY_INV)
+    progress(0.0, "灰度转换")
+    if gray is None:
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY, dst=take(pool, image.shape[:2]))
 
-    # 使用开操作去除小颗粒
-    # 开操作先腐蚀后膨胀，可以去除小的噪声点
-    kernel = np.ones((3, 3), np.uint8)
-    opened = cv2.morphologyEx(binary, cv2.MORPH_OPEN, kernel, iterations=1)
+    progress(0.1, "二值化与轮廓查找")
+    if parallel:
+        # 分块并行执行二值化、轮廓查找和面积测量
+        with tiling.make_executor(max_workers) as executor:
+            opened = tiling.apply_tiled(gray, lambda tile: grain_binary(tile, threshold_val, pool),
+                                        GRAIN_BINARY_HALO, executor, tile_size, pool=pool)
+            contours, areas_all = tiling.find_contours_tiled(opened, executor, tile_size, measure=cv2.contourArea)
+    else:
+        # 滤波、阈值和开运算处理
+        opened = grain_binary(gray, threshold_val, pool)
 
-    # 查找轮廓
-    # 轮廓是图像中连续的点集，代表物体的边界
-    contours, _ = cv2.findContours(opened, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    # 复制原始图像用于绘制结果
-    result_img = image.copy()
+        # 查找轮廓
+        # 轮廓是图像中连续的点集，代表物体的边界
+        contours, _ = cv2.findContours(opened, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        # 计算每个轮廓的面积
+        areas_all = [cv2.contourArea(cnt) for cnt in contours]
+    # 被分割的粘连颗粒团数
+    merged_count = 0
+    if separate:
+        progress(0.4, "粘连颗粒分离")
+        # 只分割分开后每部分仍可能不小于最小面积的轮廓；各颗粒团在线程池中并行处理
+        contours, areas_all, merged_count = separate_touching(contours, areas_all, min_area=2 * min_area,
+                                                              max_workers=max_workers, binary=opened)
     # 初始化面积列表
     areas = []
+    # 初始化符合条件的颗粒轮廓列表
+    grain_contours = []
 
-    # 遍历每个轮廓
-    for cnt in contours:
-        # 计算轮廓面积
-        area = cv2.contourArea(cnt)
+    # 遍历每个轮廓及其面积
+    for index, (cnt, area) in enumerate(zip(contours, areas_all)):
+        # 每处理一批轮廓报告一次进度
+        if index % 256 == 0:
+            progress(0.5 + 0.5 * index / len(contours), "颗粒测量与标记")
         # 筛选面积在指定范围内的颗粒
         if min_area <= area <= max_area:
             # 将符合条件的面积添加到面积列表中
             areas.append(area)
-            # 在结果图中标记颗粒
-            # 绘制蓝色的轮廓线
-            cv2.drawContours(result_img, [cnt], -1, (255, 0, 0), 1)
+            # 记录轮廓，测量完成后统一绘制
+            grain_contours.append(cnt)
+
+    # 每个颗粒一行的特征表，轮廓改为引用特征表中连续存放的坐标
+    table = FeatureTable.from_contours(grain_contours)
+    grain_contours = table.contours()
+    aspect = table['aspect_ratio']
 
     # 计算分析结果
     result = {
@@ -52,9 +131,25 @@ def analyze_grains(image, threshold_val=120, min_area=5, max_area=5000):
         "粒子数量": len(areas),
         # 平均面积，如果面积列表为空则为0
         "平均面积": np.mean(areas) if areas else 0,
+        # 等效圆直径（像素）的平均值
+        "平均等效直径": np.mean(table['equivalent_diameter']) if areas else 0,
+        # 等效椭圆长宽比的平均值（不计短轴为0的颗粒）
+        "平均长宽比": np.mean(aspect[np.isfinite(aspect)]) if np.isfinite(aspect).any() else 0,
+        # 分水岭分割的粘连颗粒团数（未启用分离时为0）
+        "粘连颗粒团数": merged_count,
+        # 按等效圆直径计算的φ累积曲线、D10/D50/D90和Folk & Ward统计量（grain_size.grain_size_statistics）
+        "粒度统计": grain_size_statistics(table['equivalent_diameter'], pixel_size)[0],
         # 面积列表
-        "面积列表": areas
+        "面积列表": areas,
+        # 与面积列表一一对应的颗粒轮廓
+        "轮廓列表": grain_contours,
+        # 与面积列表一一对应的颗粒特征表（feature_table.FeatureTable）
+        "对象表": table
     }
 
+    # 在原图副本上绘制蓝色的颗粒轮廓
+    result_img = overlay.render('grain', image, grain_contours, pool) if render else None
+
+    progress(1.0, "完成")
     # 返回分析结果和中间图像
     return result, gray, opened, result_img
\ No newline at end of file
@@ -0,0 +1,115 @@
+# 粘连颗粒分离
+# 开运算之后相互接触的颗粒仍连成一个轮廓，面积被高估。这里只处理疑似粘连的轮廓（凸度低且足够大），
+# 在每个轮廓的外接矩形裁剪区域内做距离变换和分水岭分割（skimage.segmentation.watershed），
+# 再把分开的各部分轮廓换算回整幅图像坐标。
+# 计算量只与粘连颗粒团的数量和大小有关，与图像尺寸无关；各颗粒团在线程池中并行处理
+import cv2
+import numpy as np
+from skimage.segmentation import watershed
+
+import tiling
+
+# 凸度（轮廓面积/凸包面积）低于该值的轮廓视为可能由多个颗粒粘连而成，是否分割最终由种子数决定
+DEFAULT_MIN_SOLIDITY = 0.95
+# 距离变换的局部极大值高出其与更高极大值之间鞍部至少该像素数时才作为一个颗粒的种子（h-极大值）
+DEFAULT_MIN_PROMINENCE = 1.0
+# 3x3结构元素，用于形态学重建
+_KERNEL = np.ones((3, 3), np.uint8)
+
+
+def solidity(contour, area=None):
+    """轮廓面积与其凸包面积之比，凸包面积为0时返回1"""
+    area = cv2.contourArea(contour) if area is None else area
+    hull_area = cv2.contourArea(cv2.convexHull(contour))
+    return area / hull_area if hull_area > 0 else 1.0
+
+
+def find_merged(contours, areas, min_solidity=DEFAULT_MIN_SOLIDITY, min_area=0):
+    """疑似粘连的轮廓序号：面积不小于min_area且凸度低于min_solidity"""
+    return [index for index, (contour, area) in enumerate(zip(contours, areas))
+            if area >= min_area and solidity(contour, area) < min_solidity]
+
+
+def h_maxima(image, h):
+    """突出度不小于h的区域极大值（布尔数组），由 image-h 在image之下的形态学重建得到"""
+    reconstructed = image - h
+    while True:
+        grown = np.minimum(cv2.dilate(reconstructed, _KERNEL), image)
+        if np.array_equal(grown, reconstructed):
+            break
+        reconstructed = grown
+    return image - reconstructed >= h - 1e-3
+
+
+def split_component(contour, min_prominence=DEFAULT_MIN_PROMINENCE, binary=None):
+    """在外接矩形裁剪区域内用分水岭分割一个颗粒团，返回各部分的轮廓列表（整幅图像坐标）
+
+    只找到一个种子时不分割，返回None。binary为可选的整幅二值图，分割成功时原地把分割线和
+    舍弃的零碎像素置0，使其中的连通区域与返回的各部分轮廓一致。
+    """
+    x, y, w, h = cv2.boundingRect(contour)
+    # 四周各留1像素，使距离变换在裁剪边界处正确
+    mask = np.zeros((h + 2, w + 2), np.uint8)
+    cv2.drawContours(mask, [contour], -1, 255, -1, offset=(1 - x, 1 - y))
+    distance = cv2.distanceTransform(mask, cv2.DIST_L2, cv2.DIST_MASK_PRECISE)
+    seeds = (h_maxima(distance, min_prominence) & (mask > 0)).astype(np.uint8)
+    count, markers = cv2.connectedComponents(seeds)
+    if count <= 2:
+        return None
+    # 在距离变换的负值上按高度淹没，只在颗粒团内部分割（cv2.watershed按相邻像素的颜色差淹没，
+    # 坡度均匀的地形上光栅顺序靠前的种子会占据几乎整个颗粒团，不能用于这里）
+    markers = watershed(-distance, markers, mask=mask > 0)
+    # 分割线：与序号更小的标记8邻接的像素，置0后各部分互不连通
+    lowest = markers.astype(np.float32)
+    lowest[markers == 0] = count
+    markers[cv2.erode(lowest, _KERNEL) < markers] = 0
+    pieces = []
+    kept = np.zeros_like(mask)
+    for label in range(1, count):
+        region = (markers == label).astype(np.uint8)
+        found, _ = cv2.findContours(region, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        if found:
+            # 每个种子只取最大的部分（防止斜向相连的零碎像素）
+            largest = max(found, key=cv2.contourArea)
+            cv2.drawContours(kept, [largest], -1, 255, -1)
+            pieces.append(largest + np.array([x - 1, y - 1], dtype=largest.dtype))
+    if len(pieces) <= 1:
+        return None
+    if binary is not None:
+        rows, cols = np.nonzero((mask > 0) & (kept == 0))
+        binary[rows + y - 1, cols + x - 1] = 0
+    return pieces
+
+
+def separate_touching(contours, areas, min_solidity=DEFAULT_MIN_SOLIDITY, min_area=0,
+                      min_prominence=DEFAULT_MIN_PROMINENCE, executor=None, max_workers=None, binary=None):
+    """分离粘连的颗粒，返回 (轮廓列表, 面积列表, 被分割的颗粒团数)
+
+    未粘连的轮廓原样保留，被分割的轮廓在原位置替换为各部分的轮廓。min_area为参与分割的最小面积
+    （通常取颗粒最小面积的2倍）。executor为可选的线程池，未提供且存在粘连颗粒团时临时创建。
+    binary为可选的整幅二值图，被分割的颗粒团在其中沿分割线原地断开（见split_component）；
+    各颗粒团互不重叠，线程池中并行写入不会冲突。
+    """
+    merged = find_merged(contours, areas, min_solidity, min_area)
+    if not merged:
+        return list(contours), list(areas), 0
+    split = lambda index: split_component(contours[index], min_prominence, binary)
+    if executor is None and len(merged) > 1:
+        with tiling.make_executor(max_workers) as own_executor:
+            results = list(own_executor.map(split, merged))
+    elif executor is None:
+        results = [split(merged[0])]
+    else:
+        results = list(executor.map(split, merged))
+
+    pieces_by_index = {index: pieces for index, pieces in zip(merged, results) if pieces}
+    separated_contours, separated_areas = [], []
+    for index, (contour, area) in enumerate(zip(contours, areas)):
+        pieces = pieces_by_index.get(index)
+        if pieces is None:
+            separated_contours.append(contour)
+            separated_areas.append(area)
+        else:
+            separated_contours.extend(pieces)
+            separated_areas.extend(cv2.contourArea(piece) for piece in pieces)
+    return separated_contours, separated_areas, len(pieces_by_index)
@@ -0,0 +1,241 @@
+# 粒度分布统计
+# 由颗粒等效圆直径计算φ标度的累积粒度曲线、D10/D50/D90和Folk & Ward图解法的
+# 平均粒径、分选系数、偏度和峰度。单幅图像用np.partition一次取出所需的全部顺序统计量，
+# 不做完整排序；多幅图像在固定的φ分箱上累加计数直方图进行合并，不拼接原始面积列表
+import argparse
+import json
+import sys
+
+import numpy as np
+
+# φ分箱的范围和宽度，所有直方图使用同一组分箱，相加即可合并
+PHI_MIN = -12.0
+PHI_MAX = 12.0
+PHI_BIN_WIDTH = 0.1
+PHI_EDGES = np.linspace(PHI_MIN, PHI_MAX, int(round((PHI_MAX - PHI_MIN) / PHI_BIN_WIDTH)) + 1)
+# Folk & Ward公式和D10/D50/D90需要的累积百分比（由粗到细）
+PERCENTS = (5, 10, 16, 25, 50, 75, 84, 90, 95)
+# Folk & Ward分选等级：(分选系数上限, 等级)
+SORTING_CLASSES = (
+    (0.35, '极好'),
+    (0.50, '好'),
+    (0.71, '较好'),
+    (1.00, '中等'),
+    (2.00, '差'),
+    (4.00, '很差'),
+    (np.inf, '极差'),
+)
+
+
+def phi_scale(diameters, pixel_size=1.0):
+    """直径（像素）换算为φ值：φ = -log2(直径 × pixel_size)，pixel_size为每像素的毫米数"""
+    diameters = np.asarray(diameters, dtype=np.float64) * pixel_size
+    return -np.log2(diameters[diameters > 0])
+
+
+def sorting_class(sorting):
+    """分选系数对应的Folk & Ward分选等级"""
+    for upper, name in SORTING_CLASSES:
+        if sorting < upper:
+            return name
+    return SORTING_CLASSES[-1][1]
+
+
+def folk_ward(phi):
+    """由累积百分比对应的φ值字典计算 (平均粒径, 分选系数, 偏度, 峰度)"""
+    mean = (phi[16] + phi[50] + phi[84]) / 3
+    sorting = (phi[84] - phi[16]) / 4 + (phi[95] - phi[5]) / 6.6
+    inner, outer = phi[84] - phi[16], phi[95] - phi[5]
+    # 所有颗粒粒径相同时分布没有偏斜，偏度取0；峰度无定义，取None
+    skewness = ((phi[16] + phi[84] - 2 * phi[50]) / (2 * inner) if inner > 0 else 0.0) + \
+               ((phi[5] + phi[95] - 2 * phi[50]) / (2 * outer) if outer > 0 else 0.0)
+    spread = phi[75] - phi[25]
+    kurtosis = outer / (2.44 * spread) if spread > 0 else None
+    return mean, sorting, skewness, kurtosis
+
+
+def _summary(count, phi, curve_phi, curve_percent):
+    """由累积百分比对应的φ值和累积曲线组成统计结果字典"""
+    mean, sorting, skewness, kurtosis = folk_ward(phi)
+    # D10为10%的颗粒比它细的粒径，对应由粗到细累积90%处的φ值；2^-φ即为与pixel_size相同单位的粒径
+    to_diameter = lambda value: float(2.0 ** -value)
+    return {
+        '颗粒数': int(count),
+        'D10': to_diameter(phi[90]),
+        'D50': to_diameter(phi[50]),
+        'D90': to_diameter(phi[10]),
+        '平均粒径φ': float(mean),
+        '分选系数': float(sorting),
+        '偏度': float(skewness),
+        '峰度': float(kurtosis) if kurtosis is not None else None,
+        '分选等级': sorting_class(sorting),
+        # 由粗到细的累积曲线：小于等于各φ值（粒径不小于2^-φ）的颗粒百分比
+        '累积曲线': {'φ': [round(float(value), 4) for value in curve_phi],
+                     '累积百分比': [round(float(value), 3) for value in curve_percent]},
+    }
+
+
+class GrainSizeHistogram:
+    """固定φ分箱（PHI_EDGES）上的颗粒计数直方图
+
+    超出范围的φ值计入两端的分箱。不同图像、不同进程的直方图相加即为合并后的分布，
+    百分位数在分箱内线性插值，误差不超过一个分箱宽度。
+    """
+
+    def __init__(self, counts=None):
+        self.counts = (np.zeros(len(PHI_EDGES) - 1, dtype=np.int64) if counts is None
+                       else np.asarray(counts, dtype=np.int64).copy())
+
+    @classmethod
+    def from_phi(cls, phi):
+        return cls().add(phi)
+
+    def add(self, phi):
+        """加入一组φ值，返回自身"""
+        index = np.clip(((np.asarray(phi) - PHI_MIN) / PHI_BIN_WIDTH).astype(np.int64), 0, len(self.counts) - 1)
+        self.counts += np.bincount(index, minlength=len(self.counts))
+        return self
+
+    def __iadd__(self, other):
+        self.counts += other.counts
+        return self
+
+    def __add__(self, other):
+        return GrainSizeHistogram(self.counts + other.counts)
+
+    @property
+    def count(self):
+        return int(self.counts.sum())
+
+    def percentiles(self, percents=PERCENTS):
+        """由粗到细累积百分比对应的φ值字典（分箱内线性插值）"""
+        cumulative = np.cumsum(self.counts)
+        result = {}
+        for percent in percents:
+            target = cumulative[-1] * percent / 100
+            index = min(int(np.searchsorted(cumulative, target, side='left')), len(self.counts) - 1)
+            before = cumulative[index - 1] if index else 0
+            fraction = (target - before) / self.counts[index] if self.counts[index] else 0.0
+            result[percent] = float(PHI_EDGES[index] + fraction * PHI_BIN_WIDTH)
+        return result
+
+    def cumulative(self):
+        """有颗粒的φ范围内的累积曲线 (各分箱右边界的φ值, 累积百分比)"""
+        occupied = np.flatnonzero(self.counts)
+        if not len(occupied):
+            return np.empty(0), np.empty(0)
+        first, last = occupied[0], occupied[-1] + 1
+        percent = np.cumsum(self.counts)[first:last] * 100.0 / self.count
+        return PHI_EDGES[first + 1:last + 1], percent
+
+    def statistics(self):
+        """合并后分布的统计结果，格式与grain_size_statistics相同"""
+        if not self.count:
+            return {'颗粒数': 0}
+        return _summary(self.count, self.percentiles(), *self.cumulative())
+
+    def to_dict(self):
+        """可序列化为JSON的字典，只保存有颗粒的分箱"""
+        occupied = np.flatnonzero(self.counts)
+        first = int(occupied[0]) if len(occupied) else 0
+        last = int(occupied[-1]) + 1 if len(occupied) else 0
+        return {'phi_min': PHI_MIN, 'bin_width': PHI_BIN_WIDTH, 'first_bin': first,
+                'counts': self.counts[first:last].tolist()}
+
+    @classmethod
+    def from_dict(cls, data):
+        if data['phi_min'] != PHI_MIN or data['bin_width'] != PHI_BIN_WIDTH:
+            raise ValueError("直方图的φ分箱与当前设置不一致，无法合并")
+        histogram = cls()
+        first = data['first_bin']
+        histogram.counts[first:first + len(data['counts'])] = data['counts']
+        return histogram
+
+    def save(self, path):
+        """保存为JSON文件：合并后的统计结果和可再次合并的直方图"""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'统计': self.statistics(), '直方图': self.to_dict()},
+                      f, ensure_ascii=False, indent=1)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding='utf-8') as f:
+            return cls.from_dict(json.load(f)['直方图'])
+
+
+def grain_size_statistics(diameters, pixel_size=1.0):
+    """单幅图像颗粒的粒度统计，返回 (统计结果字典, GrainSizeHistogram)
+
+    diameters为颗粒等效圆直径（像素），pixel_size为每像素的长度（毫米），D10/D50/D90与其单位相同。
+    百分位数由np.partition一次取出的顺序统计量线性插值得到（与np.percentile一致），累积曲线来自直方图。
+    """
+    phi = phi_scale(diameters, pixel_size)
+    histogram = GrainSizeHistogram.from_phi(phi)
+    count = len(phi)
+    if not count:
+        return {'颗粒数': 0}, histogram
+    positions = {percent: (count - 1) * percent / 100 for percent in PERCENTS}
+    # 线性插值用到的上下两个顺序统计量
+    kth = sorted({int(np.floor(p)) for p in positions.values()} | {int(np.ceil(p)) for p in positions.values()})
+    ordered = np.partition(phi, kth)
+    percentiles = {}
+    for percent, position in positions.items():
+        lower, upper = int(np.floor(position)), int(np.ceil(position))
+        percentiles[percent] = float(ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower))
+    return _summary(count, percentiles, *histogram.cumulative()), histogram
+
+
+def read_histograms(path):
+    """读取批量分析逐行写入的 {"path": 图像路径, "histogram": 直方图字典} JSONL文件
+
+    返回 {图像路径: GrainSizeHistogram}，同一图像出现多次时（中断后重新处理）只保留最后一行。
+    """
+    histograms = {}
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                histograms[record['path']] = GrainSizeHistogram.from_dict(record['histogram'])
+    return histograms
+
+
+def merge_files(paths):
+    """合并多个文件中的直方图：.jsonl为逐图像直方图（按图像路径去重），其他为save保存的合并结果"""
+    merged = GrainSizeHistogram()
+    per_image = {}
+    for path in paths:
+        if path.lower().endswith('.jsonl'):
+            per_image.update(read_histograms(path))
+        else:
+            merged += GrainSizeHistogram.load(path)
+    for histogram in per_image.values():
+        merged += histogram
+    return merged
+
+
+def main(argv=None):
+    """合并粒度直方图文件并输出统计结果"""
+    parser = argparse.ArgumentParser(description='地质岩心图文分析系统 - 粒度分布合并统计')
+    parser.add_argument('inputs', nargs='+', help='批量分析--grain-size-out写出的.jsonl文件或本工具输出的.json文件')
+    parser.add_argument('-o', '--output', help='保存合并后的统计结果和直方图（.json）')
+    args = parser.parse_args(argv)
+    try:
+        merged = merge_files(args.inputs)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"[粒度统计] 无法读取直方图: {e}")
+        return 2
+    statistics = merged.statistics()
+    if args.output:
+        merged.save(args.output)
+    try:
+        for key, value in statistics.items():
+            if key != '累积曲线':
+                print(f"{key}: {value:.4g}" if isinstance(value, float) else f"{key}: {value}")
+    except BrokenPipeError:
+        # 输出到head等提前退出的管道时静默结束
+        sys.stderr.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -17,9 +17,26 @@ plt.rcParams['axes.unicode_minus'] = False
 from hole_analysis import process_stone_holes  # 导入孔洞分析函数
 from crack_analysis import process_crack  # 导入裂缝分析函数
 from grain_analysis import analyze_grains  # 导入粒度分析函数
+from analysis_jobs import AnalysisJob, AnalysisCancelled  # 导入后台分析任务
+from canvas_blit import BlitManager  # 导入画布增量绘制
+from image_pyramid import PyramidView  # 导入多分辨率图像显示
+from live_preview import PreviewSession  # 导入参数实时预览
+from distribution_stats import summarize  # 导入分布统计
+from spatial_index import ObjectIndex  # 导入检测对象的空间索引
 
 
 class CoreAnalysisApp:
+    # 后台分析任务状态的轮询间隔（毫秒）
+    JOB_POLL_INTERVAL = 100
+    # 参数停止变化多久后执行预览（毫秒）
+    PREVIEW_DELAY = 150
+    # 各分析类型饼图的分组名称和标题
+    PIE_LABELS = {
+        'hole': (['小', '中', '大'], "孔洞大小分布"),
+        'crack': (['窄', '中', '宽'], "裂缝宽度分布"),
+        'grain': (['小', '中', '大'], "粒子大小分布"),
+    }
+
     def __init__(self):
         # 创建主窗口
         self.root = tk.Tk()
@@ -52,6 +69,12 @@ class CoreAnalysisApp:
         self.analysis_result = None  # 存储分析结果，初始为None
         self.analysis_type = None  # 存储分析类型，初始为None
         self.plot_type = 'histogram'  # 默认图表类型为柱状图
+        self.current_job = None  # 正在后台执行的分析任务，初始为None
+        self.preview_session = None  # 当前图像的预览会话，初始为None
+        self.preview_type = None  # 最近调整参数的分析类型，初始为None
+        self.preview_after_id = None  # 等待执行的预览定时器，初始为None
+        self.object_index = None  # 当前分析结果中检测对象的空间索引，初始为None
+        self.hovered_object = None  # 鼠标所在的对象序号，初始为None
 
         # 创建主框架
         self.main_frame = ttk.Frame(self.root)
@@ -191,6 +214,12 @@ class CoreAnalysisApp:
         # 将输入框放置在孔洞参数框架中
         self.hole_threshold.grid(row=2, column=1, sticky=tk.W, pady=2)
 
+        # 添加调整孔洞参数的滑块，拖动时实时预览
+        self.add_param_slider(hole_frame, 0, self.hole_min_area, 0, 1000, 'hole')
+        self.add_param_slider(hole_frame, 2, self.hole_threshold, 0, 255, 'hole')
+        # 直接修改孔洞最大面积后同样触发预览
+        self.hole_max_area.bind('<KeyRelease>', lambda event: self.schedule_preview('hole'))
+
         # 创建裂缝参数框架
         crack_frame = ttk.LabelFrame(control_frame, text="裂缝分析参数", padding=5)
         # 将裂缝参数框架放置在控制面板中
@@ -223,6 +252,40 @@ class CoreAnalysisApp:
         # 将输入框放置在裂缝参数框架中
         self.crack_threshold.grid(row=2, column=1, sticky=tk.W, pady=2)
 
+        # 添加调整裂缝参数的滑块，拖动时实时预览
+        self.add_param_slider(crack_frame, 0, self.crack_min_area, 0, 20000, 'crack')
+        self.add_param_slider(crack_frame, 2, self.crack_threshold, 0, 255, 'crack')
+        # 直接修改裂缝最大面积后同样触发预览
+        self.crack_max_area.bind('<KeyRelease>', lambda event: self.schedule_preview('crack'))
+
+        # 创建实时预览框架
+        preview_frame = ttk.LabelFrame(control_frame, text="实时预览", padding=5)
+        # 将实时预览框架放置在控制面板中
+        preview_frame.pack(fill=tk.X, pady=5)
+        # 创建实时预览开关，默认开启
+        self.preview_enabled = tk.BooleanVar(value=True)
+        ttk.Checkbutton(preview_frame, text="调整参数时预览", variable=self.preview_enabled).pack(anchor=tk.W, pady=2)
+        # 创建应用参数按钮，点击后对原图执行完整分析
+        ttk.Button(preview_frame, text="应用参数（完整分析）",
+                   command=lambda: self.run_analysis(self.preview_type or 'hole')).pack(fill=tk.X, pady=2)
+
+        # 创建分析任务框架
+        job_frame = ttk.LabelFrame(control_frame, text="分析进度", padding=5)
+        # 将分析任务框架放置在控制面板中
+        job_frame.pack(fill=tk.X, pady=5)
+        # 创建进度条
+        self.progress_bar = ttk.Progressbar(job_frame, mode='determinate', maximum=100, length=160)
+        self.progress_bar.pack(fill=tk.X, pady=2)
+        # 创建进度说明标签
+        self.progress_label = ttk.Label(job_frame, text="空闲")
+        self.progress_label.pack(anchor=tk.W, pady=2)
+        # 创建取消按钮，点击后调用cancel_analysis函数，没有任务时禁用
+        self.cancel_button = ttk.Button(job_frame, text="取消分析", command=self.cancel_analysis, state=tk.DISABLED)
+        self.cancel_button.pack(fill=tk.X, pady=2)
+        # 创建对象信息标签，显示鼠标所在对象的属性
+        self.object_label = ttk.Label(job_frame, text="", justify=tk.LEFT)
+        self.object_label.pack(anchor=tk.W, pady=2)
+
         # 创建右侧区域
         right_frame = ttk.Frame(self.main_frame)
         # 将右侧区域放置在网格布局中
@@ -258,6 +321,10 @@ class CoreAnalysisApp:
         self.canvas_widget = self.canvas.get_tk_widget()
         # 将组件放置在图像显示区域中
         self.canvas_widget.grid(row=0, column=0, sticky="nsew")
+        # 每个子图中按视野显示的多分辨率图像
+        self.panels = [None] * len(self.axes)
+        # 画笔、平移和缩放只增量重绘变化的部分，重绘子图前先更新其显示的图像级别和裁剪
+        self.blitter = BlitManager(self.canvas, before_redraw=self.update_panel)
 
         # 创建图表显示区域
         chart_frame = ttk.LabelFrame(right_frame, text="分析结果图表", padding=5)
@@ -301,11 +368,97 @@ class CoreAnalysisApp:
         self.canvas.mpl_connect('button_release_event', self.on_mouse_release)
         # 绑定鼠标移动事件，调用on_mouse_motion函数
         self.canvas.mpl_connect('motion_notify_event', self.on_mouse_motion)
+        # 绑定画布大小变化事件，屏幕像素大小变化后重新选择图像级别
+        self.canvas.mpl_connect('resize_event', self.on_canvas_resize)
 
         # 初始化移动状态
         self.press = None
 
+    def add_param_slider(self, frame, row, entry, from_, to, analysis_type):
+        # 在输入框右侧添加滑块，拖动滑块时更新输入框并安排预览
+        def on_slide(value):
+            entry.delete(0, tk.END)
+            entry.insert(0, str(int(float(value))))
+            self.schedule_preview(analysis_type)
+
+        slider = ttk.Scale(frame, from_=from_, to=to, orient=tk.HORIZONTAL, length=120)
+        try:
+            # 滑块初始位置与输入框的默认值一致
+            slider.set(float(entry.get()))
+        except ValueError:
+            pass
+        # 设置初始位置后再绑定回调，避免初始化时触发预览
+        slider.config(command=on_slide)
+        slider.grid(row=row, column=2, sticky=tk.W, padx=5, pady=2)
+        # 直接在输入框中修改参数后同样触发预览
+        entry.bind('<KeyRelease>', lambda event: self.schedule_preview(analysis_type))
+
+    def schedule_preview(self, analysis_type):
+        # 参数变化后延迟执行预览，连续调整时只预览最后一次
+        self.preview_type = analysis_type
+        if self.original_image is None or not self.preview_enabled.get():
+            return
+        if self.preview_after_id is not None:
+            self.root.after_cancel(self.preview_after_id)
+        self.preview_after_id = self.root.after(self.PREVIEW_DELAY, self.run_preview)
+
+    def run_preview(self):
+        # 在缩小的代理图像上重新分析，更新二值图和标记图
+        self.preview_after_id = None
+        if self.original_image is None:
+            return
+        # 打开新图像后重新建立预览会话
+        if self.preview_session is None or self.preview_session.image is not self.original_image:
+            self.preview_session = PreviewSession(self.original_image)
+        try:
+            if self.preview_type == 'hole':
+                max_area = float(self.hole_max_area.get()) if self.hole_max_area.get() != "inf" else np.inf
+                binary, marked, count = self.preview_session.hole(
+                    float(self.hole_min_area.get()), max_area, int(self.hole_threshold.get()))
+                summary = f"预览：孔洞 {count} 个"
+            else:
+                max_area = float(self.crack_max_area.get()) if self.crack_max_area.get() != "inf" else np.inf
+                binary, marked, count = self.preview_session.crack(
+                    float(self.crack_min_area.get()), max_area, int(self.crack_threshold.get()))
+                summary = f"预览：裂缝 {count} 条"
+        except ValueError:
+            # 参数正在输入中，格式不完整时不预览
+            self.progress_label.config(text="预览：参数格式有误")
+            return
+        # 更新二值图和标记图
+        self.show_panel(2, binary, cmap='gray')
+        self.axes[2].set_title("二值图（预览）")
+        self.show_panel(3, cv2.cvtColor(marked, cv2.COLOR_BGR2RGB))
+        self.axes[3].set_title("标记图（预览）")
+        self.canvas.draw_idle()
+        self.progress_label.config(text=summary)
+
+    def show_panel(self, index, image, cmap=None):
+        # 在第index个子图中显示图像，替换该子图原有的图像
+        self.clear_panel(index)
+        self.panels[index] = PyramidView(self.axes[index], image, cmap=cmap)
+
+    def clear_panel(self, index):
+        # 移除第index个子图中的图像和标题
+        if self.panels[index] is not None:
+            self.panels[index].remove()
+            self.panels[index] = None
+        self.axes[index].set_title("")
+
+    def update_panel(self, ax):
+        # 按子图当前的视野更新显示的图像级别和裁剪
+        panel = self.panels[self.axes.index(ax)]
+        if panel is not None:
+            panel.update()
+
+    def on_canvas_resize(self, event):
+        # 画布大小变化后更新所有子图，随后的完整重绘会显示新的裁剪
+        for ax in self.axes:
+            self.update_panel(ax)
+
     def clear_axes(self):
+        # 清空后子图中不再有图像
+        self.panels = [None] * len(self.axes)
         # 清空图像显示区域
         for ax in self.axes:
             # 清空子图
@@ -337,6 +490,8 @@ class CoreAnalysisApp:
         # 如果没有选择文件，直接返回
         if not file_path:
             return
+        # 打开新图像前取消针对旧图像的分析任务
+        self.cancel_analysis()
         # 读取选择的图像文件
         self.original_image = cv2.imread(file_path)
         # 如果读取失败，弹出错误提示框
@@ -345,8 +500,10 @@ class CoreAnalysisApp:
             return
         # 清空之前的图像
         self.clear_axes()
+        # 旧图像的检测对象不再有效
+        self.set_object_index(None)
         # 显示原始图像
-        self.axes[0].imshow(cv2.cvtColor(self.original_image, cv2.COLOR_BGR2RGB))
+        self.show_panel(0, cv2.cvtColor(self.original_image, cv2.COLOR_BGR2RGB))
         # 设置子图标题
         self.axes[0].set_title("原图")
         # 调整布局参数
@@ -367,40 +524,8 @@ class CoreAnalysisApp:
                 max_area = float(self.hole_max_area.get()) if self.hole_max_area.get() != "inf" else np.inf
                 # 获取孔洞阈值的输入值并转换为整数
                 threshold_val = int(self.hole_threshold.get())
-                # 调用孔洞分析函数进行分析
-                result, gray, binary, marked = process_stone_holes(
-                    self.original_image, min_area, max_area, threshold_val
-                )
-                # 存储分析结果
-                self.analysis_result = result
-                # 存储分析类型
-                self.analysis_type = 'hole'
-                # 更新图像显示
-                self.axes[0].imshow(cv2.cvtColor(self.original_image, cv2.COLOR_BGR2RGB))
-                self.axes[0].set_title("原图")
-                self.axes[1].imshow(gray, cmap='gray')
-                self.axes[1].set_title("灰度图")
-                self.axes[2].imshow(binary, cmap='gray')
-                self.axes[2].set_title("二值图")
-                self.axes[3].imshow(cv2.cvtColor(marked, cv2.COLOR_BGR2RGB))
-                self.axes[3].set_title("孔洞标记图")
-                # 调整布局参数
-                self.fig.subplots_adjust(left=0.1, right=0.9, top=0.9, bottom=0.1)
-                # 重新绘制图像
-                self.canvas.draw()
-                # 更新结果信息
-                info = (
-                    f"孔洞数量: {result['孔洞数量']}\n"
-                    f"总面积: {result['总面积']:.2f}\n"
-                    f"平均面积: {result['平均面积']:.2f}\n"
-                    f"平均圆形度: {result['平均圆形度']:.2f}"
-                )
-                # 清空结果信息文本框
-                self.result_text.delete(1.0, tk.END)
-                # 将结果信息插入到文本框中
-                self.result_text.insert(tk.END, info)
-                # 绘制孔洞面积分布图表
-                self.plot_distribution(result['面积列表'], "孔洞面积分布", "面积")
+                # 孔洞分析函数及参数
+                job = AnalysisJob(process_stone_holes, self.original_image, min_area, max_area, threshold_val)
             elif analysis_type == 'crack':
                 # 获取裂缝最小面积的输入值并转换为浮点数
                 min_area = float(self.crack_min_area.get())
@@ -408,91 +533,189 @@ class CoreAnalysisApp:
                 max_area = float(self.crack_max_area.get()) if self.crack_max_area.get() != "inf" else np.inf
                 # 获取裂缝阈值的输入值并转换为整数
                 threshold_val = int(self.crack_threshold.get())
-                # 调用裂缝分析函数进行分析
-                result = process_crack(self.original_image, min_area, max_area, threshold_val)
-                # 存储分析结果
-                self.analysis_result = result
-                # 存储分析类型
-                self.analysis_type = 'crack'
-
-                # 确保结果包含所有需要的图像
-                if '二值图' not in result or '结果图' not in result:
-                    messagebox.showerror("错误", "裂缝分析结果不完整，请检查分析函数")
-                    return
-
-                # 更新图像显示
-                self.axes[0].imshow(cv2.cvtColor(self.original_image, cv2.COLOR_BGR2RGB))
-                self.axes[0].set_title("原图")
-                self.axes[1].imshow(result['二值图'], cmap='gray')
-                self.axes[1].set_title("二值图")
-                self.axes[2].imshow(cv2.cvtColor(result['结果图'], cv2.COLOR_BGR2RGB))
-                self.axes[2].set_title("裂缝标记图")
-                self.axes[3].axis('off')
-                # 调整布局参数
-                self.fig.subplots_adjust(left=0.1, right=0.9, top=0.9, bottom=0.1)
-                # 重新绘制图像
-                self.canvas.draw()
-
-                # 更新结果信息
-                if '特征' in result and result['特征']:
-                    features = result['特征']
-
-                    # 检查最大裂缝长度是否为0
-                    if '最大裂缝长度' in features and features['最大裂缝长度'] <= 0:
-                        # 如果为0，尝试从裂缝列表中计算
-                        if '裂缝列表' in result and len(result['裂缝列表']) > 0:
-                            max_length = 0
-                            for crack in result['裂缝列表']:
-                                if '长度' in crack and crack['长度'] > max_length:
-                                    max_length = crack['长度']
-
-                            if max_length > 0:
-                                features['最大裂缝长度'] = max_length
-                                messagebox.showinfo("提示", "已重新计算最大裂缝长度")
-                            else:
-                                messagebox.showinfo("提示", "无法计算最大裂缝长度，请检查裂缝分析算法")
-                        else:
-                            messagebox.showinfo("提示", "没有找到裂缝数据，请检查裂缝分析算法")
-
-                    info = (
-                        f"裂缝数量: {features['数量']}\n"
-                        f"总面积: {features['总面积']:.2f} 像素\n"
-                        f"平均面积: {features['平均面积']:.2f} 像素\n"
-                        f"最大裂缝方向: {features['最大裂缝方向']}\n"
-                        f"最大裂缝长度: {features['最大裂缝长度']:.2f} 像素\n"
-                        f"最大裂缝最大宽度: {features['最大裂缝最大宽度']:.2f} 像素\n"
-                        f"最大裂缝最小宽度: {features['最大裂缝最小宽度']:.2f} 像素"
-                    )
-                    # 清空结果信息文本框
-                    self.result_text.delete(1.0, tk.END)
-                    # 将结果信息插入到文本框中
-                    self.result_text.insert(tk.END, info)
-                else:
-                    # 清空结果信息文本框
-                    self.result_text.delete(1.0, tk.END)
-                    # 将未检测到裂缝的信息插入到文本框中
-                    self.result_text.insert(tk.END, "未检测到符合条件的裂缝")
+                # 裂缝分析函数及参数
+                job = AnalysisJob(process_crack, self.original_image, min_area, max_area, threshold_val)
+            else:
+                # 粒度分析函数
+                job = AnalysisJob(analyze_grains, self.original_image)
+        except ValueError:
+            # 如果输入参数格式错误，弹出错误提示框
+            messagebox.showerror("错误", "参数输入有误，请检查数值格式")
+            return
 
-                # 准备裂缝宽度数据用于图表
-                if '裂缝宽度列表' in result and len(result['裂缝宽度列表']) > 0:
-                    # 过滤掉零值和负值
-                    width_data = [w for w in result['裂缝宽度列表'] if w > 0]
+        # 开始新的分析前取消尚未完成的旧任务，旧任务的结果不会再被显示
+        self.cancel_analysis()
+        # 记录任务对应的图像和分析类型，完成后用于显示结果
+        job.image = self.original_image
+        job.analysis_type = analysis_type
+        self.current_job = job.start()
+        # 更新进度显示并启用取消按钮
+        self.progress_bar['value'] = 0
+        self.progress_label.config(text="正在分析...")
+        self.cancel_button.config(state=tk.NORMAL)
+        # 定时轮询任务状态
+        self.root.after(self.JOB_POLL_INTERVAL, self.poll_analysis, job)
+
+    def cancel_analysis(self):
+        # 取消正在进行的分析任务
+        if self.current_job is not None and not self.current_job.done:
+            self.current_job.cancel()
+            self.progress_label.config(text="分析已取消")
+        self.current_job = None
+        self.cancel_button.config(state=tk.DISABLED)
+
+    def poll_analysis(self, job):
+        # 任务已被新的分析替换或已取消，不再轮询
+        if job is not self.current_job:
+            return
+        done, fraction, message = job.poll()
+        # 更新进度条和进度说明
+        self.progress_bar['value'] = fraction * 100
+        self.progress_label.config(text=message or "正在分析...")
+        if not done:
+            self.root.after(self.JOB_POLL_INTERVAL, self.poll_analysis, job)
+            return
 
-                    if len(width_data) > 0:
-                        # 绘制裂缝宽度分布图表
-                        self.plot_distribution(width_data, "裂缝宽度分布", "宽度")
+        # 任务结束
+        self.current_job = None
+        self.cancel_button.config(state=tk.DISABLED)
+        if isinstance(job.error, AnalysisCancelled):
+            self.progress_label.config(text="分析已取消")
+            return
+        if job.error is not None:
+            # 如果分析过程中发生错误，弹出错误提示框
+            self.progress_label.config(text="分析失败")
+            messagebox.showerror("错误", f"分析过程中发生错误: {str(job.error)}")
+            return
+        self.progress_label.config(text="分析完成")
+        try:
+            # 在主线程中显示分析结果
+            self.show_analysis_result(job.analysis_type, job.image, job.result)
+        except Exception as e:
+            # 如果显示结果时发生错误，弹出错误提示框
+            messagebox.showerror("错误", f"分析过程中发生错误: {str(e)}")
+
+    def show_analysis_result(self, analysis_type, image, output):
+        # 在主线程中将分析任务的结果显示到图像、结果信息和图表区域
+        # 为检测到的对象建立空间索引，鼠标悬停时直接查询所在对象
+        result = output if analysis_type == 'crack' else output[0]
+        self.set_object_index(ObjectIndex.from_result(analysis_type, result, image.shape))
+        if analysis_type == 'hole':
+            # 孔洞分析结果及中间图像
+            result, gray, binary, marked = output
+            # 存储分析结果
+            self.analysis_result = result
+            # 存储分析类型
+            self.analysis_type = 'hole'
+            # 更新图像显示
+            self.show_panel(0, cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+            self.axes[0].set_title("原图")
+            self.show_panel(1, gray, cmap='gray')
+            self.axes[1].set_title("灰度图")
+            self.show_panel(2, binary, cmap='gray')
+            self.axes[2].set_title("二值图")
+            self.show_panel(3, cv2.cvtColor(marked, cv2.COLOR_BGR2RGB))
+            self.axes[3].set_title("孔洞标记图")
+            # 调整布局参数
+            self.fig.subplots_adjust(left=0.1, right=0.9, top=0.9, bottom=0.1)
+            # 重新绘制图像
+            self.canvas.draw()
+            # 更新结果信息
+            info = (
+                f"孔洞数量: {result['孔洞数量']}\n"
+                f"总面积: {result['总面积']:.2f}\n"
+                f"平均面积: {result['平均面积']:.2f}\n"
+                f"平均圆形度: {result['平均圆形度']:.2f}\n"
+                f"平均等效直径: {result['平均等效直径']:.2f} 像素"
+            )
+            spatial = result.get('空间分布', {})
+            if '最近邻距离' in spatial:
+                info += (
+                    f"\n平均最近邻距离: {spatial['最近邻距离']['平均']:.2f} 像素\n"
+                    f"Clark-Evans比: {spatial['Clark-Evans比']:.2f}（{spatial['分布类型']}）\n"
+                    f"聚集团数: {spatial['聚集团数'] if spatial['聚集团数'] is not None else '-'}"
+                )
+            # 清空结果信息文本框
+            self.result_text.delete(1.0, tk.END)
+            # 将结果信息插入到文本框中
+            self.result_text.insert(tk.END, info)
+            # 绘制孔洞面积分布图表
+            self.plot_distribution(result['面积列表'], "孔洞面积分布", "面积")
+        elif analysis_type == 'crack':
+            # 裂缝分析结果
+            result = output
+            # 存储分析结果
+            self.analysis_result = result
+            # 存储分析类型
+            self.analysis_type = 'crack'
+
+            # 确保结果包含所有需要的图像
+            if '二值图' not in result or '结果图' not in result:
+                messagebox.showerror("错误", "裂缝分析结果不完整，请检查分析函数")
+                return
+
+            # 更新图像显示
+            self.show_panel(0, cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+            self.axes[0].set_title("原图")
+            self.show_panel(1, result['二值图'], cmap='gray')
+            self.axes[1].set_title("二值图")
+            self.show_panel(2, cv2.cvtColor(result['结果图'], cv2.COLOR_BGR2RGB))
+            self.axes[2].set_title("裂缝标记图")
+            # 裂缝分析不使用第4幅子图
+            self.clear_panel(3)
+            # 调整布局参数
+            self.fig.subplots_adjust(left=0.1, right=0.9, top=0.9, bottom=0.1)
+            # 重新绘制图像
+            self.canvas.draw()
+
+            # 更新结果信息
+            if '特征' in result and result['特征']:
+                features = result['特征']
+
+                # 检查最大裂缝长度是否为0
+                if '最大裂缝长度' in features and features['最大裂缝长度'] <= 0:
+                    # 如果为0，尝试从裂缝列表中计算
+                    if '裂缝列表' in result and len(result['裂缝列表']) > 0:
+                        max_length = 0
+                        for crack in result['裂缝列表']:
+                            if '长度' in crack and crack['长度'] > max_length:
+                                max_length = crack['长度']
+
+                        if max_length > 0:
+                            features['最大裂缝长度'] = max_length
+                            messagebox.showinfo("提示", "已重新计算最大裂缝长度")
+                        else:
+                            messagebox.showinfo("提示", "无法计算最大裂缝长度，请检查裂缝分析算法")
                     else:
-                        messagebox.showinfo("提示", "未检测到有效裂缝宽度数据")
-                        # 清空图表
-                        self.chart_ax.clear()
-                        # 在图表中显示无有效数据的信息
-                        self.chart_ax.text(0.5, 0.5, "无有效裂缝宽度数据", ha='center', va='center', fontsize=14)
-                        # 关闭坐标轴显示
-                        self.chart_ax.axis('off')
-                        # 调整布局参数
-                        self.chart_fig.subplots_adjust(left=0.1, right=0.9, top=0.9, bottom=0.1)
-                        # 重新绘制图表
-                        self.chart_canvas.draw()
+                        messagebox.showinfo("提示", "没有找到裂缝数据，请检查裂缝分析算法")
+
+                info = (
+                    f"裂缝数量: {features['数量']}\n"
+                    f"总面积: {features['总面积']:.2f} 像素\n"
+                    f"平均面积: {features['平均面积']:.2f} 像素\n"
+                    f"最大裂缝方向: {features['最大裂缝方向']}\n"
+                    f"最大裂缝长度: {features['最大裂缝长度']:.2f} 像素\n"
+                    f"最大裂缝最大宽度: {features['最大裂缝最大宽度']:.2f} 像素\n"
+                    f"最大裂缝最小宽度: {features['最大裂缝最小宽度']:.2f} 像素"
+                )
+                # 清空结果信息文本框
+                self.result_text.delete(1.0, tk.END)
+                # 将结果信息插入到文本框中
+                self.result_text.insert(tk.END, info)
+            else:
+                # 清空结果信息文本框
+                self.result_text.delete(1.0, tk.END)
+                # 将未检测到裂缝的信息插入到文本框中
+                self.result_text.insert(tk.END, "未检测到符合条件的裂缝")
+
+            # 准备裂缝宽度数据用于图表
+            if '裂缝宽度列表' in result and len(result['裂缝宽度列表']) > 0:
+                # 过滤掉零值和负值
+                width_data = [w for w in result['裂缝宽度列表'] if w > 0]
+
+                if len(width_data) > 0:
+                    # 绘制裂缝宽度分布图表
+                    self.plot_distribution(width_data, "裂缝宽度分布", "宽度")
                 else:
                     messagebox.showinfo("提示", "未检测到有效裂缝宽度数据")
                     # 清空图表
@@ -505,53 +728,68 @@ class CoreAnalysisApp:
                     self.chart_fig.subplots_adjust(left=0.1, right=0.9, top=0.9, bottom=0.1)
                     # 重新绘制图表
                     self.chart_canvas.draw()
-            elif analysis_type == 'grain':
-                # 调用粒度分析函数进行分析
-                result, gray, binary, marked = analyze_grains(self.original_image)
-                # 存储分析结果
-                self.analysis_result = result
-                # 存储分析类型
-                self.analysis_type = 'grain'
-                # 更新图像显示
-                self.axes[0].imshow(cv2.cvtColor(self.original_image, cv2.COLOR_BGR2RGB))
-                self.axes[0].set_title("原图")
-                self.axes[1].imshow(gray, cmap='gray')
-                self.axes[1].set_title("灰度图")
-                self.axes[2].imshow(binary, cmap='gray')
-                self.axes[2].set_title("二值图")
-                self.axes[3].imshow(cv2.cvtColor(marked, cv2.COLOR_BGR2RGB))
-                self.axes[3].set_title("粒子标记图")
+            else:
+                messagebox.showinfo("提示", "未检测到有效裂缝宽度数据")
+                # 清空图表
+                self.chart_ax.clear()
+                # 在图表中显示无有效数据的信息
+                self.chart_ax.text(0.5, 0.5, "无有效裂缝宽度数据", ha='center', va='center', fontsize=14)
+                # 关闭坐标轴显示
+                self.chart_ax.axis('off')
                 # 调整布局参数
-                self.fig.subplots_adjust(left=0.1, right=0.9, top=0.9, bottom=0.1)
-                # 重新绘制图像
-                self.canvas.draw()
-                # 更新结果信息
-                info = (
-                    f"粒子数量: {result['粒子数量']}\n"
-                    f"平均面积: {result['平均面积']:.2f} 像素"
+                self.chart_fig.subplots_adjust(left=0.1, right=0.9, top=0.9, bottom=0.1)
+                # 重新绘制图表
+                self.chart_canvas.draw()
+        elif analysis_type == 'grain':
+            # 粒度分析结果及中间图像
+            result, gray, binary, marked = output
+            # 存储分析结果
+            self.analysis_result = result
+            # 存储分析类型
+            self.analysis_type = 'grain'
+            # 更新图像显示
+            self.show_panel(0, cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+            self.axes[0].set_title("原图")
+            self.show_panel(1, gray, cmap='gray')
+            self.axes[1].set_title("灰度图")
+            self.show_panel(2, binary, cmap='gray')
+            self.axes[2].set_title("二值图")
+            self.show_panel(3, cv2.cvtColor(marked, cv2.COLOR_BGR2RGB))
+            self.axes[3].set_title("粒子标记图")
+            # 调整布局参数
+            self.fig.subplots_adjust(left=0.1, right=0.9, top=0.9, bottom=0.1)
+            # 重新绘制图像
+            self.canvas.draw()
+            # 更新结果信息
+            info = (
+                f"粒子数量: {result['粒子数量']}\n"
+                f"平均面积: {result['平均面积']:.2f} 像素\n"
+                f"平均等效直径: {result['平均等效直径']:.2f} 像素\n"
+                f"平均长宽比: {result['平均长宽比']:.2f}"
+            )
+            size_stats = result.get('粒度统计', {})
+            if size_stats.get('颗粒数'):
+                info += (
+                    f"\nD10/D50/D90: {size_stats['D10']:.3f}/{size_stats['D50']:.3f}/{size_stats['D90']:.3f}\n"
+                    f"分选系数: {size_stats['分选系数']:.2f}（{size_stats['分选等级']}）"
                 )
-                # 清空结果信息文本框
-                self.result_text.delete(1.0, tk.END)
-                # 将结果信息插入到文本框中
-                self.result_text.insert(tk.END, info)
-                # 绘制粒度分布图表
-                self.plot_distribution(result['面积列表'], "粒度分布", "面积")
-        except ValueError:
-            # 如果输入参数格式错误，弹出错误提示框
-            messagebox.showerror("错误", "参数输入有误，请检查数值格式")
-            return
-        except Exception as e:
-            # 如果分析过程中发生其他错误，弹出错误提示框
-            messagebox.showerror("错误", f"分析过程中发生错误: {str(e)}")
-            return
+            # 清空结果信息文本框
+            self.result_text.delete(1.0, tk.END)
+            # 将结果信息插入到文本框中
+            self.result_text.insert(tk.END, info)
+            # 绘制粒度分布图表
+            self.plot_distribution(result['面积列表'], "粒度分布", "面积")
 
     def plot_distribution(self, data, title, xlabel):
         """通用图表绘制函数"""
         # 清空图表
         self.chart_ax.clear()
 
+        # 一次计算有效数据的分箱、四分位数、显示范围和大小分组
+        stats = summarize(data)
+
         # 如果数据为空，在图表中显示无有效数据的信息
-        if not data or len(data) == 0:
+        if stats['total'] == 0:
             self.chart_ax.text(0.5, 0.5, "无有效数据", ha='center', va='center', fontsize=14)
             # 关闭坐标轴显示
             self.chart_ax.axis('off')
@@ -561,11 +799,8 @@ class CoreAnalysisApp:
             # 设置图表标题
             self.chart_ax.set_title(title, fontsize=14, pad=10)
 
-            # 过滤掉零值和负值
-            filtered_data = [d for d in data if d > 0]
-
-            # 如果过滤后的数据为空，在图表中显示数据无效的信息
-            if len(filtered_data) == 0:
+            # 如果过滤掉零值和负值后的数据为空，在图表中显示数据无效的信息
+            if stats['count'] == 0:
                 self.chart_ax.text(0.5, 0.5, "数据无效", ha='center', va='center', fontsize=14)
                 # 关闭坐标轴显示
                 self.chart_ax.axis('off')
@@ -576,17 +811,9 @@ class CoreAnalysisApp:
                 return
 
             if self.plot_type == 'histogram':
-                # 绘制直方图
-                # 自动计算合适的分箱数
-                if len(filtered_data) < 10:
-                    bins = len(filtered_data)
-                elif len(filtered_data) < 50:
-                    bins = min(10, len(set(filtered_data)))
-                else:
-                    bins = min(20, len(set(filtered_data)))
-
-                # 绘制直方图
-                n, bins, patches = self.chart_ax.hist(filtered_data, bins=bins, edgecolor='black', color='skyblue',
+                # 按预先计算的分箱绘制直方图
+                n, bins, patches = self.chart_ax.hist(stats['edges'][:-1], bins=stats['edges'],
+                                                      weights=stats['counts'], edgecolor='black', color='skyblue',
                                                       alpha=0.8)
                 # 设置x轴标签
                 self.chart_ax.set_xlabel(xlabel, fontsize=12)
@@ -607,27 +834,11 @@ class CoreAnalysisApp:
                         )
 
                 # 调整x轴范围，排除极端值
-                q1 = np.percentile(filtered_data, 25)
-                q3 = np.percentile(filtered_data, 75)
-                iqr = q3 - q1
-                lower_bound = max(0, q1 - 1.5 * iqr)
-                upper_bound = q3 + 1.5 * iqr
-
-                # 如果数据分布比较集中，稍微扩大范围
-                if upper_bound - lower_bound < np.mean(filtered_data) * 0.1:
-                    margin = np.mean(filtered_data) * 0.1
-                    lower_bound = max(0, np.mean(filtered_data) - margin)
-                    upper_bound = np.mean(filtered_data) + margin
-
-                # 确保图表显示合理范围
-                if len(filtered_data) > 5:  # 只有当有足够数据时才调整范围
-                    self.chart_ax.set_xlim(lower_bound, upper_bound)
+                if stats['count'] > 5:  # 只有当有足够数据时才调整范围
+                    self.chart_ax.set_xlim(stats['lower'], stats['upper'])
             elif self.plot_type == 'line':
-                # 绘制折线图
-                # 对数据进行排序
-                sorted_data = sorted(filtered_data)
-                # 绘制折线图
-                self.chart_ax.plot(sorted_data, marker='o', linestyle='-', markersize=4, linewidth=2, color='blue')
+                # 绘制折线图，数据已经排序
+                self.chart_ax.plot(stats['values'], marker='o', linestyle='-', markersize=4, linewidth=2, color='blue')
                 # 设置x轴标签
                 self.chart_ax.set_xlabel("序号", fontsize=12)
                 # 设置y轴标签
@@ -636,124 +847,34 @@ class CoreAnalysisApp:
                 self.chart_ax.grid(True, linestyle='--', alpha=0.7)
 
                 # 调整y轴范围，排除极端值
-                q1 = np.percentile(filtered_data, 25)
-                q3 = np.percentile(filtered_data, 75)
-                iqr = q3 - q1
-                lower_bound = max(0, q1 - 1.5 * iqr)
-                upper_bound = q3 + 1.5 * iqr
-
-                # 如果数据分布比较集中，稍微扩大范围
-                if upper_bound - lower_bound < np.mean(filtered_data) * 0.1:
-                    margin = np.mean(filtered_data) * 0.1
-                    lower_bound = max(0, np.mean(filtered_data) - margin)
-                    upper_bound = np.mean(filtered_data) + margin
-
-                # 确保图表显示合理范围
-                if len(filtered_data) > 5:  # 只有当有足够数据时才调整范围
-                    self.chart_ax.set_ylim(lower_bound, upper_bound)
-            elif self.plot_type == 'pie':
-                # 绘制饼图
-                if self.analysis_type == 'hole':
-                    # 可以将孔洞按面积大小分组
-                    total_area = sum(filtered_data)
-                    if total_area > 0:
-                        small = sum(1 for d in filtered_data if d < np.mean(filtered_data) / 2)
-                        medium = sum(
-                            1 for d in filtered_data if np.mean(filtered_data) / 2 <= d < np.mean(filtered_data) * 2)
-                        large = sum(1 for d in filtered_data if d >= np.mean(filtered_data) * 2)
-
-                        sizes = [small, medium, large]
-                        labels = ['小', '中', '大']
-                        colors = ['#ff9999', '#66b3ff', '#99ff99']
-
-                        # 确保没有空的部分
-                        valid_sizes = []
-                        valid_labels = []
-                        valid_colors = []
-
-                        for i, size in enumerate(sizes):
-                            if size > 0:
-                                valid_sizes.append(size)
-                                valid_labels.append(labels[i])
-                                valid_colors.append(colors[i])
-
-                        if len(valid_sizes) > 0:
-                            self.chart_ax.pie(valid_sizes, labels=valid_labels, colors=valid_colors, autopct='%1.1f%%',
-                                              startangle=90, shadow=True,
-                                              explode=(0.1, 0, 0) if len(valid_sizes) > 1 else None,
-                                              textprops={'fontsize': 10})
-                            self.chart_ax.set_title("孔洞大小分布", fontsize=14)
-                        else:
-                            self.chart_ax.text(0.5, 0.5, "数据不足以生成饼图", ha='center', va='center', fontsize=12)
-                            # 关闭坐标轴显示
-                            self.chart_ax.axis('off')
-                elif self.analysis_type == 'crack':
-                    # 可以将裂缝按宽度分组
-                    if len(filtered_data) > 0:
-                        narrow = sum(1 for d in filtered_data if d < np.mean(filtered_data) / 2)
-                        medium = sum(
-                            1 for d in filtered_data if np.mean(filtered_data) / 2 <= d < np.mean(filtered_data) * 2)
-                        wide = sum(1 for d in filtered_data if d >= np.mean(filtered_data) * 2)
-
-                        sizes = [narrow, medium, wide]
-                        labels = ['窄', '中', '宽']
-                        colors = ['#ff9999', '#66b3ff', '#99ff99']
-
-                        # 确保没有空的部分
-                        valid_sizes = []
-                        valid_labels = []
-                        valid_colors = []
-
-                        for i, size in enumerate(sizes):
-                            if size > 0:
-                                valid_sizes.append(size)
-                                valid_labels.append(labels[i])
-                                valid_colors.append(colors[i])
-
-                        if len(valid_sizes) > 0:
-                            self.chart_ax.pie(valid_sizes, labels=valid_labels, colors=valid_colors, autopct='%1.1f%%',
-                                              startangle=90, shadow=True,
-                                              explode=(0.1, 0, 0) if len(valid_sizes) > 1 else None,
-                                              textprops={'fontsize': 10})
-                            self.chart_ax.set_title("裂缝宽度分布", fontsize=14)
-                        else:
-                            self.chart_ax.text(0.5, 0.5, "数据不足以生成饼图", ha='center', va='center', fontsize=12)
-                            # 关闭坐标轴显示
-                            self.chart_ax.axis('off')
-                elif self.analysis_type == 'grain':
-                    # 可以将粒子按面积大小分组
-                    total_area = sum(filtered_data)
-                    if total_area > 0:
-                        small = sum(1 for d in filtered_data if d < np.mean(filtered_data) / 2)
-                        medium = sum(
-                            1 for d in filtered_data if np.mean(filtered_data) / 2 <= d < np.mean(filtered_data) * 2)
-                        large = sum(1 for d in filtered_data if d >= np.mean(filtered_data) * 2)
-
-                        sizes = [small, medium, large]
-                        labels = ['小', '中', '大']
-                        colors = ['#ff9999', '#66b3ff', '#99ff99']
-
-                        # 确保没有空的部分
-                        valid_sizes = []
-                        valid_labels = []
-                        valid_colors = []
-
-                        for i, size in enumerate(sizes):
-                            if size > 0:
-                                valid_sizes.append(size)
-                                valid_labels.append(labels[i])
-                                valid_colors.append(colors[i])
-
-                        if len(valid_sizes) > 0:
-                            self.chart_ax.pie(valid_sizes, labels=valid_labels, colors=valid_colors, autopct='%1.1f%%',
-                                              startangle=90, shadow=True,
-                                              explode=(0.1, 0, 0) if len(valid_sizes) > 1 else None,
-                                              textprops={'fontsize': 10})
-                            self.chart_ax.set_title("粒子大小分布", fontsize=14)
-                        else:
-                            self.chart_ax.text(0.5, 0.5, "数据不足以生成饼图", ha='center', va='center', fontsize=12)
-                            # 关闭坐标轴显示
-                            self.chart_ax.axis('off')
+                if stats['count'] > 5:  # 只有当有足够数据时才调整范围
+                    self.chart_ax.set_ylim(stats['lower'], stats['upper'])
+            elif self.plot_type == 'pie' and self.analysis_type in self.PIE_LABELS:
+                # 绘制饼图，按平均值的一半和两倍将对象分为三组
+                labels, pie_title = self.PIE_LABELS[self.analysis_type]
+                colors = ['#ff9999', '#66b3ff', '#99ff99']
+
+                # 确保没有空的部分
+                valid_sizes = []
+                valid_labels = []
+                valid_colors = []
+
+                for i, size in enumerate(stats['buckets']):
+                    if size > 0:
+                        valid_sizes.append(size)
+                        valid_labels.append(labels[i])
+                        valid_colors.append(colors[i])
+
+                if len(valid_sizes) > 0:
+                    self.chart_ax.pie(valid_sizes, labels=valid_labels, colors=valid_colors, autopct='%1.1f%%',
+                                      startangle=90, shadow=True,
+                                      explode=(0.1, 0, 0) if len(valid_sizes) > 1 else None,
+                                      textprops={'fontsize': 10})
+                    self.chart_ax.set_title(pie_title, fontsize=14)
+                else:
+                    self.chart_ax.text(0.5, 0.5, "数据不足以生成饼图", ha='center', va='center', fontsize=12)
+                    # 关闭坐标轴显示
+                    self.chart_ax.axis('off')
 
         # 调整布局参数
         self.chart_fig.subplots_adjust(left=0.1, right=0.9, top=0.9, bottom=0.1)
@@ -824,10 +945,8 @@ class CoreAnalysisApp:
         # 调整子图的y轴范围
         ax.set_ylim((y - (y - ax.get_ylim()[0]) * scale_factor,
                      y + (ax.get_ylim()[1] - y) * scale_factor))
-        # 调整布局参数
-        self.fig.subplots_adjust(left=0.1, right=0.9, top=0.9, bottom=0.1)
-        # 重新绘制图像
-        self.canvas.draw()
+        # 只重绘该子图
+        self.blitter.redraw_axes(ax)
 
     def on_mouse_press(self, event):
         # 如果鼠标不在子图内，直接返回
@@ -840,6 +959,8 @@ class CoreAnalysisApp:
             self.is_drawing = True
             # 记录当前鼠标的x和y坐标
             self.last_x, self.last_y = event.xdata, event.ydata
+            # 在鼠标所在的子图中开始一条新的笔画
+            self.blitter.begin_stroke(event.inaxes, event.xdata, event.ydata, self.pen_color, self.pen_size)
             return
 
         # 处理图像移动功能
@@ -855,6 +976,8 @@ class CoreAnalysisApp:
             # 重置上一个点的x和y坐标
             self.last_x = None
             self.last_y = None
+            # 结束笔画
+            self.blitter.end_stroke()
             return
 
         # 处理图像移动功能
@@ -869,16 +992,13 @@ class CoreAnalysisApp:
 
         # 处理画笔功能 - 画图
         if self.is_drawing and self.last_x is not None and self.last_y is not None:
-            # 获取鼠标所在的子图
-            ax = event.inaxes
+            # 鼠标移到其他子图时坐标不属于当前笔画，忽略该点
+            if event.inaxes is not self.blitter.stroke_axes:
+                return
             # 获取当前鼠标的x和y坐标
             x, y = event.xdata, event.ydata
-            # 在子图中绘制线段
-            ax.plot([self.last_x, x], [self.last_y, y], color=self.pen_color, linewidth=self.pen_size)
-            # 调整布局参数
-            self.fig.subplots_adjust(left=0.1, right=0.9, top=0.9, bottom=0.1)
-            # 重新绘制图像
-            self.canvas.draw()
+            # 将该点追加到当前笔画，重绘由blitter限速执行
+            self.blitter.extend_stroke(x, y)
             # 更新上一个点的x和y坐标
             self.last_x, self.last_y = x, y
             return
@@ -904,11 +1024,34 @@ class CoreAnalysisApp:
             ax.set_ylim(ylim[0] - dy, ylim[1] - dy)
             # 更新鼠标按下时的x和y坐标
             self.press = event.xdata, event.ydata
-            # 减少不必要的更新
-            # 调整布局参数
-            self.fig.subplots_adjust(left=0.1, right=0.9, top=0.9, bottom=0.1)
-            # 重新绘制图像
-            self.canvas.draw()
+            # 只重绘该子图
+            self.blitter.redraw_axes(ax)
+
+        # 显示鼠标所在对象的属性
+        self.show_object_info(event)
+
+    def set_object_index(self, index):
+        # 更换检测对象的空间索引，清除旧的对象信息
+        self.object_index = index
+        self.hovered_object = None
+        self.object_label.config(text="")
+
+    def show_object_info(self, event):
+        # 显示鼠标所在对象的属性，对象未变化时不更新标签
+        if self.object_index is None or event.inaxes not in self.axes or \
+                self.panels[self.axes.index(event.inaxes)] is None:
+            return
+        # 图像显示时像素中心为整数坐标
+        object_id = self.object_index.object_at(event.xdata + 0.5, event.ydata + 0.5)
+        if object_id == self.hovered_object:
+            return
+        self.hovered_object = object_id
+        if object_id is None:
+            self.object_label.config(text="")
+            return
+        record = self.object_index.record(object_id)
+        lines = [f"对象 #{object_id + 1}"] + [f"{key}: {value:.2f}" for key, value in record['properties'].items()]
+        self.object_label.config(text="\n".join(lines))
 
     def toggle_zoom(self, enable):
         # 更新缩放功能开关状态
@@ -945,6 +1088,26 @@ class CoreAnalysisApp:
         if self.analysis_result is None:
             messagebox.showwarning("提示", "请先进行分析，再导出结果")
             return
+        # 每个检测对象一行的特征表
+        table = self.analysis_result.get('对象表')
+        if table is None:
+            messagebox.showwarning("提示", "当前分析结果没有对象特征表")
+            return
+        # 弹出保存文件对话框，按扩展名选择导出格式
+        file_path = filedialog.asksaveasfilename(
+            defaultextension=".npz",
+            initialfile=f"{self.analysis_type}_{datetime.datetime.now():%Y%m%d_%H%M%S}",
+            filetypes=[("NumPy特征表", "*.npz"), ("Parquet特征表", "*.parquet"), ("CSV表格", "*.csv")]
+        )
+        # 如果没有选择文件，直接返回
+        if not file_path:
+            return
+        try:
+            table.save(file_path)
+            messagebox.showinfo("提示", f"已导出 {len(table)} 个对象的特征到 {file_path}")
+        except Exception as e:
+            # 如果导出失败（如未安装pyarrow），弹出错误提示框
+            messagebox.showerror("错误", f"导出失败: {str(e)}")
 
 
 if __name__ == "__main__":
@@ -3,79 +3,167 @@
 import cv2
 # numpy是Python的一个科学计算库，用于处理数组和矩阵
 import numpy as np
+# tiling用于将大图像分块并行处理
+import tiling
+# buffer_pool用于复用中间数组
+from buffer_pool import take, give
+# overlay用于绘制标记图
+import overlay
+# feature_table用于保存每个孔洞的特征
+from feature_table import FeatureTable
+# spatial_stats用于计算孔洞的空间分布统计
+from spatial_stats import PointPattern
 
-# 定义孔洞分析函数
-# 该函数用于分析图像中的孔洞，输入参数包括图像、最小面积、最大面积和阈值
-def process_stone_holes(image, min_area=1, max_area=1000, threshold_val=100):
-    # 如果输入图像为空，返回错误信息和None值
-    if image is None:
-        return "错误：图像为空", None, None, None
+# 孔洞二值化各步骤的邻域影响半径之和：5x5高斯模糊2 + 3x3开运算2 + 3x3闭运算2
+HOLE_BINARY_HALO = 6
 
-    # 保持原始灰度转换
-    # 灰度图只包含一个通道，便于后续处理
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
 
+# 定义孔洞模糊函数
+# 模糊与阈值无关，调整阈值预览时可以缓存模糊结果
+# dst为可选的输出数组（来自缓冲池）
+def hole_blur(gray, dst=None):
     # 优化高斯模糊参数
     # 高斯模糊可以去除图像中的噪声
-    blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+    return cv2.GaussianBlur(gray, (5, 5), 0, dst=dst)
 
+
+# 定义孔洞阈值与形态学处理函数
+# pool为可选的缓冲池，输出数组从缓冲池取得
+def hole_threshold(blurred, threshold_val, pool=None):
     # 保持固定阈值但优化参数处理
     # 固定阈值将图像转换为二值图像
-    _, thresh = cv2.threshold(blurred, threshold_val, 255, cv2.THRESH_BINARY_INV)
+    _, thresh = cv2.threshold(blurred, threshold_val, 255, cv2.THRESH_BINARY_INV,
+                              dst=take(pool, blurred.shape))
 
     # 优化形态学操作核形状
     # 开操作去除小噪声，闭操作填充小孔洞
+    # 形态学操作支持原地执行，直接写回阈值图，不再分配新数组
     kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
-    thresh = cv2.morphologyEx(thresh, cv2.MORPH_OPEN, kernel)
-    thresh = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel)
+    cv2.morphologyEx(thresh, cv2.MORPH_OPEN, kernel, dst=thresh)
+    cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel, dst=thresh)
+    return thresh
+
+
+# 定义孔洞二值化函数
+# 模糊、阈值和形态学处理都是邻域操作，可以对整幅灰度图或带边缘的分块执行
+def hole_binary(gray, threshold_val, pool=None):
+    blurred = hole_blur(gray, take(pool, gray.shape))
+    thresh = hole_threshold(blurred, threshold_val, pool)
+    # 模糊图只是中间结果，归还缓冲池
+    give(pool, blurred)
+    return thresh
+
+
+# 定义孔洞轮廓测量函数，返回面积和周长
+def measure_hole(contour):
+    return cv2.contourArea(contour), cv2.arcLength(contour, True)
+
 
-    # 使用更高效的轮廓分析方法
-    # 查找二值图像中的轮廓
-    contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+# 定义孔洞分析函数
+# 该函数用于分析图像中的孔洞，输入参数包括图像、最小面积、最大面积和阈值
+# gray为可选的预先计算好的灰度图，多个分析共用同一幅图像时可避免重复转换
+# parallel为True时将图像分块，在max_workers个线程中并行处理，结果与串行模式完全相同
+# progress为可选的进度回调progress(进度0~1, 说明)，后台任务可在回调中抛出异常以取消分析
+# pool为可选的缓冲池（buffer_pool.BufferPool），中间数组从中取得并归还；
+# 返回的灰度图、二值图和结果图同样来自缓冲池，调用者用完后可以归还
+# render为False时只测量不绘制，返回的结果图为None，需要时可用overlay.render('hole', image, 结果['轮廓列表'])绘制
+# cluster_radius为空间分布统计的聚集半径（像素），默认为孔洞完全随机分布时的期望最近邻距离
+# spatial为False时不建立质心的KD树、不计算空间分布统计（批量和流式分析只需要汇总数值和特征表），
+# 结果中没有"空间分布"和"点分布"
+def process_stone_holes(image, min_area=1, max_area=1000, threshold_val=100, gray=None,
+                        parallel=False, tile_size=tiling.DEFAULT_TILE_SIZE, max_workers=None, progress=None,
+                        pool=None, render=True, cluster_radius=None, spatial=True):
+    # 如果输入图像为空，返回错误信息和None值
+    if image is None:
+        return "错误：图像为空", None, None, None
+
+    # 未提供进度回调时使用空函数
+    progress = progress or (lambda fraction, message='': None)
+
+    # 保持原始灰度转换
+    # 灰度图只包含一个通道，便于后续处理
+    progress(0.0, "灰度转换")
+    if gray is None:
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY, dst=take(pool, image.shape[:2]))
+
+    progress(0.1, "二值化与轮廓查找")
+    if parallel:
+        # 分块并行执行二值化、轮廓查找和测量
+        with tiling.make_executor(max_workers) as executor:
+            thresh = tiling.apply_tiled(gray, lambda tile: hole_binary(tile, threshold_val, pool),
+                                        HOLE_BINARY_HALO, executor, tile_size, pool=pool)
+            contours, measures = tiling.find_contours_tiled(thresh, executor, tile_size, measure=measure_hole)
+    else:
+        # 模糊、阈值和形态学处理
+        thresh = hole_binary(gray, threshold_val, pool)
+
+        # 使用更高效的轮廓分析方法
+        # 查找二值图像中的轮廓
+        contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        # 测量每个轮廓的面积和周长
+        measures = [measure_hole(contour) for contour in contours]
 
     # 预分配列表空间
     # 初始化孔洞计数
     hole_count = 0
     # 初始化总孔洞面积
     total_hole_area = 0
-    # 复制原始图像用于绘制结果
-    result_img = image.copy()
+    # 初始化符合条件的孔洞轮廓列表
+    hole_contours = []
     # 初始化圆形度列表
     circularities = []
     # 初始化面积列表
     areas = []
 
-    # 遍历每个轮廓
-    for contour in contours:
-        # 计算轮廓面积
-        area = cv2.contourArea(contour)
+    # 遍历每个轮廓及其面积和周长
+    for index, (contour, (area, perimeter)) in enumerate(zip(contours, measures)):
+        # 每处理一批轮廓报告一次进度
+        if index % 256 == 0:
+            progress(0.5 + 0.5 * index / len(contours), "孔洞测量与标记")
         # 筛选面积在指定范围内的孔洞
         if min_area <= area <= max_area:
             # 孔洞计数加1
             hole_count += 1
             # 总孔洞面积增加
             total_hole_area += area
-            # 计算轮廓周长
-            perimeter = cv2.arcLength(contour, True)
             if perimeter > 0:
                 # 计算圆形度
                 circularity = (4 * np.pi * area) / (perimeter ** 2 + 1e-10)
                 # 将圆形度添加到圆形度列表中
                 circularities.append(circularity)
-            # 优化绘制方法
-            # 绘制绿色的轮廓线
-            cv2.drawContours(result_img, [contour], -1, (0, 255, 0), 2)
+            # 记录轮廓，测量完成后统一绘制
+            hole_contours.append(contour)
             # 将面积添加到面积列表中
             areas.append(area)
 
+    # 每个孔洞一行的特征表，轮廓改为引用特征表中连续存放的坐标
+    table = FeatureTable.from_contours(hole_contours)
+    hole_contours = table.contours()
+
     # 计算分析结果
     result = {
         "孔洞数量": hole_count,
         "总面积": total_hole_area,
         "平均面积": total_hole_area / hole_count if hole_count > 0 else 0,
         "平均圆形度": np.mean(circularities) if circularities else 0,
-        "面积列表": areas
+        # 等效圆直径（像素）的平均值
+        "平均等效直径": np.mean(table['equivalent_diameter']) if hole_count > 0 else 0,
+        "面积列表": areas,
+        # 与面积列表一一对应的孔洞轮廓
+        "轮廓列表": hole_contours,
+        # 与面积列表一一对应的孔洞特征表（feature_table.FeatureTable）
+        "对象表": table
     }
+    if spatial:
+        pattern = PointPattern.from_table(table, image.shape)
+        # 孔洞质心的最近邻距离、Clark-Evans比和聚集团统计（spatial_stats.PointPattern.statistics）
+        result["空间分布"] = pattern.statistics(radius=cluster_radius)
+        # 建好KD树的点分布，建立空间索引时复用（spatial_index.ObjectIndex.from_result）
+        result["点分布"] = pattern
+
+    # 在原图副本上绘制绿色的孔洞轮廓
+    result_img = overlay.render('hole', image, hole_contours, pool) if render else None
 
+    progress(1.0, "完成")
     # 返回分析结果和中间图像
     return result, gray, thresh, result_img
\ No newline at end of file
@@ -0,0 +1,107 @@
+# 多分辨率图像显示（LOD）
+# 直接把4000万像素的原图交给imshow时，matplotlib每次重绘都要对整幅图像重采样。
+# 这里为每幅显示的图像建立图像金字塔（每级长宽减半），显示时根据子图当前的坐标范围
+# 和屏幕像素大小选择合适的级别，只把可见区域（加少量边缘）的裁剪交给imshow，
+# 放大到局部时才切换到更高分辨率的裁剪，因此重绘时间和显示数据量与原图分辨率无关
+import math
+
+import cv2
+import numpy as np
+
+# 金字塔最小一级的最大边长（像素）
+MIN_LEVEL_SIZE = 256
+# 裁剪时在可见区域四周额外保留的比例，平移少量距离时无需重新裁剪
+CROP_MARGIN = 0.5
+
+
+class ImagePyramid:
+    """图像金字塔，levels[0]为原图，之后每一级长宽减半"""
+
+    def __init__(self, image, min_size=MIN_LEVEL_SIZE):
+        self.levels = [image]
+        while max(self.levels[-1].shape[:2]) > min_size:
+            prev = self.levels[-1]
+            height, width = prev.shape[:2]
+            # 区域插值缩小，避免细小的孔洞和裂缝产生锯齿或消失
+            self.levels.append(cv2.resize(prev, ((width + 1) // 2, (height + 1) // 2),
+                                          interpolation=cv2.INTER_AREA))
+
+    @property
+    def shape(self):
+        return self.levels[0].shape
+
+    def scale(self, level):
+        """第level级一个像素对应的原图像素数 (x方向, y方向)"""
+        height, width = self.shape[:2]
+        level_height, level_width = self.levels[level].shape[:2]
+        return width / level_width, height / level_height
+
+    def choose_level(self, source_per_screen):
+        """选择每个屏幕像素至少对应一个金字塔像素的最粗级别"""
+        level = 0
+        for index in range(1, len(self.levels)):
+            if max(self.scale(index)) > source_per_screen:
+                break
+            level = index
+        return level
+
+
+class PyramidView:
+    """在子图中按当前视野显示金字塔中合适级别的图像裁剪"""
+
+    def __init__(self, ax, image, cmap=None, margin=CROP_MARGIN):
+        self.ax = ax
+        self.pyramid = ImagePyramid(image)
+        self.margin = margin
+        height, width = image.shape[:2]
+        kwargs = {'cmap': cmap}
+        if image.ndim == 2:
+            # 单通道图像的灰度范围按整幅原图确定，避免不同裁剪的显示亮度不一致
+            kwargs.update(vmin=image.min(), vmax=image.max())
+        self.artist = ax.imshow(self.pyramid.levels[-1], extent=(-0.5, width - 0.5, height - 0.5, -0.5), **kwargs)
+        # 显示整幅图像，并关闭自动缩放（更新裁剪范围时不应改变坐标范围）
+        ax.set_xlim(-0.5, width - 0.5)
+        ax.set_ylim(height - 0.5, -0.5)
+        # 当前显示的级别和裁剪范围 (级别, 列起点, 列终点, 行起点, 行终点)
+        self._crop = None
+        self.update()
+
+    def remove(self):
+        """从子图中移除图像"""
+        self.artist.remove()
+
+    def update(self):
+        """按子图当前的坐标范围和屏幕大小更新显示的级别和裁剪，返回是否发生了变化"""
+        height, width = self.pyramid.shape[:2]
+        x0, x1 = sorted(self.ax.get_xlim())
+        y0, y1 = sorted(self.ax.get_ylim())
+        # 可见区域（原图像素坐标，像素中心为整数）
+        vx0, vx1 = max(x0 + 0.5, 0), min(x1 + 0.5, width)
+        vy0, vy1 = max(y0 + 0.5, 0), min(y1 + 0.5, height)
+        if vx1 <= vx0 or vy1 <= vy0:
+            return False
+
+        # 每个屏幕像素对应的原图像素数
+        screen_width, screen_height = max(self.ax.bbox.width, 1), max(self.ax.bbox.height, 1)
+        level = self.pyramid.choose_level(max((x1 - x0) / screen_width, (y1 - y0) / screen_height))
+        sx, sy = self.pyramid.scale(level)
+        level_image = self.pyramid.levels[level]
+        level_height, level_width = level_image.shape[:2]
+
+        # 可见区域在该级别中的范围
+        c0, c1 = int(vx0 / sx), min(level_width, math.ceil(vx1 / sx))
+        r0, r1 = int(vy0 / sy), min(level_height, math.ceil(vy1 / sy))
+        if self._crop is not None:
+            crop_level, cc0, cc1, cr0, cr1 = self._crop
+            if crop_level == level and cc0 <= c0 and c1 <= cc1 and cr0 <= r0 and r1 <= cr1:
+                # 当前裁剪仍覆盖可见区域
+                return False
+
+        # 四周保留边缘后裁剪
+        mx, my = int((c1 - c0) * self.margin), int((r1 - r0) * self.margin)
+        c0, c1 = max(0, c0 - mx), min(level_width, c1 + mx)
+        r0, r1 = max(0, r0 - my), min(level_height, r1 + my)
+        self.artist.set_data(np.ascontiguousarray(level_image[r0:r1, c0:c1]))
+        self.artist.set_extent((c0 * sx - 0.5, c1 * sx - 0.5, r1 * sy - 0.5, r0 * sy - 0.5))
+        self._crop = (level, c0, c1, r0, r1)
+        return True
@@ -0,0 +1,87 @@
+# 参数实时预览
+# 调整阈值和面积参数时，在缩小的代理图像上快速重新分析，使二值图和标记图即时更新；
+# 与参数无关的预处理（灰度转换、模糊、裂缝的对比度增强和双边滤波）只计算一次并缓存。
+# 代理图像按比例s缩小后，对象面积约缩小为原来的s²，面积参数按s²换算后再筛选。
+# 预览只用于调参，确定参数后再对原图执行完整分析
+import cv2
+import numpy as np
+from scipy import ndimage
+
+from hole_analysis import hole_blur, hole_threshold
+from crack_analysis import crack_enhance, crack_threshold
+from grain_analysis import grain_blur, grain_threshold
+from overlay import DEFAULT_STYLES, draw_contours
+
+# 代理图像的最大边长（像素）
+DEFAULT_PROXY_SIZE = 1024
+
+
+class PreviewSession:
+    """一幅图像的预览会话，缓存代理图像及各分析与参数无关的预处理结果"""
+
+    def __init__(self, image, max_side=DEFAULT_PROXY_SIZE):
+        self.image = image
+        height, width = image.shape[:2]
+        # 缩小比例，原图较小时直接使用原图
+        self.scale = min(1.0, max_side / max(height, width))
+        if self.scale < 1.0:
+            size = (max(1, round(width * self.scale)), max(1, round(height * self.scale)))
+            self.proxy = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+        else:
+            self.proxy = image
+        self.gray = cv2.cvtColor(self.proxy, cv2.COLOR_BGR2GRAY)
+        # 各分析的预处理缓存
+        self._blurred = {}
+
+    def scale_area(self, area):
+        """将原图上的面积参数换算为代理图像上的面积"""
+        return area * self.scale * self.scale
+
+    def _preprocessed(self, analysis_type):
+        """返回缓存的预处理结果，首次使用时计算"""
+        if analysis_type not in self._blurred:
+            preprocess = {'hole': hole_blur, 'crack': crack_enhance, 'grain': grain_blur}[analysis_type]
+            self._blurred[analysis_type] = preprocess(self.gray)
+        return self._blurred[analysis_type]
+
+    def hole(self, min_area=1, max_area=1000, threshold_val=100):
+        """孔洞分析预览，返回 (二值图, 标记图, 孔洞数量)"""
+        thresh = hole_threshold(self._preprocessed('hole'), threshold_val)
+        contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        selected = self._select(contours, min_area, max_area)
+        return thresh, self._mark(selected, DEFAULT_STYLES['hole']), len(selected)
+
+    def grain(self, threshold_val=120, min_area=5, max_area=5000):
+        """粒度分析预览，返回 (二值图, 标记图, 颗粒数量)"""
+        opened = grain_threshold(self._preprocessed('grain'), threshold_val)
+        contours, _ = cv2.findContours(opened, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        selected = self._select(contours, min_area, max_area)
+        return opened, self._mark(selected, DEFAULT_STYLES['grain']), len(selected)
+
+    def crack(self, min_area=1000, max_area=np.inf, threshold_val=100):
+        """裂缝分析预览，返回 (二值图, 标记图, 裂缝数量)
+
+        与完整分析使用相同的连通区域筛选和实体度判断，但不计算宽度分布。
+        """
+        thresh = crack_threshold(self._preprocessed('crack'), threshold_val)
+        # 去除小噪声区域（与完整分析相同，按面积/10筛选）
+        labeled, num_features = ndimage.label(thresh)
+        sizes = ndimage.sum(thresh, labeled, range(num_features + 1))
+        thresh = (sizes > self.scale_area(min_area) / 10)[labeled].astype(np.uint8)
+        contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        cracks = []
+        for contour in self._select(contours, min_area, max_area):
+            # 裂缝通常实体度较低
+            hull_area = cv2.contourArea(cv2.convexHull(contour))
+            if hull_area > 0 and cv2.contourArea(contour) / hull_area < 0.7:
+                cracks.append(contour)
+        return thresh * 255, self._mark(cracks, DEFAULT_STYLES['crack']), len(cracks)
+
+    def _select(self, contours, min_area, max_area):
+        """按换算后的面积范围筛选轮廓"""
+        low, high = self.scale_area(min_area), self.scale_area(max_area)
+        return [contour for contour in contours if low <= cv2.contourArea(contour) <= high]
+
+    def _mark(self, contours, style):
+        """按分析的绘制样式在代理图像副本上绘制轮廓（预览不绘制裂缝的近似多边形）"""
+        return draw_contours(self.proxy.copy(), contours, style['color'], style['thickness'])
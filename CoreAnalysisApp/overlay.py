@@ -0,0 +1,53 @@
+# 分析结果叠加图绘制
+# 分析函数只负责测量并返回检测到的轮廓，标记图（在原图副本上绘制轮廓）由这里按需生成：
+# 批量分析和数据导出等只需要数值的调用可以跳过整幅图像的复制和绘制，
+# 界面需要显示标记图时再调用render()，颜色和线宽可以按需配置
+import cv2
+
+from buffer_pool import copy
+
+# 各分析类型的默认绘制样式，颜色为BGR格式
+DEFAULT_STYLES = {
+    # 孔洞：绿色轮廓
+    'hole': {'color': (0, 255, 0), 'thickness': 2},
+    # 颗粒：蓝色轮廓
+    'grain': {'color': (255, 0, 0), 'thickness': 1},
+    # 裂缝：绿色轮廓 + 红色近似多边形，epsilon为近似精度与轮廓周长之比
+    'crack': {'color': (0, 255, 0), 'thickness': 2,
+              'approx_color': (0, 0, 255), 'approx_thickness': 2, 'approx_epsilon': 0.005},
+}
+
+
+def draw_contours(canvas, contours, color, thickness):
+    """在canvas上原地绘制轮廓，同一颜色的轮廓一次绘制完成"""
+    if len(contours) > 0:
+        cv2.drawContours(canvas, contours, -1, color, thickness)
+    return canvas
+
+
+def draw_cracks(canvas, contours, color, thickness, approx_color, approx_thickness, approx_epsilon):
+    """在canvas上原地绘制裂缝轮廓及其近似多边形
+
+    每条裂缝先画轮廓再画近似多边形，相邻裂缝重叠处的覆盖顺序与逐条绘制一致。
+    """
+    for contour in contours:
+        cv2.drawContours(canvas, [contour], -1, color, thickness)
+        # 简化轮廓，减少绘制的点数
+        epsilon = approx_epsilon * cv2.arcLength(contour, True)
+        approx = cv2.approxPolyDP(contour, epsilon, True)
+        cv2.polylines(canvas, [approx], True, approx_color, approx_thickness)
+    return canvas
+
+
+def render(analysis_type, image, contours, pool=None, **style):
+    """在原图副本上绘制分析结果的轮廓，返回标记图
+
+    contours为分析结果中的轮廓列表（孔洞/颗粒为 '轮廓列表'，裂缝为 '裂缝轮廓'），
+    style中的键覆盖默认样式，例如 render('hole', image, contours, color=(0, 0, 255), thickness=1)。
+    pool为可选的缓冲池，标记图从中取得。
+    """
+    options = dict(DEFAULT_STYLES[analysis_type], **style)
+    canvas = copy(pool, image)
+    if analysis_type == 'crack':
+        return draw_cracks(canvas, contours, **options)
+    return draw_contours(canvas, contours, options['color'], options['thickness'])
@@ -0,0 +1,83 @@
+# 并发相同请求的合并（single-flight）
+# 多个分析员同时打开同一样本，或浏览器重复提交时，相同的 (图像摘要, 分析类型, 参数)
+# 只执行一次计算，其余等待中的请求共享同一个结果
+import json
+import threading
+
+
+def make_request_key(image_digest, analysis_type, params):
+    """构造请求合并的键：图像内容摘要 + 分析类型 + 参数"""
+    # 参数按键排序后序列化，保证相同参数得到相同的键
+    return image_digest, analysis_type, json.dumps(params, sort_keys=True, default=str)
+
+
+class _Call:
+    """一次正在进行的计算"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        # 共享该计算结果的后续请求数
+        self.followers = 0
+
+
+class SingleFlight:
+    """同一个键同时只执行一次计算，并发的相同请求等待并共享结果
+
+    仅在单个进程内生效；Gunicorn多进程部署时每个工作进程各自合并。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        # 统计计数
+        self._executions = 0
+        self._coalesced = 0
+        self._errors = 0
+
+    def do(self, key, fn):
+        """执行fn()，若相同键的计算正在进行则等待并返回其结果"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                # 已有相同请求在计算，作为跟随者等待
+                call.followers += 1
+                self._coalesced += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self._executions += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            with self._lock:
+                self._errors += 1
+            raise
+        finally:
+            # 计算结束后移除，之后到达的请求重新计算（结果不做缓存）
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def stats(self):
+        """返回合并统计，用于/metrics"""
+        with self._lock:
+            return {
+                'executions': self._executions,
+                'coalesced': self._coalesced,
+                'errors': self._errors,
+                'in_flight': len(self._calls),
+                'waiting': sum(call.followers for call in self._calls.values()),
+            }
@@ -0,0 +1,349 @@
+# 分析结果的本地持久化存储（SQLite）
+# 每口井有成千上万张岩心图像，分析结果原先只保存在浏览器（analysisData）或零散导出的JSON/CSV文件中，
+# 无法跨图像查询。ResultStore 把每张图像的汇总结果和每个对象的特征行写入一个SQLite数据库：
+# - samples：图像（井名、深度区间、尺寸）；analyses：每次分析的类型、参数和汇总；objects：对象特征表的每一行
+# - 使用WAL日志，读取查询时不阻塞写入；每次分析的对象在一个事务内批量插入
+# - 按井名和深度、分析类型和参数、对象深度和常用特征列建立索引，
+#   例如"1200~1250米之间宽度大于X的裂缝"只需扫描索引范围
+# - 查询结果以生成器逐批读取，导出时边读边写，内存占用与结果数量无关
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import sys
+import time
+
+import numpy as np
+
+from feature_table import FEATURE_DTYPE
+
+# 对象表中来自特征表的列（id列存为object_id）
+FEATURE_COLUMNS = [name for name in FEATURE_DTYPE.names if name != 'id']
+# 对象查询可以过滤的列
+FILTER_COLUMNS = set(FEATURE_COLUMNS) | {'depth', 'object_id'}
+# 过滤条件支持的比较运算符
+FILTER_OPERATORS = ('>=', '<=', '!=', '>', '<', '=')
+# 查询时每次从数据库读取的行数
+FETCH_SIZE = 1000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    well TEXT,
+    depth_top REAL,
+    depth_bottom REAL,
+    width INTEGER,
+    height INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_samples_well_depth ON samples (well, depth_top, depth_bottom);
+CREATE TABLE IF NOT EXISTS analyses (
+    id INTEGER PRIMARY KEY,
+    sample_id INTEGER NOT NULL REFERENCES samples (id) ON DELETE CASCADE,
+    analysis_type TEXT NOT NULL,
+    params TEXT NOT NULL,
+    summary TEXT NOT NULL,
+    object_count INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    UNIQUE (sample_id, analysis_type, params)
+);
+CREATE INDEX IF NOT EXISTS idx_analyses_type_params ON analyses (analysis_type, params);
+CREATE TABLE IF NOT EXISTS objects (
+    analysis_id INTEGER NOT NULL REFERENCES analyses (id) ON DELETE CASCADE,
+    object_id INTEGER NOT NULL,
+    analysis_type TEXT NOT NULL,
+    depth REAL,
+    PRIMARY KEY (analysis_id, object_id)
+) WITHOUT ROWID;
+"""
+
+# 对象表的索引：分析类型在前，按类型查询时只扫描该类型的索引范围
+_OBJECT_INDEXES = {
+    'idx_objects_depth': ('analysis_type', 'depth'),
+    'idx_objects_width': ('analysis_type', 'width_max'),
+    'idx_objects_area': ('analysis_type', 'area'),
+}
+
+
+def _json_default(value):
+    """将numpy标量等转换为可写入JSON的Python类型"""
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+
+def params_key(params):
+    """参数字典的规范化JSON（按键排序），相同参数得到相同的字符串"""
+    return json.dumps(params or {}, sort_keys=True, ensure_ascii=False, default=_json_default)
+
+
+def parse_filter(text):
+    """解析 "列名>值" 形式的过滤条件，返回 (列名, 运算符, 值)"""
+    for operator in FILTER_OPERATORS:
+        column, found, value = text.partition(operator)
+        if found:
+            return column.strip(), operator, float(value)
+    raise ValueError(f"无效的过滤条件: {text}，格式应为 列名>值，运算符可选 {' '.join(FILTER_OPERATORS)}")
+
+
+class ResultStore:
+    """SQLite分析结果库
+
+    同一个连接只能在创建它的线程中使用；多个进程可以同时读取，写入由SQLite串行化。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.row_factory = sqlite3.Row
+        # WAL日志：写入时读取查询不被阻塞；NORMAL同步级别在WAL模式下仍能保证数据库一致
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('PRAGMA foreign_keys=ON')
+        with self._conn:
+            self._conn.executescript(_SCHEMA)
+            self._ensure_feature_columns()
+
+    def _ensure_feature_columns(self):
+        """对象表缺少特征表中的列时添加（特征表增加新列后旧数据库仍可使用，旧数据的新列为NULL）"""
+        existing = {row['name'] for row in self._conn.execute('PRAGMA table_info(objects)')}
+        for name in FEATURE_COLUMNS:
+            if name not in existing:
+                sql_type = 'INTEGER' if np.issubdtype(FEATURE_DTYPE[name], np.integer) else 'REAL'
+                self._conn.execute(f'ALTER TABLE objects ADD COLUMN {name} {sql_type}')
+        for index_name, columns in _OBJECT_INDEXES.items():
+            self._conn.execute(f'CREATE INDEX IF NOT EXISTS {index_name} ON objects ({", ".join(columns)})')
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def ingest(self, path, analysis_type, params, summary, table=None, well=None, depth_top=None,
+               depth_bottom=None, image_shape=None):
+        """保存一张图像一次分析的汇总结果和对象特征表，返回分析记录的编号
+
+        同一图像、分析类型和参数的结果已存在时整体替换。给出图像的深度区间和尺寸时，
+        每个对象的深度按其质心所在的行在区间内线性插值。
+        """
+        height, width = (image_shape[:2] if image_shape is not None else (None, None))
+        with self._conn:
+            self._conn.execute(
+                'INSERT INTO samples (path, well, depth_top, depth_bottom, width, height) VALUES (?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT (path) DO UPDATE SET well = coalesce(excluded.well, well), '
+                'depth_top = coalesce(excluded.depth_top, depth_top), '
+                'depth_bottom = coalesce(excluded.depth_bottom, depth_bottom), '
+                'width = coalesce(excluded.width, width), height = coalesce(excluded.height, height)',
+                (path, well, depth_top, depth_bottom, width, height))
+            sample = self._conn.execute(
+                'SELECT id, depth_top, depth_bottom, height FROM samples WHERE path = ?', (path,)).fetchone()
+            key = params_key(params)
+            # 替换已有的结果，对象行随之级联删除
+            self._conn.execute('DELETE FROM analyses WHERE sample_id = ? AND analysis_type = ? AND params = ?',
+                               (sample['id'], analysis_type, key))
+            count = len(table) if table is not None else 0
+            cursor = self._conn.execute(
+                'INSERT INTO analyses (sample_id, analysis_type, params, summary, object_count, created_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (sample['id'], analysis_type, key,
+                 json.dumps(summary or {}, ensure_ascii=False, default=_json_default), count, time.time()))
+            analysis_id = cursor.lastrowid
+            if count:
+                self._insert_objects(analysis_id, analysis_type, table, sample)
+        return analysis_id
+
+    def _insert_objects(self, analysis_id, analysis_type, table, sample):
+        """在当前事务中批量插入特征表的所有行"""
+        records = table.records
+        if sample['depth_top'] is not None and sample['depth_bottom'] is not None and sample['height']:
+            # 像素行的中心为 行号+0.5
+            fraction = (records['centroid_y'] + 0.5) / sample['height']
+            depths = (sample['depth_top'] + fraction * (sample['depth_bottom'] - sample['depth_top'])).tolist()
+        else:
+            depths = [None] * len(records)
+        columns = ['analysis_id', 'object_id', 'analysis_type', 'depth'] + FEATURE_COLUMNS
+        placeholders = ', '.join('?' * len(columns))
+        # NaN写入SQLite后为NULL
+        rows = ((analysis_id, row[0], analysis_type, depth) + row[1:]
+                for row, depth in zip(records.tolist(), depths))
+        self._conn.executemany(f'INSERT INTO objects ({", ".join(columns)}) VALUES ({placeholders})', rows)
+
+    def _where(self, analysis_type=None, well=None, params=None, type_column='a.analysis_type'):
+        """分析类型、井名和参数的公共过滤条件"""
+        clauses, args = [], []
+        if analysis_type is not None:
+            clauses.append(f'{type_column} = ?')
+            args.append(analysis_type)
+        if well is not None:
+            clauses.append('s.well = ?')
+            args.append(well)
+        if params is not None:
+            clauses.append('a.params = ?')
+            args.append(params_key(params))
+        return clauses, args
+
+    def _iterate(self, sql, args, batch_size):
+        """逐批读取查询结果，生成字典"""
+        cursor = self._conn.execute(sql, args)
+        try:
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield dict(row)
+        finally:
+            cursor.close()
+
+    def query_samples(self, well=None, depth_min=None, depth_max=None):
+        """逐条生成已登记深度区间的图像（路径、井名、深度区间和尺寸），按顶深排序"""
+        clauses, args = ['depth_top IS NOT NULL', 'depth_bottom IS NOT NULL'], []
+        if well is not None:
+            clauses.append('well = ?')
+            args.append(well)
+        if depth_min is not None:
+            clauses.append('depth_bottom >= ?')
+            args.append(depth_min)
+        if depth_max is not None:
+            clauses.append('depth_top <= ?')
+            args.append(depth_max)
+        sql = ('SELECT path, well, depth_top, depth_bottom, width, height FROM samples WHERE '
+               + ' AND '.join(clauses) + ' ORDER BY depth_top, path')
+        return self._iterate(sql, args, FETCH_SIZE)
+
+    def query_summaries(self, analysis_type=None, well=None, depth_min=None, depth_max=None, params=None,
+                        batch_size=FETCH_SIZE):
+        """逐条生成图像汇总结果，深度条件为图像深度区间与 [depth_min, depth_max] 有重叠"""
+        clauses, args = self._where(analysis_type, well, params)
+        if depth_min is not None:
+            clauses.append('s.depth_bottom >= ?')
+            args.append(depth_min)
+        if depth_max is not None:
+            clauses.append('s.depth_top <= ?')
+            args.append(depth_max)
+        sql = ('SELECT s.path, s.well, s.depth_top, s.depth_bottom, a.id AS analysis_id, a.analysis_type, '
+               'a.params, a.summary, a.object_count, a.created_at '
+               'FROM analyses a JOIN samples s ON s.id = a.sample_id')
+        if clauses:
+            sql += ' WHERE ' + ' AND '.join(clauses)
+        sql += ' ORDER BY s.well, s.depth_top, s.path, a.analysis_type'
+        for row in self._iterate(sql, args, batch_size):
+            row['params'] = json.loads(row['params'])
+            row['summary'] = json.loads(row['summary'])
+            yield row
+
+    def query_objects(self, analysis_type=None, well=None, depth_min=None, depth_max=None, filters=(),
+                      params=None, limit=None, batch_size=FETCH_SIZE):
+        """逐条生成满足条件的对象特征行
+
+        深度条件针对对象自身的深度（没有深度的对象不满足深度条件）；filters为 (列名, 运算符, 值) 的列表，
+        例如 [('width_max', '>', 5)]。
+        """
+        # 分析类型使用对象表中的冗余列，使 (分析类型, 深度/宽度/面积) 索引可用
+        clauses, args = self._where(analysis_type, well, params, type_column='o.analysis_type')
+        if depth_min is not None:
+            clauses.append('o.depth >= ?')
+            args.append(depth_min)
+        if depth_max is not None:
+            clauses.append('o.depth <= ?')
+            args.append(depth_max)
+        for column, operator, value in filters:
+            # 列名和运算符只能来自白名单，值通过参数绑定
+            if column not in FILTER_COLUMNS:
+                raise ValueError(f"不支持的过滤列: {column}，可选 {', '.join(sorted(FILTER_COLUMNS))}")
+            if operator not in FILTER_OPERATORS:
+                raise ValueError(f"不支持的运算符: {operator}")
+            clauses.append(f'o.{column} {operator} ?')
+            args.append(value)
+        sql = ('SELECT s.path, s.well, o.analysis_type, o.analysis_id, o.object_id, o.depth, '
+               + ', '.join(f'o.{name}' for name in FEATURE_COLUMNS) +
+               ' FROM objects o JOIN analyses a ON a.id = o.analysis_id JOIN samples s ON s.id = a.sample_id')
+        if clauses:
+            sql += ' WHERE ' + ' AND '.join(clauses)
+        if limit is not None:
+            sql += ' LIMIT ?'
+            args.append(int(limit))
+        return self._iterate(sql, args, batch_size)
+
+    def stats(self):
+        """返回库中的图像数、分析数和对象数"""
+        counts = {}
+        for table in ('samples', 'analyses', 'objects'):
+            counts[table] = self._conn.execute(f'SELECT count(*) FROM {table}').fetchone()[0]
+        return counts
+
+
+def export_rows(rows, out, output_format='csv'):
+    """将查询结果逐行写入文件对象，返回写入的行数；CSV的表头取自第一行"""
+    count = 0
+    writer = None
+    for row in rows:
+        if output_format == 'csv':
+            if writer is None:
+                writer = csv.DictWriter(out, fieldnames=list(row))
+                writer.writeheader()
+            writer.writerow({key: json.dumps(value, ensure_ascii=False) if isinstance(value, dict) else value
+                             for key, value in row.items()})
+        else:
+            out.write(json.dumps(row, ensure_ascii=False, default=_json_default) + '\n')
+        count += 1
+    return count
+
+
+def main(argv=None):
+    """命令行查询与导出入口"""
+    parser = argparse.ArgumentParser(description='查询和导出分析结果库')
+    parser.add_argument('database', help='结果库文件（.db）')
+    parser.add_argument('kind', choices=('objects', 'summaries', 'stats'),
+                        help='objects: 对象特征行；summaries: 图像汇总结果；stats: 统计')
+    parser.add_argument('-a', '--analysis', choices=('hole', 'crack', 'grain'), help='分析类型')
+    parser.add_argument('--well', help='井名')
+    parser.add_argument('--depth', nargs=2, type=float, metavar=('顶深', '底深'), help='深度范围（米）')
+    parser.add_argument('--where', action='append', default=[], type=parse_filter,
+                        help='对象过滤条件，如 "width_max>5"，可重复指定')
+    parser.add_argument('--limit', type=int, help='最多导出的对象数')
+    parser.add_argument('-o', '--output', help='导出文件，扩展名为.csv或.jsonl（默认输出到终端）')
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.database):
+        print(f"[结果库] 文件不存在: {args.database}")
+        return 1
+    depth_min, depth_max = args.depth if args.depth else (None, None)
+    with ResultStore(args.database) as store:
+        if args.kind == 'stats':
+            print(json.dumps(store.stats(), ensure_ascii=False))
+            return 0
+        if args.kind == 'objects':
+            try:
+                rows = store.query_objects(args.analysis, args.well, depth_min, depth_max, args.where,
+                                           limit=args.limit)
+            except ValueError as e:
+                print(f"[结果库] {e}")
+                return 2
+        else:
+            rows = store.query_summaries(args.analysis, args.well, depth_min, depth_max)
+        output_format = 'csv' if args.output and args.output.lower().endswith('.csv') else 'jsonl'
+        try:
+            if args.output:
+                encoding = 'utf-8-sig' if output_format == 'csv' else 'utf-8'
+                with open(args.output, 'w', encoding=encoding, newline='') as out:
+                    count = export_rows(rows, out, output_format)
+                print(f"[结果库] 已导出 {count} 行到 {args.output}")
+            else:
+                export_rows(rows, sys.stdout, output_format)
+        except BrokenPipeError:
+            # 输出到head等提前退出的管道时静默结束
+            sys.stderr.close()
+        finally:
+            # 在关闭数据库之前结束查询
+            rows.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,160 @@
+# 生产环境启动器
+# 使用Gunicorn预派生(prefork)多个工作进程运行Flask应用，
+# 并按CPU数量选择进程数、限制每个进程内OpenCV/BLAS/OpenMP的线程数，避免线程超额订阅
+import os
+import sys
+import argparse
+
+# 需要在工作进程中限制线程数的环境变量
+# 这些变量必须在numpy/cv2被导入之前设置才会生效
+NATIVE_THREAD_ENV_VARS = (
+    'OMP_NUM_THREADS',
+    'OPENBLAS_NUM_THREADS',
+    'MKL_NUM_THREADS',
+    'NUMEXPR_NUM_THREADS',
+    'VECLIB_MAXIMUM_THREADS',
+)
+
+# 默认配置，均可通过同名的CORE_ANALYSIS_*环境变量或命令行参数覆盖
+SERVER_DEFAULTS = {
+    # 监听地址
+    'bind': '127.0.0.1:8000',
+    # 工作进程数，0表示按CPU数量自动计算
+    'workers': 0,
+    # 每个工作进程的请求处理线程数
+    'threads': 2,
+    # 每个工作进程内OpenCV和BLAS/OpenMP可用的线程数
+    'native_threads': 1,
+    # 工作进程处理多少个请求后被回收重启，0表示不回收
+    'max_requests': 200,
+    # 回收阈值的随机抖动，避免所有进程同时重启
+    'max_requests_jitter': 20,
+    # 单个请求的超时时间（秒），大图像裂缝分析耗时较长
+    'timeout': 300,
+}
+
+
+def cpu_count():
+    """返回当前进程可用的CPU数量"""
+    # 优先使用调度亲和性，容器或taskset限制核数时更准确
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def load_server_config(overrides=None):
+    """读取启动配置：默认值 < 环境变量 < 命令行参数"""
+    config = dict(SERVER_DEFAULTS)
+    for key, default in SERVER_DEFAULTS.items():
+        env_value = os.environ.get(f'CORE_ANALYSIS_{key.upper()}')
+        if env_value is not None:
+            config[key] = type(default)(env_value)
+    for key, value in (overrides or {}).items():
+        if value is not None:
+            config[key] = value
+
+    # 每个进程的原生线程数至少为1
+    config['native_threads'] = max(1, int(config['native_threads']))
+    # 自动计算进程数：进程数 × 原生线程数 不超过CPU数量
+    if int(config['workers']) <= 0:
+        config['workers'] = max(1, cpu_count() // config['native_threads'])
+    return config
+
+
+def limit_native_threads(num_threads):
+    """限制当前进程中OpenCV和BLAS/OpenMP的线程数"""
+    for name in NATIVE_THREAD_ENV_VARS:
+        os.environ[name] = str(num_threads)
+    # 如果cv2已经导入（例如预加载了应用），直接设置其线程数
+    cv2 = sys.modules.get('cv2')
+    if cv2 is not None:
+        cv2.setNumThreads(num_threads)
+
+
+def build_gunicorn_options(config):
+    """将启动配置转换为Gunicorn配置项"""
+    native_threads = config['native_threads']
+
+    def post_fork(server, worker):
+        # 工作进程派生后、导入应用前限制线程数
+        limit_native_threads(native_threads)
+
+    def post_worker_init(worker):
+        # 应用导入后cv2已可用，再次设置以确保OpenCV线程池生效
+        limit_native_threads(native_threads)
+
+    return {
+        'bind': config['bind'],
+        'workers': config['workers'],
+        'threads': config['threads'],
+        'worker_class': 'gthread',
+        'max_requests': config['max_requests'],
+        'max_requests_jitter': config['max_requests_jitter'],
+        'timeout': config['timeout'],
+        # 不在主进程预加载应用，使环境变量在各工作进程导入numpy/cv2之前生效
+        'preload_app': False,
+        'post_fork': post_fork,
+        'post_worker_init': post_worker_init,
+    }
+
+
+def parse_args(argv=None):
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='地质岩心图文分析系统 - 生产环境服务器')
+    parser.add_argument('--bind', help=f"监听地址（默认 {SERVER_DEFAULTS['bind']}）")
+    parser.add_argument('--workers', type=int, help='工作进程数（默认按CPU数量自动计算）')
+    parser.add_argument('--threads', type=int, help='每个工作进程的请求处理线程数')
+    parser.add_argument('--native-threads', type=int, help='每个工作进程的OpenCV/BLAS线程数')
+    parser.add_argument('--max-requests', type=int, help='工作进程处理多少请求后回收，0表示不回收')
+    parser.add_argument('--max-requests-jitter', type=int, help='回收阈值的随机抖动')
+    parser.add_argument('--timeout', type=int, help='请求超时时间（秒）')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """生产环境入口"""
+    args = parse_args(argv)
+    config = load_server_config(vars(args))
+
+    print("\n" + "=" * 50)
+    print("地质岩心图文分析系统（生产模式）启动中...")
+    print(f"CPU数量: {cpu_count()}")
+    print(f"工作进程数: {config['workers']}，每进程线程数: {config['threads']}，"
+          f"每进程原生线程数: {config['native_threads']}")
+    print(f"进程回收阈值: {config['max_requests']} (抖动 {config['max_requests_jitter']})")
+    print(f"监听地址: {config['bind']}")
+    print("=" * 50 + "\n")
+
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError as e:
+        # Gunicorn不支持Windows，退回到Flask内置服务器（单进程、多线程、关闭调试）
+        print(f"Gunicorn导入失败: {e}，使用Flask内置服务器")
+        limit_native_threads(config['native_threads'])
+        from app import app
+        host, _, port = config['bind'].rpartition(':')
+        app.run(host=host or '127.0.0.1', port=int(port), debug=False, threaded=True)
+        return
+
+    class CoreAnalysisServer(BaseApplication):
+        """以编程方式配置的Gunicorn应用"""
+
+        def __init__(self, options):
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            # 在工作进程中导入应用
+            from app import app
+            return app
+
+    CoreAnalysisServer(build_gunicorn_options(config)).run()
+
+
+if __name__ == '__main__':
+    main()
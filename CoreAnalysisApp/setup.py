@@ -26,6 +26,16 @@ setup(
     # url='https://github.com/yourusername/geological-core-analysis',
     # 自动发现项目中的所有包
     packages=find_packages(),
+    # 项目根目录下的单文件模块
+    py_modules=['app', 'server', 'gui_main', 'hole_analysis', 'crack_analysis', 'grain_analysis',
+                'request_coalescing', 'admission_control',
+                'combined_analysis', 'tiling', 'analysis_jobs',
+                'canvas_blit', 'image_pyramid', 'live_preview',
+                'distribution_stats', 'batch_cli', 'shm_transport',
+                'buffer_pool', 'overlay', 'vector_overlay', 'spatial_index',
+                'feature_table', 'result_store', 'core_log',
+                'strip_stream', 'volume_analysis', 'grain_size',
+                'grain_separation', 'spatial_stats'],
     # 项目分类标签，帮助用户在PyPI等平台找到项目
     classifiers=[
         'Development Status :: 3 - Alpha',
@@ -70,7 +80,14 @@ setup(
     # 定义命令行入口点，方便通过命令行启动应用
     entry_points={
         'console_scripts': [
-            'core-analysis=app:main',  # 假设app.py中有main函数作为入口
+            'core-analysis=app:main',  # 开发服务器
+            'core-analysis-server=server:main',  # 生产服务器（Gunicorn多进程）
+            'core-analysis-batch=batch_cli:main',  # 命令行批量分析
+            'core-analysis-store=result_store:main',  # 分析结果库查询与导出
+            'core-analysis-log=core_log:main',  # 由结果库生成测井曲线
+            'core-analysis-stream=strip_stream:main',  # 线扫描条带流式分析
+            'core-analysis-volume=volume_analysis:main',  # CT切片序列三维分析
+            'core-analysis-grain-size=grain_size:main',  # 粒度分布合并统计
         ],
     },
     # 项目支持的Python版本
@@ -89,5 +106,8 @@ setup(
             'sphinx==7.2.5',  # 文档生成工具
             'sphinx-rtd-theme==1.6.0',  # 文档主题
         ],
+        'parquet': [
+            'pyarrow',  # 对象特征表导出为Parquet
+        ],
     }
 )
\ No newline at end of file
@@ -0,0 +1,311 @@
+# 进程间共享内存传递图像
+# 进程池执行分析时，直接把数百MB的图像和结果掩膜作为参数/返回值会被pickle序列化并通过管道复制。
+# 这里把解码后的图像和输出掩膜只写入一次共享内存段，进程之间只传递很小的句柄（段名、形状、数据类型）：
+# - 主进程通过SharedMemoryRegistry创建并跟踪所有共享内存段，用完后统一关闭并删除，避免泄漏
+# - 工作进程通过attached(句柄)映射共享内存段，只关闭不删除，段的删除只由主进程完成；
+#   进程池应由registry.pool()创建，Python 3.13之前据此判断工作进程是否与主进程共用resource_tracker
+import argparse
+import contextlib
+import pickle
+import sys
+import threading
+import time
+import weakref
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+
+class SharedArray:
+    """共享内存中数组的句柄，可以被pickle并传给其他进程"""
+
+    __slots__ = ('name', 'shape', 'dtype')
+
+    def __init__(self, name, shape, dtype):
+        self.name = name
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype).str
+
+    def __getstate__(self):
+        return self.name, self.shape, self.dtype
+
+    def __setstate__(self, state):
+        self.name, self.shape, self.dtype = state
+
+    @property
+    def nbytes(self):
+        return int(np.prod(self.shape)) * np.dtype(self.dtype).itemsize
+
+    def __repr__(self):
+        return f"SharedArray({self.name!r}, {self.shape}, {self.dtype!r})"
+
+
+# 关闭时仍被数组引用的共享内存映射，等引用释放后再关闭
+_deferred_segments = []
+
+
+def _close_segment(segment):
+    """关闭共享内存映射；仍有数组引用该映射时推迟到下次调用时再关闭"""
+    _deferred_segments.append(segment)
+    for pending in list(_deferred_segments):
+        try:
+            pending.close()
+        except BufferError:
+            continue
+        _deferred_segments.remove(pending)
+
+
+# 本进程是否为SharedMemoryRegistry.pool()创建的工作进程（与主进程共用resource_tracker）
+_registry_worker = False
+
+
+def _init_registry_worker(initializer, initargs):
+    """registry.pool()创建的工作进程的初始化函数"""
+    global _registry_worker
+    _registry_worker = True
+    if initializer is not None:
+        initializer(*initargs)
+
+
+def _attach_segment(name):
+    """在工作进程中映射已存在的共享内存段"""
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    # Python 3.13之前映射已有的段也会向resource_tracker注册。registry.pool()的工作进程在主进程启动tracker之后创建，
+    # 与主进程共用tracker，重复注册不产生新记录，不能注销（否则主进程删除该段时tracker找不到记录而报错）；
+    # 其他进程的注册会启动该进程自己的tracker，进程退出时它会删除该段，需要注销
+    segment = shared_memory.SharedMemory(name=name)
+    if not _registry_worker:
+        resource_tracker.unregister(segment._name, 'shared_memory')
+    return segment
+
+
+@contextlib.contextmanager
+def attached(handle):
+    """在with块内以numpy数组的形式访问共享内存段（工作进程使用）
+
+    with块结束后数组不再可用，需要保留的数据应先复制。
+    """
+    segment = _attach_segment(handle.name)
+    array = None
+    try:
+        array = np.ndarray(handle.shape, dtype=handle.dtype, buffer=segment.buf)
+        yield array
+    finally:
+        # 关闭映射前必须释放对共享内存缓冲区的引用，with语句绑定的变量可能仍引用该数组
+        del array
+        _close_segment(segment)
+
+
+def _release_all(segments):
+    """关闭并删除所有共享内存段（注册表被回收或进程退出时调用）"""
+    for segment in segments.values():
+        try:
+            segment.unlink()
+        except FileNotFoundError:
+            pass
+        _close_segment(segment)
+    segments.clear()
+
+
+class SharedMemoryRegistry:
+    """创建并跟踪主进程拥有的共享内存段
+
+    可作为上下文管理器使用，退出时删除所有未释放的段；注册表被回收或解释器退出时同样会清理。
+    """
+
+    def __init__(self):
+        # 启动resource_tracker，使之后创建的进程池的工作进程共用它
+        resource_tracker.ensure_running()
+        self._lock = threading.Lock()
+        self._segments = {}
+        # 统计计数
+        self._created = 0
+        self._peak_bytes = 0
+        self._finalizer = weakref.finalize(self, _release_all, self._segments)
+
+    def pool(self, processes=None, initializer=None, initargs=()):
+        """创建与主进程共用resource_tracker的进程池，供analyze_shared使用"""
+        import multiprocessing
+        return multiprocessing.Pool(processes, initializer=_init_registry_worker, initargs=(initializer, initargs))
+
+    def create(self, shape, dtype):
+        """分配共享内存数组，返回 (句柄, 主进程中的数组视图)"""
+        nbytes = max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize)
+        segment = shared_memory.SharedMemory(create=True, size=nbytes)
+        handle = SharedArray(segment.name, shape, dtype)
+        with self._lock:
+            self._segments[segment.name] = segment
+            self._created += 1
+            self._peak_bytes = max(self._peak_bytes, self._live_bytes())
+        return handle, np.ndarray(handle.shape, dtype=handle.dtype, buffer=segment.buf)
+
+    def put(self, array):
+        """将数组复制到新的共享内存段，返回句柄"""
+        handle, view = self.create(array.shape, array.dtype)
+        view[...] = array
+        return handle
+
+    def view(self, handle):
+        """返回主进程中共享内存段的数组视图"""
+        segment = self._segments[handle.name]
+        return np.ndarray(handle.shape, dtype=handle.dtype, buffer=segment.buf)
+
+    def release(self, handle):
+        """关闭并删除一个共享内存段，之后该段的数组视图不能再使用"""
+        with self._lock:
+            segment = self._segments.pop(handle.name, None)
+        if segment is not None:
+            # 删除后名称立即失效，所有映射关闭后内存被回收
+            segment.unlink()
+            _close_segment(segment)
+
+    def close(self):
+        """删除所有仍在跟踪的共享内存段"""
+        with self._lock:
+            _release_all(self._segments)
+
+    def _live_bytes(self):
+        return sum(segment.size for segment in self._segments.values())
+
+    def stats(self):
+        """返回共享内存统计"""
+        with self._lock:
+            return {
+                'live_segments': len(self._segments),
+                'live_bytes': self._live_bytes(),
+                'peak_bytes': self._peak_bytes,
+                'created': self._created,
+            }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# 各分析类型写入共享内存的输出图像：(输出名, 通道数)
+SHARED_OUTPUTS = {
+    'hole': (('二值图', 1), ('标记图', 3)),
+    'grain': (('二值图', 1), ('标记图', 3)),
+    'crack': (('二值图', 1), ('结果图', 3)),
+}
+
+
+def _analyze_in_worker(task):
+    """工作进程中执行的分析：从共享内存读取图像，将输出图像写入共享内存，只返回结果数据"""
+    analysis_type, image_handle, output_handles, params = task
+    from hole_analysis import process_stone_holes
+    from crack_analysis import process_crack
+    from grain_analysis import analyze_grains
+
+    with attached(image_handle) as image:
+        if analysis_type == 'crack':
+            output = process_crack(image, **params)
+            outputs = {'二值图': output.pop('二值图'), '结果图': output.pop('结果图')}
+            # 灰度图主进程可以自行计算，不再传回
+            output.pop('原图', None)
+            result = output
+        else:
+            analyzer = process_stone_holes if analysis_type == 'hole' else analyze_grains
+            result, _, binary, marked = analyzer(image, **params)
+            # 点分布中的KD树不传回主进程，需要时由主进程重新建立
+            if isinstance(result, dict):
+                result.pop('点分布', None)
+            outputs = {'二值图': binary, '标记图': marked}
+
+    for name, handle in output_handles.items():
+        with attached(handle) as out:
+            out[...] = outputs[name]
+    return result
+
+
+def analyze_shared(pool, registry, analysis_type, image, params=None, image_handle=None):
+    """在进程池中执行一次分析，图像和输出图像经由共享内存传递
+
+    pool应由registry.pool()创建。image_handle为已放入共享内存的图像句柄（同一图像执行多种分析时可复用），
+    否则将image复制到共享内存。
+    返回 (结果数据, {输出名: 数组})，输出数组为共享内存中的视图，
+    在调用registry.release()释放对应句柄之前有效；返回值中附带 '句柄' 键便于释放。
+    """
+    owns_image = image_handle is None
+    if owns_image:
+        image_handle = registry.put(image)
+    height, width = image_handle.shape[:2]
+    output_handles, outputs = {}, {}
+    for name, channels in SHARED_OUTPUTS[analysis_type]:
+        shape = (height, width) if channels == 1 else (height, width, channels)
+        output_handles[name], outputs[name] = registry.create(shape, np.uint8)
+    try:
+        result = pool.apply(_analyze_in_worker, ((analysis_type, image_handle, output_handles, params or {}),))
+    except BaseException:
+        for handle in output_handles.values():
+            registry.release(handle)
+        raise
+    finally:
+        if owns_image:
+            registry.release(image_handle)
+    outputs['句柄'] = list(output_handles.values())
+    return result, outputs
+
+
+def _echo_pickled(image):
+    """基准测试：通过pickle接收图像并返回同尺寸的掩膜"""
+    return np.empty(image.shape[:2], dtype=np.uint8)
+
+
+def _echo_shared(task):
+    """基准测试：通过共享内存读取图像并写入掩膜"""
+    image_handle, mask_handle = task
+    with attached(image_handle) as image, attached(mask_handle) as mask:
+        mask[...] = image[..., 0]
+    return None
+
+
+def measure_ipc_overhead(shape=(6000, 8000, 3), repeats=5, pool=None):
+    """比较pickle与共享内存两种方式往返传递图像和掩膜的耗时（秒/次）"""
+    image = np.random.randint(0, 256, shape, dtype=np.uint8)
+    own_pool = pool is None
+    with SharedMemoryRegistry() as registry:
+        pool = pool or registry.pool(1)
+        try:
+            # 预热进程池
+            pool.apply(_echo_pickled, (image[:1, :1],))
+            start = time.perf_counter()
+            for _ in range(repeats):
+                pool.apply(_echo_pickled, (image,))
+            pickled = (time.perf_counter() - start) / repeats
+
+            start = time.perf_counter()
+            for _ in range(repeats):
+                image_handle = registry.put(image)
+                mask_handle, mask = registry.create(shape[:2], np.uint8)
+                pool.apply(_echo_shared, ((image_handle, mask_handle),))
+                del mask
+                registry.release(image_handle)
+                registry.release(mask_handle)
+            shared = (time.perf_counter() - start) / repeats
+        finally:
+            if own_pool:
+                pool.close()
+                pool.join()
+    return {'shape': shape, 'nbytes': image.nbytes, 'pickle_seconds': pickled, 'shared_memory_seconds': shared,
+            'pickle_payload_bytes': len(pickle.dumps(image, protocol=pickle.HIGHEST_PROTOCOL))}
+
+
+def main(argv=None):
+    """命令行基准测试入口"""
+    parser = argparse.ArgumentParser(description='比较pickle与共享内存的进程间传输开销')
+    parser.add_argument('--size', default='6000x8000', help='图像尺寸 高x宽（默认 6000x8000）')
+    parser.add_argument('--repeats', type=int, default=5, help='重复次数')
+    args = parser.parse_args(argv)
+    height, width = (int(v) for v in args.size.lower().split('x'))
+    report = measure_ipc_overhead((height, width, 3), args.repeats)
+    print(f"[共享内存] 图像 {height}x{width}x3，{report['nbytes'] / 1e6:.1f} MB")
+    print(f"[共享内存] pickle: {report['pickle_seconds'] * 1000:.1f} ms/次")
+    print(f"[共享内存] 共享内存: {report['shared_memory_seconds'] * 1000:.1f} ms/次")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,298 @@
+# 检测对象的空间索引
+# 颗粒、孔洞多达数万个时，"鼠标下是哪个对象"和"当前视野内有哪些对象"逐个遍历轮廓列表的开销随对象数线性增长。
+# ObjectIndex 在对象外接矩形上建立均匀网格（每个网格单元记录与之相交的对象，按单元连续存放），
+# 视野查询只检查覆盖的网格单元中的候选对象；点查询使用标签图像（每个像素记录所在对象的序号）直接得到精确结果，
+# 标签图像在第一次点查询时才生成。对象质心上的KD树（spatial_stats.PointPattern）在第一次空间分布查询时建立
+# （孔洞分析已为整幅图像的统计建好时直接复用），之后任意区域的统计都复用同一棵树。ObjectIndexCache 按分析结果编号缓存索引，供 /objects 接口查询；
+# 指定共享目录时同时把建立索引用的特征表写入该目录，多进程部署中其他工作进程缓存未命中时由文件重建索引
+import glob
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from spatial_stats import PointPattern
+from feature_table import FeatureTable
+from vector_overlay import object_contours, object_attributes, object_table
+
+# 网格单元的最小边长（像素）
+MIN_CELL_SIZE = 16
+# 默认缓存的分析结果数（每个进程）
+DEFAULT_CACHE_SIZE = 8
+# 共享目录中默认保留的分析结果文件数
+DEFAULT_MAX_FILES = 64
+
+
+def default_cell_size(shape, count):
+    """按图像面积和对象数量选择网格单元边长，使每个单元平均约有一个对象"""
+    height, width = shape[:2]
+    return max(MIN_CELL_SIZE, int(np.sqrt(height * width / max(count, 1))))
+
+
+def make_result_id(request_key):
+    """由请求合并的键生成分析结果编号，相同图像、分析类型和参数得到相同的编号"""
+    return hashlib.sha1(repr(request_key).encode('utf-8')).hexdigest()[:16]
+
+
+class ObjectIndex:
+    """检测对象的空间索引
+
+    contours为对象轮廓，properties为与之对应的属性字典列表，对象序号即在列表中的下标。
+    centroids为可选的 n×2 对象质心，未提供时用外接矩形的中心。
+    坐标均为图像像素坐标，外接矩形按 [x0, y0, x1, y1)（右、下边界不含）存储。
+    """
+
+    def __init__(self, shape, contours, properties=None, cell_size=None, centroids=None):
+        self.height, self.width = shape[:2]
+        # 建立索引用的特征表（由分析结果建立时才有），写入共享目录时使用
+        self.table = None
+        self.contours = list(contours)
+        self.properties = properties if properties is not None else [{} for _ in self.contours]
+        count = len(self.contours)
+        rects = np.array([cv2.boundingRect(contour) for contour in self.contours], dtype=np.int64).reshape(-1, 4)
+        self.bboxes = np.column_stack([rects[:, 0], rects[:, 1], rects[:, 0] + rects[:, 2], rects[:, 1] + rects[:, 3]])
+        self.cell_size = int(cell_size or default_cell_size(shape, count))
+        self.cols = -(-self.width // self.cell_size)
+        self.rows = -(-self.height // self.cell_size)
+        self._build_grid()
+        # 标签图像，第一次点查询时生成
+        self._labels = None
+        self._centroids = centroids
+        # 质心的点分布（含KD树），第一次空间分布查询时建立
+        self._pattern = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_result(cls, analysis_type, result, shape, cell_size=None):
+        """由分析结果建立索引，对象属性与矢量叠加层中的一致；孔洞结果中已建好的点分布直接复用"""
+        table = object_table(analysis_type, result)
+        index = cls(shape, object_contours(analysis_type, result), object_attributes(analysis_type, result),
+                    cell_size, np.column_stack([table['centroid_x'], table['centroid_y']]))
+        index.table = table
+        index._pattern = result.get('点分布')
+        return index
+
+    @classmethod
+    def from_table(cls, analysis_type, table, shape, cell_size=None):
+        """由特征表建立索引，与由原分析结果建立的索引相同"""
+        key = '裂缝轮廓' if analysis_type == 'crack' else '轮廓列表'
+        return cls.from_result(analysis_type, {key: table.contours(), '对象表': table}, shape, cell_size)
+
+    def __len__(self):
+        return len(self.contours)
+
+    def _cell_range(self, x0, y0, x1, y1):
+        """外接矩形 [x0, x1) × [y0, y1) 覆盖的网格单元列、行范围（含两端）"""
+        size = self.cell_size
+        cx0 = np.clip(x0 // size, 0, self.cols - 1)
+        cx1 = np.clip((x1 - 1) // size, 0, self.cols - 1)
+        cy0 = np.clip(y0 // size, 0, self.rows - 1)
+        cy1 = np.clip((y1 - 1) // size, 0, self.rows - 1)
+        return cx0, cy0, cx1, cy1
+
+    def _build_grid(self):
+        """把每个对象登记到其外接矩形覆盖的所有网格单元，按单元编号排序后以偏移数组索引"""
+        cells = self.rows * self.cols
+        if len(self.bboxes) == 0:
+            self._cell_objects = np.empty(0, dtype=np.int32)
+            self._cell_offsets = np.zeros(cells + 1, dtype=np.int64)
+            return
+        cx0, cy0, cx1, cy1 = self._cell_range(*self.bboxes.T)
+        span_x = cx1 - cx0 + 1
+        counts = span_x * (cy1 - cy0 + 1)
+        # 展开为 (对象, 单元) 对：local为对象内的第几个单元，按行优先换算成单元的行列
+        objects = np.repeat(np.arange(len(self.bboxes)), counts)
+        local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        span_x = np.repeat(span_x, counts)
+        cell_ids = (np.repeat(cy0, counts) + local // span_x) * self.cols + np.repeat(cx0, counts) + local % span_x
+        order = np.argsort(cell_ids, kind='stable')
+        self._cell_objects = objects[order].astype(np.int32)
+        self._cell_offsets = np.zeros(cells + 1, dtype=np.int64)
+        np.cumsum(np.bincount(cell_ids, minlength=cells), out=self._cell_offsets[1:])
+
+    def query_bbox(self, x0, y0, x1, y1):
+        """返回外接矩形与区域 [x0, x1) × [y0, y1) 相交的对象序号（升序数组）"""
+        x0, y0 = max(int(np.floor(x0)), 0), max(int(np.floor(y0)), 0)
+        x1, y1 = min(int(np.ceil(x1)), self.width), min(int(np.ceil(y1)), self.height)
+        if len(self.bboxes) == 0 or x1 <= x0 or y1 <= y0:
+            return np.empty(0, dtype=np.int32)
+        cx0, cy0, cx1, cy1 = self._cell_range(x0, y0, x1, y1)
+        offsets = self._cell_offsets
+        # 每一行覆盖的单元在偏移数组中是连续的一段
+        candidates = np.unique(np.concatenate([
+            self._cell_objects[offsets[row * self.cols + cx0]:offsets[row * self.cols + cx1 + 1]]
+            for row in range(cy0, cy1 + 1)
+        ]))
+        boxes = self.bboxes[candidates]
+        hits = (boxes[:, 0] < x1) & (boxes[:, 2] > x0) & (boxes[:, 1] < y1) & (boxes[:, 3] > y0)
+        return candidates[hits]
+
+    def labels(self):
+        """标签图像：每个像素的值为所在对象的序号+1，0为背景；对象嵌套时较小的对象在上层"""
+        with self._lock:
+            if self._labels is None:
+                dtype = np.uint16 if len(self.contours) < np.iinfo(np.uint16).max else np.int32
+                labels = np.zeros((self.height, self.width), dtype=dtype)
+                areas = (self.bboxes[:, 2] - self.bboxes[:, 0]) * (self.bboxes[:, 3] - self.bboxes[:, 1])
+                # 外接矩形大的先画，嵌套在内部的小对象后画覆盖在上层
+                for index in np.argsort(-areas, kind='stable'):
+                    cv2.drawContours(labels, [self.contours[index]], -1, int(index) + 1, cv2.FILLED)
+                self._labels = labels
+            return self._labels
+
+    def point_pattern(self):
+        """对象质心的点分布（spatial_stats.PointPattern），第一次调用时建立KD树"""
+        with self._lock:
+            if self._pattern is None:
+                centroids = self._centroids
+                if centroids is None:
+                    centroids = (self.bboxes[:, :2] + self.bboxes[:, 2:]) / 2
+                self._pattern = PointPattern(centroids, (self.height, self.width))
+            return self._pattern
+
+    def spatial_statistics(self, x0, y0, x1, y1, radius=None):
+        """质心在区域 [x0, x1) × [y0, y1) 内的对象的空间分布统计，复用同一棵KD树"""
+        return self.point_pattern().statistics((x0, y0, x1, y1), radius)
+
+    def object_at(self, x, y):
+        """返回像素 (x, y) 处对象的序号（含轮廓线上的像素），没有对象时返回None"""
+        col, row = int(np.floor(x)), int(np.floor(y))
+        if len(self.contours) == 0 or not (0 <= col < self.width and 0 <= row < self.height):
+            return None
+        value = int(self.labels()[row, col])
+        return value - 1 if value else None
+
+    def record(self, index):
+        """对象的摘要：序号、外接矩形 [x, y, w, h] 和属性"""
+        x0, y0, x1, y1 = (int(v) for v in self.bboxes[index])
+        return {'id': int(index), 'bbox': [x0, y0, x1 - x0, y1 - y0], 'properties': self.properties[index]}
+
+    @property
+    def nbytes(self):
+        """索引占用的内存（字节），不含轮廓"""
+        labels = self._labels.nbytes if self._labels is not None else 0
+        # KD树的节点未计入，按点坐标、最近邻距离和排序数组估算
+        pattern = self._pattern.points.nbytes * 2 if self._pattern is not None else 0
+        return self.bboxes.nbytes + self._cell_objects.nbytes + self._cell_offsets.nbytes + labels + pattern
+
+
+class ObjectIndexCache:
+    """按分析结果编号缓存空间索引，超出容量时淘汰最久未使用的索引（线程安全）
+
+    内存中的缓存只在单个进程内生效。directory不为None时，put同时把特征表、分析类型和图像尺寸写入
+    directory/<结果编号>.npz（目录中最多保留max_files个，按修改时间删除最旧的），同一台机器上的
+    其他进程（如Gunicorn的各工作进程）缓存未命中时读取该文件重建索引。
+    """
+
+    def __init__(self, max_entries=DEFAULT_CACHE_SIZE, directory=None, max_files=DEFAULT_MAX_FILES):
+        self.max_entries = max_entries
+        self.directory = directory
+        self.max_files = max_files
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        # 统计计数
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._loads = 0
+
+    def put(self, result_id, index, analysis_type=None):
+        """缓存一个分析结果的索引"""
+        self._remember(result_id, index, analysis_type)
+        if self.directory is not None and index.table is not None:
+            self._save(result_id, index, analysis_type)
+
+    def _remember(self, result_id, index, analysis_type):
+        with self._lock:
+            self._entries[result_id] = (analysis_type, index)
+            self._entries.move_to_end(result_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def _path(self, result_id):
+        # 结果编号来自请求参数，只接受make_result_id生成的十六进制字符串，防止访问目录以外的文件
+        if not result_id or not all(c in '0123456789abcdef' for c in result_id):
+            return None
+        return os.path.join(self.directory, f'{result_id}.npz')
+
+    def _save(self, result_id, index, analysis_type):
+        """写入共享目录：先写临时文件再改名，其他进程不会读到写了一半的文件"""
+        path = self._path(result_id)
+        if path is None:
+            return
+        table = index.table
+        descriptor, temporary = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'wb') as f:
+                np.savez(f, records=table.records, coords=table.coords, offsets=table.offsets,
+                         analysis=np.array(analysis_type or ''), shape=np.array([index.height, index.width]))
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+        # 删除最旧的文件；其他进程可能同时删除，忽略已不存在的文件
+        paths = glob.glob(os.path.join(self.directory, '*.npz'))
+        if len(paths) > self.max_files:
+            def modified(name):
+                try:
+                    return os.path.getmtime(name)
+                except OSError:
+                    return 0.0
+            for old in sorted(paths, key=modified)[:len(paths) - self.max_files]:
+                try:
+                    os.unlink(old)
+                except OSError:
+                    pass
+
+    def _load(self, result_id):
+        """从共享目录读取特征表并重建索引，文件不存在时返回None"""
+        path = self._path(result_id)
+        if path is None:
+            return None
+        try:
+            with np.load(path) as data:
+                table = FeatureTable(data['records'], data['coords'], data['offsets'])
+                analysis_type = str(data['analysis']) or None
+                shape = tuple(int(v) for v in data['shape'])
+        except (OSError, ValueError, KeyError):
+            return None
+        index = ObjectIndex.from_table(analysis_type, table, shape)
+        self._remember(result_id, index, analysis_type)
+        return analysis_type, index
+
+    def get(self, result_id):
+        """返回 (分析类型, 索引)，不存在或已被淘汰时返回None"""
+        with self._lock:
+            entry = self._entries.get(result_id)
+            if entry is not None:
+                self._entries.move_to_end(result_id)
+                self._hits += 1
+                return entry
+            self._misses += 1
+        if self.directory is None:
+            return None
+        entry = self._load(result_id)
+        if entry is not None:
+            with self._lock:
+                self._loads += 1
+        return entry
+
+    def stats(self):
+        """返回缓存统计，用于/metrics"""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+                'loads': self._loads,
+                'bytes': sum(index.nbytes for _, index in self._entries.values()),
+            }
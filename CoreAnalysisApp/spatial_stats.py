@@ -0,0 +1,171 @@
+# 点分布的空间统计
+# 以对象（孔洞等）的质心为点，用KD树（scipy.spatial.cKDTree）计算最近邻距离分布、Clark-Evans聚集指数、
+# 给定半径内的邻居数和聚集团，建树和查询都是 O(n log n)。PointPattern 只建一次树，
+# 任意矩形子区域的统计复用同一棵树：区域内的点的最近邻和邻居可以在区域之外（外围作为缓冲区），
+# 因此只有与图像边界重合的那部分区域边界需要边缘校正（Donnelly校正）
+import math
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial import cKDTree
+
+# Clark-Evans比的显著性检验阈值（双侧5%）
+Z_CRITICAL = 1.96
+# 聚集半径的上限为default_radius的倍数：完全随机分布时半径内平均约有 π×倍数²/4 个邻居（4倍约12个），
+# 邻接点对数随点数线性增长；半径不受限时点对数按 n² 增长，会耗尽内存
+MAX_RADIUS_FACTOR = 4.0
+# 邻接矩阵最多包含的点对数：点高度聚集时即使半径不超过上限点对数也可能很大，建矩阵前先计数
+# （cKDTree.count_neighbors只计数不生成点对），超过时不生成邻接矩阵
+MAX_PAIRS = 2_000_000
+# 每个点分布缓存的邻接矩阵数（按半径，淘汰最久未使用的）
+GRAPH_CACHE_SIZE = 2
+
+
+def _distribution(values):
+    """距离数组的摘要"""
+    return {'平均': float(values.mean()), '中位数': float(np.median(values)), '标准差': float(values.std()),
+            '最小': float(values.min()), '最大': float(values.max())}
+
+
+class PointPattern:
+    """图像中的点分布，shape为图像形状，points为 n×2 的 (x, y) 坐标"""
+
+    def __init__(self, points, shape):
+        self.points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        self.height, self.width = shape[:2]
+        self.tree = cKDTree(self.points)
+        # 每个点到最近的其他点的距离，只有一个点时为inf
+        if len(self.points) > 1:
+            self.nn_distances = self.tree.query(self.points, k=2)[0][:, 1]
+        else:
+            self.nn_distances = np.full(len(self.points), np.inf)
+        # 按x坐标排序的点序号，子区域先用二分查找取出x范围内的点
+        self._order = np.argsort(self.points[:, 0], kind='stable')
+        self._sorted_x = self.points[self._order, 0]
+        # {半径: 距离不超过半径的点之间的邻接矩阵（CSR）}，最多GRAPH_CACHE_SIZE个
+        self._graphs = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_table(cls, table, shape):
+        """以特征表（feature_table.FeatureTable）中各对象的质心为点"""
+        return cls(np.column_stack([table['centroid_x'], table['centroid_y']]), shape)
+
+    def __len__(self):
+        return len(self.points)
+
+    @property
+    def default_radius(self):
+        """默认聚集半径：整幅图像中同样数量的点完全随机分布时的期望最近邻距离"""
+        return 0.5 * np.sqrt(self.width * self.height / max(len(self.points), 1))
+
+    @property
+    def max_radius(self):
+        """允许的最大聚集半径"""
+        return MAX_RADIUS_FACTOR * self.default_radius
+
+    def check_radius(self, radius):
+        """检查聚集半径，返回float；不是 (0, max_radius] 内的有限数时抛出ValueError"""
+        radius = float(radius)
+        if not (math.isfinite(radius) and 0 < radius <= self.max_radius):
+            raise ValueError(f"聚集半径应为不超过 {self.max_radius:.4g} 的正数: {radius}")
+        return radius
+
+    def graph(self, radius):
+        """距离不超过radius的点之间的对称邻接矩阵（CSR），按半径缓存最近使用的GRAPH_CACHE_SIZE个
+
+        半径无效或点对数超过MAX_PAIRS时抛出ValueError。
+        """
+        radius = self.check_radius(radius)
+        with self._lock:
+            if radius in self._graphs:
+                self._graphs.move_to_end(radius)
+            else:
+                # count_neighbors计入每个点自身，且每对点计两次
+                pair_count = (int(self.tree.count_neighbors(self.tree, radius)) - len(self.points)) // 2
+                if pair_count > MAX_PAIRS:
+                    raise ValueError(f"聚集半径 {radius:.4g} 内的点对数 {pair_count} 超过上限 {MAX_PAIRS}，请减小半径")
+                pairs = self.tree.query_pairs(radius, output_type='ndarray')
+                rows = np.concatenate([pairs[:, 0], pairs[:, 1]])
+                cols = np.concatenate([pairs[:, 1], pairs[:, 0]])
+                count = len(self.points)
+                self._graphs[radius] = csr_matrix((np.ones(len(rows), dtype=np.int8), (rows, cols)),
+                                                  shape=(count, count))
+                while len(self._graphs) > GRAPH_CACHE_SIZE:
+                    self._graphs.popitem(last=False)
+            return self._graphs[radius]
+
+    def select(self, x0, y0, x1, y1):
+        """区域 [x0, x1) × [y0, y1) 内的点序号（升序）"""
+        start, stop = np.searchsorted(self._sorted_x, [x0, x1], side='left')
+        candidates = self._order[start:stop]
+        y = self.points[candidates, 1]
+        return np.sort(candidates[(y >= y0) & (y < y1)])
+
+    def statistics(self, region=None, radius=None):
+        """区域 (x0, y0, x1, y1)（默认整幅图像）内的点的空间分布统计
+
+        radius为聚集半径（默认为default_radius，各子区域使用相同的半径便于比较，不能超过max_radius），
+        距离不超过半径的点相连，连通的点组成聚集团。区域含nan、inf或半径无效时抛出ValueError；
+        使用默认半径且点对数超过MAX_PAIRS时不统计聚集团（相应的值为None），指定半径时抛出ValueError。
+        """
+        explicit = radius is not None
+        x0, y0, x1, y1 = region if region is not None else (0, 0, self.width, self.height)
+        if not all(math.isfinite(float(v)) for v in (x0, y0, x1, y1)):
+            raise ValueError(f"区域坐标应为有限数: {region}")
+        x0, y0 = max(float(x0), 0.0), max(float(y0), 0.0)
+        x1, y1 = min(float(x1), self.width), min(float(y1), self.height)
+        radius = self.check_radius(radius) if explicit else float(self.default_radius)
+        inside = self.select(x0, y0, x1, y1)
+        count = len(inside)
+        area = max(x1 - x0, 0.0) * max(y1 - y0, 0.0)
+        summary = {'点数': count, '区域面积': area, '密度': count / area if area else 0.0, '聚集半径': radius}
+        if count < 2 or len(self.points) < 2:
+            return summary
+
+        distances = self.nn_distances[inside]
+        # 只有与图像边界重合的区域边界存在边缘效应（最近邻可能在图像之外）
+        border = (x1 - x0) * ((y0 <= 0) + (y1 >= self.height)) + (y1 - y0) * ((x0 <= 0) + (x1 >= self.width))
+        # Donnelly校正的完全随机分布期望最近邻距离及其标准误差
+        expected = 0.5 * np.sqrt(area / count) + (0.0514 + 0.041 / np.sqrt(count)) * border / count
+        error = np.sqrt(0.070 * area / count ** 2 + 0.037 * border * np.sqrt(area / count ** 5))
+        observed = float(distances.mean())
+        z = (observed - expected) / error
+        if z < -Z_CRITICAL:
+            pattern = '聚集'
+        elif z > Z_CRITICAL:
+            pattern = '均匀'
+        else:
+            pattern = '随机'
+
+        summary.update({
+            '最近邻距离': _distribution(distances),
+            'Clark-Evans比': float(observed / expected),
+            'Z值': float(z),
+            '分布类型': pattern,
+            '半径内平均邻居数': None,
+            '聚集团数': None,
+            '聚集点占比': None,
+            '最大聚集团点数': None,
+        })
+        try:
+            graph = self.graph(radius)
+        except ValueError:
+            if explicit:
+                raise
+            return summary
+        # 区域内的点之间的连通关系：邻接矩阵中区域内的点对应的子矩阵
+        _, labels = connected_components(graph[inside][:, inside], directed=False)
+        sizes = np.bincount(labels)
+        clustered = sizes[sizes > 1]
+        summary.update({
+            # 半径内的邻居数（不含自身，邻居可以在区域之外）即邻接矩阵各行的非零元素数
+            '半径内平均邻居数': float(np.diff(graph.indptr)[inside].mean()),
+            '聚集团数': int(len(clustered)),
+            '聚集点占比': float(clustered.sum() / count),
+            '最大聚集团点数': int(sizes.max()),
+        })
+        return summary
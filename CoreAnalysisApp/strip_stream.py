@@ -0,0 +1,323 @@
+# 线扫描条带的流式分析
+# 岩心扫描仪连续输出图像条带（每个条带为若干行，宽度相同，按深度方向依次排列）。
+# StripAnalyzer 把新条带接在保留的缓冲行之后组成分析窗口，对窗口执行孔洞/裂缝/粒度分析：
+# - 对象归属：每个对象的锚点为其最上方一行（与tiling相同的思路）。committed之前的行中锚点已处理过的对象
+#   不再重复输出；距窗口底边不足margin行的对象可能延伸到后续条带，推迟到下一个窗口再确定
+# - 新的committed取"窗口底边-margin"与所有被推迟对象锚点中的较小值，锚点在其之前的对象全部确定输出
+# - 缓冲区只保留committed之前halo行（邻域处理的上下文）到窗口底边的行，下一个条带接在其后
+# - 被推迟的对象超过max_carry行仍未结束时（如贯穿整段岩心的长裂缝），在窗口底边截断输出并计数，
+#   因此无论岩心多长，缓冲区都不超过 max_carry + halo 行加一个条带
+# - 裂缝分析的对比度均衡化按分块统计直方图，默认分块数固定为8x8，结果随窗口高度变化。流式分析改为固定边长的
+#   分块（默认为不超过条带宽度1/8的最大2的整数次幂），窗口的上下边界对齐到分块边界，margin和halo各增加一个分块。
+#   OpenCV按窗口内的行号以单精度计算插值权重（行号×(1/分块边长)），分块边长为2的整数次幂时该乘法没有舍入误差，
+#   窗口内与整幅图像上的权重完全相同；因此得到的对象与对整幅岩心图像使用相同clahe_tile的process_crack完全一致
+# 每个条带处理后返回新确定的对象（整幅岩心的行坐标）和累计统计，可以边扫描边发布部分结果
+import argparse
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from batch_cli import ANALYSIS_TYPES, IMAGE_EXTENSIONS, MEASURE_OPTIONS, add_analysis_arguments, analysis_params
+from crack_analysis import process_crack
+from feature_table import FeatureTable, table_from_output
+from grain_analysis import analyze_grains
+from grain_size import GrainSizeHistogram, phi_scale
+from hole_analysis import process_stone_holes
+
+# 距窗口底边不足该行数的对象推迟确定（不小于halo）
+DEFAULT_MARGIN = 64
+# committed之前保留的上下文行数，应不小于各分析邻域处理的影响半径之和
+DEFAULT_HALO = 32
+# 缓冲区保留的最大行数
+DEFAULT_MAX_CARRY = 4096
+
+
+def _empty_totals(analysis_type):
+    """一种分析的累计统计初始值"""
+    totals = {'count': 0, 'total_area': 0.0}
+    if analysis_type == 'crack':
+        totals.update(total_length=0.0, max_width=0.0)
+    if analysis_type == 'grain':
+        # 由累计的粒度直方图得到，尚无颗粒时为None
+        totals.update(d50=None, sorting=None)
+    return totals
+
+
+class StripAnalyzer:
+    """逐条带增量分析
+
+    analysis_types为要执行的分析类型，params为 {分析类型: 分析函数的参数字典}。
+    feed(strip)接收一个条带（BGR图像，宽度必须一致），finish()在扫描结束时处理缓冲区中剩余的行；
+    二者都返回本次新确定的对象和累计统计。
+    """
+
+    def __init__(self, analysis_types=ANALYSIS_TYPES, params=None, margin=DEFAULT_MARGIN, halo=DEFAULT_HALO,
+                 max_carry=DEFAULT_MAX_CARRY):
+        if margin < halo:
+            raise ValueError("margin不能小于halo")
+        if max_carry <= margin + halo:
+            raise ValueError("max_carry必须大于margin与halo之和")
+        self._analyzers = {'hole': process_stone_holes, 'crack': process_crack, 'grain': analyze_grains}
+        self.analysis_types = tuple(analysis_types)
+        self.params = params or {}
+        self.margin, self.halo, self.max_carry = margin, halo, max_carry
+        # 缓冲区及其第一行的全局行号
+        self._buffer = None
+        self._buffer_top = 0
+        # 已接收的总行数；该行之前锚点的对象都已确定
+        self.rows = 0
+        self.committed = 0
+        self.strips = 0
+        # 在缓冲区上限处被截断输出的对象数
+        self.truncated = 0
+        self.totals = {analysis_type: _empty_totals(analysis_type) for analysis_type in self.analysis_types}
+        # 已确定颗粒的φ直方图，每次更新只加入新确定的颗粒
+        self.grain_sizes = GrainSizeHistogram()
+        # 裂缝均衡化的分块边长（2的整数次幂），收到第一个条带时确定；窗口边界对齐到该行数的整数倍
+        self.clahe_tile = None
+        self._align = 1
+
+    def _configure(self, width):
+        """按条带宽度确定裂缝均衡化的分块边长和窗口对齐"""
+        if 'crack' not in self.analysis_types:
+            return
+        params = dict(self.params.get('crack', {}))
+        self.clahe_tile = int(params.get('clahe_tile') or 1 << (max(width // 8, 1).bit_length() - 1))
+        if self.clahe_tile & (self.clahe_tile - 1):
+            raise ValueError(f"均衡化分块边长必须为2的整数次幂: {self.clahe_tile}")
+        params['clahe_tile'] = self.clahe_tile
+        self.params = dict(self.params, crack=params)
+        self._align = self.clahe_tile
+        if self.max_carry <= self.margin + self.halo + 3 * self._align:
+            raise ValueError(f"max_carry必须大于margin、halo与3倍均衡化分块边长（{self._align}）之和")
+
+    def feed(self, strip):
+        """接收一个条带并分析，返回本次更新"""
+        if self._buffer is None:
+            if self.rows == 0:
+                self._configure(strip.shape[1])
+        elif strip.shape[1:] != self._buffer.shape[1:]:
+            raise ValueError(f"条带尺寸不一致: {strip.shape[1:]}，应为 {self._buffer.shape[1:]}")
+        self._buffer = strip if self._buffer is None else np.concatenate([self._buffer, strip])
+        self.rows += len(strip)
+        self.strips += 1
+        return self._process(final=False)
+
+    def finish(self):
+        """扫描结束：确定缓冲区中剩余的全部对象"""
+        if self._buffer is None:
+            return self._update({}, 0)
+        return self._process(final=True)
+
+    def _analyze(self, window):
+        """对窗口执行各分析，返回 {分析类型: 特征表（窗口坐标）}"""
+        gray = cv2.cvtColor(window, cv2.COLOR_BGR2GRAY)
+        tables = {}
+        for analysis_type in self.analysis_types:
+            output = self._analyzers[analysis_type](window, gray=gray, render=False,
+                                                    **self.params.get(analysis_type, {}),
+                                                    **MEASURE_OPTIONS.get(analysis_type, {}))
+            table = table_from_output(analysis_type, output)
+            tables[analysis_type] = table if table is not None else FeatureTable.from_contours([])
+        return tables
+
+    def _process(self, final):
+        top = self._buffer_top
+        # 窗口底边对齐到分块边界，不足一个分块的行留在缓冲区中等待后续条带
+        bottom = top + len(self._buffer)
+        if not final:
+            bottom -= bottom % self._align
+        margin = self.margin + (self._align if self._align > 1 else 0)
+        if bottom - top <= margin:
+            return self._update({}, len(self._buffer))
+        tables = self._analyze(self._buffer[:bottom - top])
+
+        # 各分析共用同一个缓冲区，新的committed取所有分析中被推迟对象锚点的最小值
+        committed = bottom if final else bottom - margin
+        anchors = {}
+        for analysis_type, table in tables.items():
+            anchor = table['bbox_y'].astype(np.int64) + top
+            end = anchor + table['bbox_h']
+            anchors[analysis_type] = (anchor, end)
+            if not final:
+                pending = (anchor >= self.committed) & (end > bottom - margin)
+                if pending.any():
+                    committed = min(committed, int(anchor[pending].min()))
+        # 缓冲区超过上限时强制推进，跨越新committed的对象在窗口底边截断
+        if not final and bottom - committed > self.max_carry:
+            committed = bottom - self.max_carry
+
+        finalized = {}
+        for analysis_type, table in tables.items():
+            anchor, end = anchors[analysis_type]
+            done = (anchor >= self.committed) & (anchor < committed)
+            if not final:
+                self.truncated += int(np.count_nonzero(done & (end > bottom - margin)))
+            finalized[analysis_type] = table.select(done).translate(0, top)
+            self._accumulate(analysis_type, finalized[analysis_type])
+        self.committed = max(self.committed, committed)
+
+        # 只保留committed之前halo行（对齐到分块边界）之后的行（复制，释放已确定部分的内存）
+        halo = self.halo + (self._align if self._align > 1 else 0)
+        keep = max(self.committed - halo, top)
+        keep -= keep % self._align
+        if final:
+            self._buffer, self._buffer_top = None, bottom
+        else:
+            self._buffer, self._buffer_top = self._buffer[keep - top:].copy(), keep
+        return self._update(finalized, 0 if self._buffer is None else len(self._buffer))
+
+    def _accumulate(self, analysis_type, table):
+        totals = self.totals[analysis_type]
+        totals['count'] += len(table)
+        totals['total_area'] += float(table['area'].sum())
+        if analysis_type == 'crack' and len(table):
+            totals['total_length'] += float(table['perimeter'].sum())
+            totals['max_width'] = max(totals['max_width'], float(np.nan_to_num(table['width_max']).max()))
+        if analysis_type == 'grain' and len(table):
+            pixel_size = self.params.get('grain', {}).get('pixel_size', 1.0)
+            self.grain_sizes.add(phi_scale(table['equivalent_diameter'], pixel_size))
+            statistics = self.grain_sizes.statistics()
+            totals['d50'], totals['sorting'] = statistics['D50'], statistics['分选系数']
+
+    def _update(self, finalized, buffer_rows):
+        """本次更新：新确定的对象（特征表）、进度和累计统计"""
+        return {'strip': self.strips, 'rows': self.rows, 'committed': self.committed, 'buffer_rows': buffer_rows,
+                'truncated': self.truncated, 'objects': finalized,
+                'totals': {analysis_type: dict(totals) for analysis_type, totals in self.totals.items()}}
+
+
+def iter_directory(directory, poll=1.0, idle_timeout=0.0, end_marker='END', settle=5.0):
+    """按文件名顺序逐个读取目录中新出现的条带图像
+
+    出现名为end_marker的文件、或超过idle_timeout秒（0表示一直等待）没有新条带时结束。
+    只记录最后处理的文件名，文件名应按扫描顺序递增（如 strip_000001.png）。
+    暂时无法读取的文件（扫描仪尚未写完）在下次轮询时重试，修改后超过settle秒仍无法读取时跳过。
+    """
+    last = ''
+    idle_since = time.monotonic()
+    while True:
+        names = sorted(entry.name for entry in os.scandir(directory)
+                       if entry.is_file() and entry.name.lower().endswith(IMAGE_EXTENSIONS) and entry.name > last)
+        for name in names:
+            path = os.path.join(directory, name)
+            strip = cv2.imread(path)
+            if strip is None:
+                if time.time() - os.path.getmtime(path) < settle:
+                    break
+                print(f"[流式分析] 无法读取，跳过: {path}", file=sys.stderr)
+            else:
+                yield strip
+            last = name
+            idle_since = time.monotonic()
+        else:
+            if os.path.exists(os.path.join(directory, end_marker)):
+                return
+            if idle_timeout and time.monotonic() - idle_since > idle_timeout:
+                print(f"[流式分析] {idle_timeout} 秒内没有新条带，结束", file=sys.stderr)
+                return
+        time.sleep(poll)
+
+
+def iter_pipe(stream, width, channels=3, strip_rows=256):
+    """从管道（二进制流）读取原始uint8像素，每次返回strip_rows行的BGR条带，流结束时返回剩余的完整行"""
+    row_bytes = width * channels
+    buffer = bytearray(row_bytes * strip_rows)
+    while True:
+        view = memoryview(buffer)
+        filled = 0
+        while filled < len(buffer):
+            count = stream.readinto(view[filled:])
+            if not count:
+                break
+            filled += count
+        rows = filled // row_bytes
+        if rows:
+            strip = np.frombuffer(buffer, dtype=np.uint8, count=rows * row_bytes).reshape(rows, width, channels)
+            yield cv2.cvtColor(strip, cv2.COLOR_GRAY2BGR) if channels == 1 else strip.copy()
+        if filled < len(buffer):
+            return
+
+
+def _publish(update, out, depth_top=None, rows_per_metre=None):
+    """把一次更新写为一行JSON（不含对象明细）"""
+    line = {key: update[key] for key in ('strip', 'rows', 'committed', 'buffer_rows', 'truncated')}
+    if depth_top is not None and rows_per_metre:
+        line['committed_depth'] = depth_top + update['committed'] / rows_per_metre
+    line['new'] = {analysis_type: len(table) for analysis_type, table in update['objects'].items()}
+    line['totals'] = update['totals']
+    out.write(json.dumps(line, ensure_ascii=False) + '\n')
+    out.flush()
+
+
+def main(argv=None):
+    """命令行入口：监视目录或读取管道中的条带，逐条带发布分析进度（JSON Lines）"""
+    parser = argparse.ArgumentParser(description='地质岩心图文分析系统 - 线扫描条带流式分析')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--watch', metavar='目录', help='监视目录中按文件名顺序出现的条带图像')
+    source.add_argument('--pipe', metavar='路径', help='从管道读取原始像素（"-"为标准输入），需指定 --width')
+    parser.add_argument('-a', '--analysis', action='append', choices=ANALYSIS_TYPES,
+                        help='分析类型，可重复指定（默认全部）')
+    parser.add_argument('-o', '--output', help='进度输出文件（.jsonl，默认输出到终端）')
+    parser.add_argument('--features-dir', help='保存每次更新新确定对象的特征表（.npz）的目录')
+    parser.add_argument('--width', type=int, help='管道输入的图像宽度（像素）')
+    parser.add_argument('--channels', type=int, choices=(1, 3), default=3, help='管道输入的通道数（1为灰度，3为BGR）')
+    parser.add_argument('--strip-rows', type=int, default=256, help='管道输入每个条带的行数')
+    parser.add_argument('--poll', type=float, default=1.0, help='监视目录的轮询间隔（秒）')
+    parser.add_argument('--idle-timeout', type=float, default=0.0, help='超过该秒数没有新条带时结束（0表示一直等待）')
+    parser.add_argument('--end-marker', default='END', help='监视目录中表示扫描结束的文件名')
+    parser.add_argument('--margin', type=int, default=DEFAULT_MARGIN, help='距窗口底边不足该行数的对象推迟确定')
+    parser.add_argument('--halo', type=int, default=DEFAULT_HALO, help='保留的上下文行数')
+    parser.add_argument('--max-carry', type=int, default=DEFAULT_MAX_CARRY, help='缓冲区最大行数')
+    parser.add_argument('--depth-top', type=float, help='第一行的深度（米），与 --rows-per-metre 一起给出时输出确定位置的深度')
+    parser.add_argument('--rows-per-metre', type=float, help='每米岩心的行数')
+    add_analysis_arguments(parser)
+    args = parser.parse_args(argv)
+
+    if args.pipe and not args.width:
+        parser.error('--pipe 需要指定 --width')
+    params = analysis_params(args)
+    analyzer = StripAnalyzer(tuple(dict.fromkeys(args.analysis or ANALYSIS_TYPES)), params,
+                             args.margin, args.halo, args.max_carry)
+    if args.features_dir:
+        os.makedirs(args.features_dir, exist_ok=True)
+    if args.watch:
+        strips = iter_directory(args.watch, args.poll, args.idle_timeout, args.end_marker)
+        stream = None
+    else:
+        stream = sys.stdin.buffer if args.pipe == '-' else open(args.pipe, 'rb')
+        strips = iter_pipe(stream, args.width, args.channels, args.strip_rows)
+    out = open(args.output, 'a', encoding='utf-8') if args.output else sys.stdout
+    # 特征表文件的序号（扫描结束时的最后一次更新也单独保存）
+    sequence = [0]
+
+    def handle(update):
+        _publish(update, out, args.depth_top, args.rows_per_metre)
+        sequence[0] += 1
+        if args.features_dir:
+            for analysis_type, table in update['objects'].items():
+                if len(table):
+                    table.save(os.path.join(args.features_dir, f"update_{sequence[0]:06d}_{analysis_type}.npz"))
+
+    try:
+        for strip in strips:
+            handle(analyzer.feed(strip))
+    except KeyboardInterrupt:
+        print("[流式分析] 已中断，确定缓冲区中剩余的对象", file=sys.stderr)
+    finally:
+        if stream is not None and stream is not sys.stdin.buffer:
+            stream.close()
+    handle(analyzer.finish())
+    if out is not sys.stdout:
+        out.close()
+    print(f"[流式分析] 完成：{analyzer.strips} 个条带，{analyzer.rows} 行，截断对象 {analyzer.truncated} 个",
+          file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
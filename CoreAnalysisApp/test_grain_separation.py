@@ -0,0 +1,79 @@
+# 粘连颗粒分离的测试：分割后各部分的面积应与原来的单个颗粒一致
+import cv2
+import numpy as np
+
+from grain_analysis import analyze_grains
+from grain_separation import separate_touching, split_component
+
+
+def _touching_circles(radius, distance, shape=(200, 260)):
+    """两个部分重叠的圆组成的颗粒团，返回 (外轮廓, 单个圆的面积)"""
+    mask = np.zeros(shape, np.uint8)
+    center_y, center_x = shape[0] // 2, shape[1] // 2
+    cv2.circle(mask, (center_x - distance // 2, center_y), radius, 255, -1)
+    cv2.circle(mask, (center_x + distance - distance // 2, center_y), radius, 255, -1)
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    single = np.zeros(shape, np.uint8)
+    cv2.circle(single, (center_x, center_y), radius, 255, -1)
+    return contours[0], int(np.count_nonzero(single))
+
+
+def test_split_pieces_have_equal_areas():
+    contour, single_area = _touching_circles(30, 54)
+    pieces = split_component(contour)
+    assert pieces is not None and len(pieces) == 2
+    areas = sorted(cv2.contourArea(piece) for piece in pieces)
+    # 两部分面积相近，且都接近单个圆的面积（重叠部分由两侧平分）
+    assert areas[0] / areas[1] > 0.9
+    for area in areas:
+        assert 0.8 * single_area < area < 1.05 * single_area
+
+
+def test_unequal_pair_keeps_size_ratio():
+    mask = np.zeros((200, 260), np.uint8)
+    cv2.circle(mask, (100, 100), 40, 255, -1)
+    cv2.circle(mask, (160, 100), 25, 255, -1)
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    pieces = split_component(contours[0])
+    assert pieces is not None and len(pieces) == 2
+    small, large = sorted(cv2.contourArea(piece) for piece in pieces)
+    assert 0.7 * np.pi * 25 ** 2 < small < 1.05 * np.pi * 25 ** 2
+    assert 0.85 * np.pi * 40 ** 2 < large < 1.05 * np.pi * 40 ** 2
+
+
+def test_single_grain_is_not_split():
+    mask = np.zeros((120, 120), np.uint8)
+    cv2.circle(mask, (60, 60), 35, 255, -1)
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    assert split_component(contours[0]) is None
+
+
+def test_separate_touching_replaces_only_merged():
+    pair, single_area = _touching_circles(30, 54)
+    mask = np.zeros((200, 260), np.uint8)
+    cv2.circle(mask, (130, 100), 30, 255, -1)
+    round_contour = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)[0][0]
+    contours = [round_contour, pair]
+    areas = [cv2.contourArea(contour) for contour in contours]
+    separated, separated_areas, split_count = separate_touching(contours, areas, min_area=100)
+    assert split_count == 1
+    assert len(separated) == 3
+    assert separated_areas[0] == areas[0]
+    # 分割后的总面积不超过原颗粒团，每部分都接近单个圆
+    assert sum(separated_areas[1:]) <= areas[1]
+    for area in separated_areas[1:]:
+        assert 0.8 * single_area < area < 1.05 * single_area
+
+
+def test_analyze_grains_binary_matches_grains():
+    # 白色背景上的深色颗粒：一对粘连的圆和一个单独的圆
+    image = np.full((200, 360, 3), 255, np.uint8)
+    cv2.circle(image, (103, 100), 30, (0, 0, 0), -1)
+    cv2.circle(image, (157, 100), 30, (0, 0, 0), -1)
+    cv2.circle(image, (280, 100), 30, (0, 0, 0), -1)
+    result, _, binary, _ = analyze_grains(image, min_area=100, max_area=10000, render=False, separate=True)
+    assert result["粘连颗粒团数"] == 1
+    assert result["粒子数量"] == 3
+    # 返回的二值图沿分割线断开，连通区域数与颗粒数一致
+    count, _ = cv2.connectedComponents(binary)
+    assert count - 1 == result["粒子数量"]
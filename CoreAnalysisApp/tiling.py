@@ -0,0 +1,203 @@
+# 图像分块并行执行
+# 将大图像切分为带重叠边缘的分块，在线程池中逐块执行模糊/阈值/形态学和轮廓查找，
+# OpenCV在计算时会释放GIL，因此多线程可以利用多个CPU核心
+#
+# 合并规则（保证与串行结果完全一致）：
+# 1. 像素处理：每个分块额外读取halo像素的边缘参与计算，只写回分块核心区域；
+#    halo不小于各步骤影响半径之和时，核心区域的结果与整幅图像处理完全相同
+# 2. 轮廓归属：每个对象的锚点是其最上方一行中最左侧的像素（即OpenCV轮廓的起点），
+#    对象只由锚点所在核心区域的分块负责，从而去除重叠区域中的重复对象
+# 3. 跨块对象：触碰分块窗口内部边界的对象被截断，改为在逐步扩大的窗口中重新查找，直到完整
+# 4. 嵌套对象：被截断的大对象可能在窗口中失去包围关系，合并后剔除位于其他对象孔洞内的对象
+# 5. 排序：串行cv2.findContours按锚点 (y, x) 从大到小返回轮廓，合并结果按相同顺序排列
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+# 默认分块边长（像素）
+DEFAULT_TILE_SIZE = 1024
+# 轮廓查找窗口超出分块核心区域的重叠宽度（像素）
+DEFAULT_CONTOUR_OVERLAP = 64
+
+
+def default_workers():
+    """默认线程数：可用CPU数量"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def tile_cores(height, width, tile_size):
+    """将图像划分为不重叠的分块核心区域，返回 (y0, y1, x0, x1) 列表"""
+    return [
+        (y0, min(y0 + tile_size, height), x0, min(x0 + tile_size, width))
+        for y0 in range(0, height, tile_size)
+        for x0 in range(0, width, tile_size)
+    ]
+
+
+def _expand(core, margin, height, width):
+    """将区域向四周扩展margin像素，并裁剪到图像范围内"""
+    y0, y1, x0, x1 = core
+    return max(0, y0 - margin), min(height, y1 + margin), max(0, x0 - margin), min(width, x1 + margin)
+
+
+def apply_tiled(src, stage_fn, halo, executor, tile_size=DEFAULT_TILE_SIZE, pool=None):
+    """分块执行逐像素/邻域处理stage_fn，输出与对整幅图像执行stage_fn(src)相同的结果
+
+    halo为stage_fn中所有邻域操作的影响半径之和。
+    pool为可选的缓冲池，输出数组从中取得，各分块的结果复制后归还。
+    """
+    height, width = src.shape[:2]
+    dst = np.empty((height, width), dtype=np.uint8) if pool is None else pool.acquire((height, width))
+
+    def run(core):
+        wy0, wy1, wx0, wx1 = _expand(core, halo, height, width)
+        out = stage_fn(src[wy0:wy1, wx0:wx1])
+        y0, y1, x0, x1 = core
+        dst[y0:y1, x0:x1] = out[y0 - wy0:y1 - wy0, x0 - wx0:x1 - wx0]
+        if pool is not None:
+            pool.release(out)
+
+    list(executor.map(run, tile_cores(height, width, tile_size)))
+    return dst
+
+
+def _find_window(binary, window):
+    """在窗口内查找外轮廓，返回 (窗口内轮廓列表, {全局锚点: 序号})"""
+    wy0, wy1, wx0, wx1 = window
+    contours, _ = cv2.findContours(binary[wy0:wy1, wx0:wx1], cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    anchors = {(int(contour[0, 0, 1]) + wy0, int(contour[0, 0, 0]) + wx0): index
+               for index, contour in enumerate(contours)}
+    return contours, anchors
+
+
+def _locate(binary, window, contour):
+    """将窗口内的轮廓转换到全局坐标，返回 (全局轮廓, 是否被窗口截断, 全局外接矩形)"""
+    height, width = binary.shape
+    wy0, wy1, wx0, wx1 = window
+    x, y, w, h = cv2.boundingRect(contour)
+    # 只有窗口内部边界（不是图像边界）会截断对象
+    truncated = ((x == 0 and wx0 > 0) or (y == 0 and wy0 > 0)
+                 or (x + w == wx1 - wx0 and wx1 < width) or (y + h == wy1 - wy0 and wy1 < height))
+    offset = np.array([wx0, wy0], dtype=contour.dtype)
+    return contour + offset, truncated, (x + wx0, y + wy0, w, h)
+
+
+def _contains(outer, inner):
+    """判断区域outer是否包含区域inner"""
+    return outer[0] <= inner[0] and outer[1] >= inner[1] and outer[2] <= inner[2] and outer[3] >= inner[3]
+
+
+def _resolve_truncated(binary, deferred, overlap):
+    """在逐步扩大的窗口中重新查找被截断的对象，返回 [(锚点, 完整轮廓, 外接矩形)]
+
+    已查找过的窗口会被缓存，位于同一大对象上的多个截断片段可以共用同一次查找。
+    """
+    height, width = binary.shape
+    # 缓存的窗口及其中的外轮廓，按面积从大到小排列
+    cache = []
+
+    def lookup(window, anchor):
+        """返回以anchor为锚点的外轮廓 (全局轮廓, 是否被截断, 全局外接矩形)，不存在时返回None"""
+        for cached in cache:
+            if _contains(cached[0], window):
+                break
+        else:
+            cached = (window,) + _find_window(binary, window)
+            cache.append(cached)
+            cache.sort(key=lambda item: (item[0][1] - item[0][0]) * (item[0][3] - item[0][2]), reverse=True)
+        cached_window, contours, anchors = cached
+        index = anchors.get(anchor)
+        return None if index is None else _locate(binary, cached_window, contours[index])
+
+    resolved = []
+    # 先处理大的片段，使其扩大后的窗口能被其余片段复用
+    for anchor, bbox in sorted(deferred, key=lambda item: item[1][2] * item[1][3], reverse=True):
+        margin = overlap
+        while True:
+            x, y, w, h = bbox
+            entry = lookup(_expand((y, y + h, x, x + w), margin, height, width), anchor)
+            if entry is None:
+                # 更大的窗口中锚点不再是任何外轮廓的起点：它属于一个锚点更靠前的对象，
+                # 或者位于某个对象的孔洞中，两种情况串行结果中都不包含它
+                break
+            contour, truncated, bbox = entry
+            if not truncated:
+                resolved.append((anchor, contour, bbox))
+                break
+            # 仍被截断，继续扩大窗口（按4倍增长，查找总代价不超过整幅图像的常数倍）
+            margin *= 4
+    return resolved
+
+
+def _drop_nested(objects, tile_size, overlap):
+    """剔除位于其他对象孔洞中的对象（串行RETR_EXTERNAL不返回这些对象）
+
+    只有跨越分块边界、且宽或高大于重叠宽度的对象才可能在其他分块的窗口中被截断而失去包围关系。
+    """
+    if not objects:
+        return objects
+    bboxes = np.array([obj[2] for obj in objects])
+    anchors = np.array([obj[0] for obj in objects])
+    nested = np.zeros(len(objects), dtype=bool)
+    spans_tiles = ((bboxes[:, 0] // tile_size != (bboxes[:, 0] + bboxes[:, 2] - 1) // tile_size)
+                   | (bboxes[:, 1] // tile_size != (bboxes[:, 1] + bboxes[:, 3] - 1) // tile_size))
+    large = (bboxes[:, 2] > overlap) | (bboxes[:, 3] > overlap)
+    for i in np.flatnonzero(spans_tiles & large):
+        x, y, w, h = bboxes[i]
+        inside = np.flatnonzero((bboxes[:, 0] > x) & (bboxes[:, 1] > y)
+                                & (bboxes[:, 0] + bboxes[:, 2] < x + w) & (bboxes[:, 1] + bboxes[:, 3] < y + h))
+        if len(inside) == 0:
+            continue
+        # 填充大对象的外轮廓，锚点落在填充区域内的其他对象位于其孔洞中
+        filled = np.zeros((h, w), dtype=np.uint8)
+        cv2.drawContours(filled, [objects[i][1]], -1, 1, -1, offset=(-int(x), -int(y)))
+        nested[inside] |= filled[anchors[inside, 0] - y, anchors[inside, 1] - x] > 0
+    return [obj for obj, is_nested in zip(objects, nested) if not is_nested]
+
+
+def find_contours_tiled(binary, executor, tile_size=DEFAULT_TILE_SIZE, overlap=DEFAULT_CONTOUR_OVERLAP,
+                        measure=None):
+    """分块查找二值图像的外轮廓，结果与cv2.findContours(binary, RETR_EXTERNAL, CHAIN_APPROX_SIMPLE)一致
+
+    measure为可选的逐轮廓测量函数，分块内的对象在工作线程中测量；返回 (轮廓列表, 测量结果列表)。
+    """
+    height, width = binary.shape
+    measure = measure or (lambda contour: None)
+
+    def scan(core):
+        y0, y1, x0, x1 = core
+        window = _expand(core, overlap, height, width)
+        contours, anchors = _find_window(binary, window)
+        accepted, deferred = [], []
+        for anchor, index in anchors.items():
+            # 只处理锚点位于本分块核心区域的对象
+            if not (y0 <= anchor[0] < y1 and x0 <= anchor[1] < x1):
+                continue
+            contour, truncated, bbox = _locate(binary, window, contours[index])
+            if truncated:
+                deferred.append((anchor, bbox))
+            else:
+                accepted.append((anchor, contour, bbox, measure(contour)))
+        return accepted, deferred
+
+    objects, deferred = [], []
+    for accepted, pending in executor.map(scan, tile_cores(height, width, tile_size)):
+        objects.extend(accepted)
+        deferred.extend(pending)
+    objects.extend((anchor, contour, bbox, measure(contour))
+                   for anchor, contour, bbox in _resolve_truncated(binary, deferred, overlap))
+    objects = _drop_nested(objects, tile_size, overlap)
+
+    # 按串行findContours的顺序排列：锚点 (y, x) 从大到小
+    objects.sort(key=lambda obj: obj[0], reverse=True)
+    return [obj[1] for obj in objects], [obj[3] for obj in objects]
+
+
+def make_executor(max_workers=None):
+    """创建分块计算使用的线程池"""
+    return ThreadPoolExecutor(max_workers=max_workers or default_workers())
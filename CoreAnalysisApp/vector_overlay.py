@@ -0,0 +1,138 @@
+# 矢量叠加层输出
+# 不再把轮廓绘制到整幅标记图并编码为PNG传给浏览器，而是返回简化后的对象轮廓和每个对象的属性，
+# 由前端画布绘制叠加层：响应大小只与对象数量有关，与图像尺寸无关，
+# 前端切换显示、修改颜色和线宽、鼠标悬停查看属性都不需要再次请求服务器。
+# 支持两种格式：
+# - delta：每条轮廓为整数数组 [x0, y0, dx1, dy1, dx2, dy2, ...]，第一个点为绝对坐标，之后为相邻点的差值
+# - geojson：GeoJSON FeatureCollection，几何为图像像素坐标（y轴向下）的Polygon，属性在properties中
+import cv2
+import numpy as np
+
+from overlay import DEFAULT_STYLES
+from feature_table import FeatureTable
+
+# 支持的输出格式
+OVERLAY_FORMATS = ('delta', 'geojson')
+# 轮廓简化的默认容差（像素），简化后的轮廓与原轮廓的偏差不超过该值
+DEFAULT_TOLERANCE = 1.0
+
+
+def simplify(contour, tolerance=DEFAULT_TOLERANCE):
+    """用Douglas-Peucker算法简化闭合轮廓，返回 N×2 的整数坐标数组"""
+    if tolerance > 0 and len(contour) > 3:
+        contour = cv2.approxPolyDP(contour, tolerance, True)
+    return contour.reshape(-1, 2)
+
+
+def delta_encode(points):
+    """将 N×2 坐标数组编码为 [x0, y0, dx1, dy1, ...]"""
+    points = np.asarray(points, dtype=np.int64).reshape(-1, 2)
+    deltas = points.copy()
+    deltas[1:] -= points[:-1]
+    return deltas.ravel().tolist()
+
+
+def delta_decode(values):
+    """delta_encode的逆运算，返回 N×2 坐标数组"""
+    return np.cumsum(np.asarray(values, dtype=np.int64).reshape(-1, 2), axis=0)
+
+
+def _css_color(bgr):
+    """OpenCV的BGR颜色转换为CSS颜色字符串"""
+    blue, green, red = bgr
+    return f'#{red:02x}{green:02x}{blue:02x}'
+
+
+def default_style(analysis_type):
+    """叠加层的默认样式，与服务器端绘制的标记图一致，前端可自行修改"""
+    style = DEFAULT_STYLES[analysis_type]
+    css = {'color': _css_color(style['color']), 'lineWidth': style['thickness']}
+    if 'approx_color' in style:
+        css.update(approxColor=_css_color(style['approx_color']), approxLineWidth=style['approx_thickness'])
+    return css
+
+
+def object_contours(analysis_type, result):
+    """分析结果中检测到的对象轮廓"""
+    key = '裂缝轮廓' if analysis_type == 'crack' else '轮廓列表'
+    return result.get(key) or []
+
+
+def object_table(analysis_type, result):
+    """分析结果中的特征表，结果中没有特征表时由轮廓生成"""
+    table = result.get('对象表')
+    if table is None:
+        contours = object_contours(analysis_type, result)
+        widths = None
+        if analysis_type == 'crack':
+            # 只有各裂缝的最大宽度
+            widths = [(0.0, float(width), 0.0) for width in result.get('裂缝宽度列表') or []]
+            widths = widths if len(widths) == len(contours) else None
+        table = FeatureTable.from_contours(contours, widths)
+    return table
+
+
+def object_attributes(analysis_type, result):
+    """每个对象的属性字典列表，与object_contours的顺序一致"""
+    table = object_table(analysis_type, result)
+    areas = table['area'].tolist()
+    perimeters = np.round(table['perimeter'], 2).tolist()
+    diameters = np.round(table['equivalent_diameter'], 2).tolist()
+    if analysis_type == 'hole':
+        circularities = np.round(table['circularity'], 4).tolist()
+        return [{'面积': area, '周长': perimeter, '圆形度': circularity, '等效直径': diameter}
+                for area, perimeter, circularity, diameter in zip(areas, perimeters, circularities, diameters)]
+    if analysis_type == 'grain':
+        # 短轴为0的颗粒长宽比为NaN，JSON中输出为null
+        aspects = [None if np.isnan(value) else value for value in np.round(table['aspect_ratio'], 3).tolist()]
+        ferets = np.round(table['feret_max'], 2).tolist()
+        return [{'面积': area, '周长': perimeter, '等效直径': diameter, '长宽比': aspect, '最大Feret直径': feret}
+                for area, perimeter, diameter, aspect, feret in zip(areas, perimeters, diameters, aspects, ferets)]
+    widths = np.round(np.nan_to_num(table['width_max']), 2).tolist()
+    return [{'面积': area, '长度': perimeter, '最大宽度': width}
+            for area, perimeter, width in zip(areas, perimeters, widths)]
+
+
+def _crack_approx(contour):
+    """裂缝标记图中的红色近似多边形（与overlay.draw_cracks相同的精度）"""
+    epsilon = DEFAULT_STYLES['crack']['approx_epsilon'] * cv2.arcLength(contour, True)
+    return cv2.approxPolyDP(contour, epsilon, True).reshape(-1, 2)
+
+
+def build_overlay(analysis_type, result, shape, fmt='delta', tolerance=DEFAULT_TOLERANCE):
+    """生成分析结果的矢量叠加层
+
+    shape为原图形状，fmt为 'delta' 或 'geojson'。返回可直接序列化为JSON的字典，
+    包含图像尺寸、默认样式和对象列表；每个对象含序号、外接矩形 [x, y, w, h]、简化轮廓和属性。
+    """
+    if fmt not in OVERLAY_FORMATS:
+        raise ValueError(f'不支持的叠加层格式: {fmt}')
+    height, width = shape[:2]
+    contours = object_contours(analysis_type, result)
+    attributes = object_attributes(analysis_type, result)
+
+    objects = []
+    for index, (contour, props) in enumerate(zip(contours, attributes)):
+        points = simplify(contour, tolerance)
+        x, y, w, h = (int(v) for v in cv2.boundingRect(contour))
+        if fmt == 'delta':
+            item = {'id': index, 'bbox': [x, y, w, h], 'path': delta_encode(points), 'properties': props}
+            if analysis_type == 'crack':
+                item['approx'] = delta_encode(_crack_approx(contour))
+        else:
+            # GeoJSON的多边形外环需要首尾闭合
+            ring = np.vstack([points, points[:1]]).tolist()
+            item = {'type': 'Feature', 'id': index, 'bbox': [x, y, x + w, y + h],
+                    'geometry': {'type': 'Polygon', 'coordinates': [ring]}, 'properties': props}
+            if analysis_type == 'crack':
+                approx = _crack_approx(contour)
+                item['properties'] = dict(props, approx=np.vstack([approx, approx[:1]]).tolist())
+        objects.append(item)
+
+    overlay = {'format': fmt, 'analysis': analysis_type, 'width': int(width), 'height': int(height),
+               'tolerance': tolerance, 'style': default_style(analysis_type)}
+    if fmt == 'delta':
+        overlay['objects'] = objects
+    else:
+        overlay.update(type='FeatureCollection', features=objects)
+    return overlay
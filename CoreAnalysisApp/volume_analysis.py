@@ -0,0 +1,448 @@
+# CT切片序列的三维孔隙与裂缝分析
+# 孔洞、裂缝分析只处理单张二维照片；微CT数据是数千张切片组成的体数据，整体读入内存并做三维标记往往放不下。
+# 体数据按切片方向分块处理：
+# - SliceStack 按需读取切片：.npy和未压缩的多页TIFF通过内存映射读取，切片目录每次只读取用到的切片文件
+# - 每块额外读取上下各halo张切片参与阈值和三维形态学处理，只保留中间的核心切片，结果与整体处理相同
+# - 每块单独做三维连通区域标记，标记号加上偏移成为全局编号；相邻两块的交界面上相连的体素对应的编号
+#   用并查集合并，只需保留上一块的最后一张标记切片
+# - 每个编号的体素数、坐标的一阶/二阶矩和是否接触外表面在分块时用bincount累加，最后按并查集的根合并
+# 峰值内存约为一个分块（含halo）的原始数据、二值图和标记图
+import argparse
+import glob
+import json
+import os
+import sys
+
+import cv2
+import numpy as np
+from scipy import ndimage
+
+# 默认每块的切片数
+DEFAULT_CHUNK_SLICES = 64
+# 三维开运算和闭运算（3x3x3十字形结构元）的影响半径之和
+MORPH_HALO = 4
+# 扁平度（最短主轴与中间主轴之比）低于该值且体积足够大的孔隙视为裂缝
+FRACTURE_FLATNESS = 0.25
+# 视为裂缝的最小体积（体素）
+MIN_FRACTURE_VOLUME = 1000
+# 自动阈值的直方图分箱数（整数类型取值范围不超过该值时每个整数一个分箱）
+OTSU_BINS = 65536
+# 切片目录中支持的图像扩展名
+SLICE_EXTENSIONS = ('.tif', '.tiff', '.png', '.bmp', '.jpg', '.jpeg')
+
+# 每个孔隙一行的特征
+PORE_DTYPE = np.dtype([
+    ('id', np.int64),
+    ('volume', np.float64),  # 体素数
+    ('centroid_z', np.float64), ('centroid_y', np.float64), ('centroid_x', np.float64),
+    # 等效椭球的三个主轴长度（体素，从长到短）
+    ('axis_major', np.float64), ('axis_middle', np.float64), ('axis_minor', np.float64),
+    ('flatness', np.float64),
+    # 最短主轴方向与切片法向（z轴）的夹角（度），对裂缝即裂缝面的倾角
+    ('dip', np.float64),
+    ('touches_boundary', np.bool_),  # 接触体数据的外表面
+    ('percolating', np.bool_),  # 同时接触第一张和最后一张切片
+    ('fracture', np.bool_),
+])
+
+
+class SliceStack:
+    """按需读取的切片序列，stack[z0:z1] 返回 (z1 - z0, 高, 宽) 数组"""
+
+    def __init__(self, reader, shape, dtype):
+        self._reader = reader
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start, stop, _ = index.indices(len(self))
+        return self._reader(start, max(start, stop))
+
+    @classmethod
+    def from_array(cls, volume):
+        """由数组（包括np.memmap）建立"""
+        return cls(lambda start, stop: np.asarray(volume[start:stop]), volume.shape, volume.dtype)
+
+    @classmethod
+    def from_npy(cls, path):
+        """内存映射读取.npy文件"""
+        return cls.from_array(np.load(path, mmap_mode='r'))
+
+    @classmethod
+    def from_raw(cls, path, shape, dtype=np.uint8):
+        """内存映射读取无文件头的原始体数据（按z、y、x顺序存放）"""
+        return cls.from_array(np.memmap(path, dtype=dtype, mode='r', shape=tuple(shape)))
+
+    @classmethod
+    def from_tiff(cls, path):
+        """读取多页TIFF：未压缩时内存映射，否则逐页读取"""
+        import tifffile
+        try:
+            return cls.from_array(tifffile.memmap(path, mode='r'))
+        except ValueError:
+            tiff = tifffile.TiffFile(path)
+            pages = tiff.pages
+            first = pages[0].asarray()
+            return cls(lambda start, stop: np.stack([pages[z].asarray() for z in range(start, stop)])
+                       if stop > start else np.empty((0,) + first.shape, first.dtype),
+                       (len(pages),) + first.shape, first.dtype)
+
+    @classmethod
+    def from_directory(cls, directory):
+        """读取目录中按文件名排序的切片图像（8位或16位灰度）"""
+        paths = sorted(path for path in glob.glob(os.path.join(directory, '*'))
+                       if path.lower().endswith(SLICE_EXTENSIONS))
+        if not paths:
+            raise ValueError(f"目录中没有切片图像: {directory}")
+
+        def read(z):
+            image = cv2.imread(paths[z], cv2.IMREAD_UNCHANGED)
+            if image is None:
+                raise ValueError(f"无法读取切片: {paths[z]}")
+            return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+
+        first = read(0)
+        return cls(lambda start, stop: np.stack([read(z) for z in range(start, stop)])
+                   if stop > start else np.empty((0,) + first.shape, first.dtype),
+                   (len(paths),) + first.shape, first.dtype)
+
+    @classmethod
+    def open(cls, path, shape=None, dtype=np.uint8):
+        """按路径类型打开：目录、.npy、.tif/.tiff，其他文件按原始体数据读取（需要shape）"""
+        lower = path.lower()
+        if os.path.isdir(path):
+            return cls.from_directory(path)
+        if lower.endswith('.npy'):
+            return cls.from_npy(path)
+        if lower.endswith(('.tif', '.tiff')):
+            return cls.from_tiff(path)
+        if shape is None:
+            raise ValueError("原始体数据需要指定形状 (z, y, x)")
+        return cls.from_raw(path, shape, dtype)
+
+
+class UnionFind:
+    """整数编号的并查集，编号从0开始，可随时增加新编号"""
+
+    def __init__(self):
+        # 数组容量按倍数增长，_count为已使用的编号数
+        self._parent = np.zeros(0, dtype=np.int64)
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def add(self, count):
+        """增加count个独立的编号，返回第一个新编号"""
+        first = self._count
+        if first + count > len(self._parent):
+            parent = np.empty(max(first + count, 2 * len(self._parent)), dtype=np.int64)
+            parent[:first] = self._parent[:first]
+            self._parent = parent
+        self._parent[first:first + count] = np.arange(first, first + count)
+        self._count = first + count
+        return first
+
+    def find(self, item):
+        parent = self._parent
+        while parent[item] != item:
+            # 路径减半
+            parent[item] = parent[parent[item]]
+            item = parent[item]
+        return item
+
+    def union(self, a, b):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            # 较小的编号作为根，结果与合并顺序无关
+            if root_a < root_b:
+                self._parent[root_b] = root_a
+            else:
+                self._parent[root_a] = root_b
+
+    def roots(self):
+        """所有编号的根（向量化地反复取父节点直到不再变化）"""
+        parent = self._parent[:self._count].copy()
+        while True:
+            grand = parent[parent]
+            if np.array_equal(grand, parent):
+                return parent
+            parent = grand
+
+
+def otsu_threshold(stack, samples=16, bins=OTSU_BINS):
+    """在均匀抽取的samples张切片的直方图上计算Otsu阈值
+
+    直方图覆盖抽样切片的最小值到最大值（有符号整数、浮点数均可，nan忽略）；整数类型的取值范围不超过bins时
+    每个整数一个分箱，结果与逐灰度级计算相同，否则分为bins个等宽分箱，阈值取分箱的右边界。
+    抽样切片的灰度全部相同时返回该值。整数类型返回int，浮点类型返回float。
+    """
+    sampled = [stack[z] for z in np.unique(np.linspace(0, len(stack) - 1, min(samples, len(stack))).astype(int))]
+    integer = np.issubdtype(stack.dtype, np.integer)
+    finite = [slice_[np.isfinite(slice_)] if not integer else slice_ for slice_ in sampled]
+    finite = [values for values in finite if values.size]
+    if not finite:
+        raise ValueError("抽样切片中没有有效的灰度值，无法自动确定阈值")
+    low = min(values.min() for values in finite)
+    high = max(values.max() for values in finite)
+    cast = int if integer else float
+    if low == high:
+        return cast(low)
+    if integer and int(high) - int(low) < bins:
+        # 每个整数一个分箱，分箱中心为整数灰度
+        edges = np.arange(int(low), int(high) + 2, dtype=np.float64) - 0.5
+    else:
+        edges = np.linspace(float(low), float(high), bins + 1)
+    histogram = np.zeros(len(edges) - 1, dtype=np.float64)
+    for values in finite:
+        histogram += np.histogram(values, edges)[0]
+    centers = (edges[:-1] + edges[1:]) / 2
+    weight = np.cumsum(histogram)
+    mean = np.cumsum(histogram * centers)
+    total_weight, total_mean = weight[-1], mean[-1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        between = (total_mean * weight - mean * total_weight) ** 2 / (weight * (total_weight - weight))
+    # 阈值t把 <= t 与 > t 分开：分箱index及之前的为一类
+    index = int(np.nanargmax(np.where(np.isfinite(between), between, np.nan)))
+    if integer:
+        return int(np.floor(edges[index + 1]))
+    return float(edges[index + 1])
+
+
+def open_close(binary, element):
+    """三维开运算后闭运算
+
+    腐蚀时体数据边界外按前景处理，使接触外表面的孔隙不会被边界腐蚀掉（与OpenCV二维形态学的边界处理一致）。
+    """
+    opened = ndimage.binary_dilation(ndimage.binary_erosion(binary, element, border_value=1), element)
+    return ndimage.binary_erosion(ndimage.binary_dilation(opened, element), element, border_value=1)
+
+
+def _boundary_pairs(previous, current, structure):
+    """相邻两块交界面上相连的前景体素的标记对（去重），structure为三维连通结构"""
+    height, width = previous.shape
+    pairs = []
+    # 结构元中z+1平面上的邻域偏移
+    for dy, dx in np.argwhere(structure[2]) - 1:
+        a = previous[max(0, -dy):height - max(0, dy), max(0, -dx):width - max(0, dx)]
+        b = current[max(0, dy):height - max(0, -dy), max(0, dx):width - max(0, -dx)]
+        connected = (a > 0) & (b > 0)
+        pairs.append(np.stack([a[connected], b[connected]], axis=1))
+    pairs = np.concatenate(pairs) if pairs else np.empty((0, 2), dtype=np.int64)
+    return np.unique(pairs, axis=0) if len(pairs) else pairs
+
+
+def _chunk_statistics(labels, z0, count):
+    """一块中每个局部标记（1~count）的体素数、坐标一阶和二阶矩和、是否接触侧面，按局部标记排列"""
+    index = np.flatnonzero(labels.ravel())
+    label = labels.ravel()[index] - 1
+    _, height, width = labels.shape
+    z, rest = np.divmod(index, height * width)
+    y, x = np.divmod(rest, width)
+    z = z + z0
+
+    def total(weights=None):
+        return np.bincount(label, weights=weights, minlength=count)
+
+    zf, yf, xf = z.astype(np.float64), y.astype(np.float64), x.astype(np.float64)
+    moments = np.stack([total(), total(zf), total(yf), total(xf),
+                        total(zf * zf), total(yf * yf), total(xf * xf),
+                        total(zf * yf), total(zf * xf), total(yf * xf)], axis=1)
+    side = total(((y == 0) | (y == height - 1) | (x == 0) | (x == width - 1)).astype(np.float64)) > 0
+    return moments, side
+
+
+def analyze_volume(stack, threshold=None, pore_bright=False, chunk_slices=DEFAULT_CHUNK_SLICES, connectivity=1,
+                   morphology=True, min_volume=1, voxel_size=1.0, progress=None):
+    """分块分析切片序列中的孔隙与裂缝
+
+    stack为SliceStack（或可按切片范围取数组的对象），threshold为孔隙阈值（默认按Otsu自动确定），
+    pore_bright为False时灰度不大于阈值的体素为孔隙（CT中孔隙密度低、较暗）。
+    connectivity为三维连通性（1: 6邻域，2: 18邻域，3: 26邻域）；morphology为True时二值化后做3x3x3开、闭运算；
+    min_volume为计入孔隙表和孔隙数量的最小体积（体素），voxel_size为体素边长（毫米等），用于换算体积。
+    返回 (汇总结果字典, 孔隙表)，孔隙表为PORE_DTYPE的结构化数组。
+    """
+    progress = progress or (lambda fraction, message='': None)
+    depth, height, width = stack.shape[:3]
+    if threshold is None:
+        threshold = otsu_threshold(stack)
+    structure = ndimage.generate_binary_structure(3, connectivity)
+    element = ndimage.generate_binary_structure(3, 1)
+    halo = MORPH_HALO if morphology else 0
+
+    union = UnionFind()
+    moments, sides, tops, bottoms = [], [], [], []
+    previous = None
+    pore_voxels = 0
+    for z0 in range(0, depth, chunk_slices):
+        z1 = min(z0 + chunk_slices, depth)
+        progress(z0 / depth, f"切片 {z0}~{z1 - 1}")
+        # 读取带halo的切片，阈值和形态学处理后只保留核心切片
+        h0, h1 = max(0, z0 - halo), min(depth, z1 + halo)
+        data = stack[h0:h1]
+        binary = data > threshold if pore_bright else data <= threshold
+        del data
+        if morphology:
+            binary = open_close(binary, element)
+        binary = binary[z0 - h0:z0 - h0 + (z1 - z0)]
+        pore_voxels += int(np.count_nonzero(binary))
+
+        labels, count = ndimage.label(binary, structure)
+        del binary
+        # 局部标记k对应全局编号 first + k - 1
+        first = union.add(count)
+        chunk_moments, side = _chunk_statistics(labels, z0, count)
+        moments.append(chunk_moments)
+        sides.append(side)
+        top = np.zeros(count, dtype=bool)
+        bottom = np.zeros(count, dtype=bool)
+        if z0 == 0:
+            top[np.unique(labels[0])[1:] - 1] = True
+        if z1 == depth:
+            bottom[np.unique(labels[-1])[1:] - 1] = True
+        tops.append(top)
+        bottoms.append(bottom)
+
+        # 与上一块交界面上相连的编号合并（交界切片中存放 全局编号+1，0为背景）
+        current = np.where(labels[0] > 0, labels[0].astype(np.int64) + first, 0)
+        if previous is not None:
+            for a, b in _boundary_pairs(previous, current, structure):
+                union.union(int(a) - 1, int(b) - 1)
+        previous = np.where(labels[-1] > 0, labels[-1].astype(np.int64) + first, 0)
+        del labels
+    progress(1.0, "合并孔隙")
+
+    total_voxels = depth * height * width
+    pores = _merge_pores(union, moments, sides, tops, bottoms)
+    pores = pores[pores['volume'] >= min_volume]
+    pores['id'] = np.arange(len(pores))
+
+    voxel_volume = voxel_size ** 3
+    pore_volume = float(pores['volume'].sum())
+    boundary_volume = float(pores['volume'][pores['touches_boundary']].sum())
+    percolating_volume = float(pores['volume'][pores['percolating']].sum())
+    fracture_volume = float(pores['volume'][pores['fracture']].sum())
+    result = {
+        '体素总数': total_voxels,
+        '孔隙体素数': pore_voxels,
+        '阈值': threshold,
+        '孔隙度': pore_voxels / total_voxels if total_voxels else 0.0,
+        '孔隙数量': int(len(pores)),
+        '平均孔隙体积': pore_volume / len(pores) * voxel_volume if len(pores) else 0.0,
+        '最大孔隙体积': float(pores['volume'].max()) * voxel_volume if len(pores) else 0.0,
+        # 连通性：接触外表面的孔隙（可从外部进入）和贯通第一张到最后一张切片的孔隙所占的体积
+        '连通孔隙度': boundary_volume / total_voxels if total_voxels else 0.0,
+        '贯通孔隙度': percolating_volume / total_voxels if total_voxels else 0.0,
+        '是否贯通': bool(pores['percolating'].any()),
+        '最大孔隙占比': float(pores['volume'].max()) / pore_volume if pore_volume else 0.0,
+        '孤立孔隙数量': int(np.count_nonzero(~pores['touches_boundary'])),
+        '裂缝数量': int(np.count_nonzero(pores['fracture'])),
+        '裂缝孔隙度': fracture_volume / total_voxels if total_voxels else 0.0,
+        '体素尺寸': voxel_size,
+    }
+    return result, pores
+
+
+def _merge_pores(union, moments, sides, tops, bottoms):
+    """按并查集的根合并各块的统计量，计算每个孔隙的体积、质心、主轴和扁平度"""
+    if not len(union):
+        return np.zeros(0, dtype=PORE_DTYPE)
+    roots = union.roots()
+    _, pore_of = np.unique(roots, return_inverse=True)
+    count = int(pore_of.max()) + 1
+    moments = np.concatenate(moments)
+    sums = np.stack([np.bincount(pore_of, weights=moments[:, k], minlength=count)
+                     for k in range(moments.shape[1])], axis=1)
+
+    def any_of(flags):
+        return np.bincount(pore_of, weights=np.concatenate(flags).astype(np.float64), minlength=count) > 0
+
+    volume = sums[:, 0]
+    mean = sums[:, 1:4] / volume[:, None]
+    # 协方差矩阵（z, y, x）
+    zz, yy, xx = (sums[:, 4:7] / volume[:, None] - mean ** 2).T
+    zy = sums[:, 7] / volume - mean[:, 0] * mean[:, 1]
+    zx = sums[:, 8] / volume - mean[:, 0] * mean[:, 2]
+    yx = sums[:, 9] / volume - mean[:, 1] * mean[:, 2]
+    covariance = np.stack([np.stack([zz, zy, zx], axis=1), np.stack([zy, yy, yx], axis=1),
+                           np.stack([zx, yx, xx], axis=1)], axis=1)
+    # 单个体素的方差为1/12，使单体素和细薄对象的主轴长度不为0
+    covariance += np.eye(3) / 12
+    eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+    # 均匀椭球沿半轴a方向的方差为 a²/5，主轴长度为 2a
+    axes = 2 * np.sqrt(5 * np.clip(eigenvalues, 0, None))
+
+    pores = np.zeros(count, dtype=PORE_DTYPE)
+    pores['volume'] = volume
+    pores['centroid_z'], pores['centroid_y'], pores['centroid_x'] = mean.T
+    pores['axis_major'], pores['axis_middle'], pores['axis_minor'] = axes[:, 2], axes[:, 1], axes[:, 0]
+    pores['flatness'] = axes[:, 0] / axes[:, 1]
+    # 最小特征值对应的特征向量为最短主轴方向（对裂缝即裂缝面的法向），z分量决定倾角
+    pores['dip'] = np.degrees(np.arccos(np.clip(np.abs(eigenvectors[:, 0, 0]), 0, 1)))
+    top, bottom = any_of(tops), any_of(bottoms)
+    pores['touches_boundary'] = any_of(sides) | top | bottom
+    pores['percolating'] = top & bottom
+    pores['fracture'] = (pores['flatness'] < FRACTURE_FLATNESS) & (volume >= MIN_FRACTURE_VOLUME)
+    return pores
+
+
+def save_pores(pores, path):
+    """按扩展名保存孔隙表（.npz或.csv）"""
+    if path.lower().endswith('.csv'):
+        with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+            import csv
+            writer = csv.writer(f)
+            writer.writerow(pores.dtype.names)
+            writer.writerows(pores.tolist())
+    elif path.lower().endswith('.npz'):
+        np.savez(path, pores=pores)
+    else:
+        raise ValueError(f"不支持的孔隙表文件格式: {path}，可选 .npz、.csv")
+
+
+def main(argv=None):
+    """命令行入口：分析CT切片序列，输出汇总结果（JSON）和可选的孔隙表"""
+    parser = argparse.ArgumentParser(description='地质岩心图文分析系统 - CT切片序列三维孔隙与裂缝分析')
+    parser.add_argument('input', help='切片目录、.npy、多页.tif或原始体数据文件')
+    parser.add_argument('--shape', nargs=3, type=int, metavar=('Z', 'Y', 'X'), help='原始体数据的形状')
+    parser.add_argument('--dtype', default='uint8', choices=('uint8', 'uint16', 'int16', 'float32'),
+                        help='原始体数据的类型')
+    parser.add_argument('--threshold', type=float, help='孔隙阈值（默认按Otsu自动确定）')
+    parser.add_argument('--pore-bright', action='store_true', help='孔隙为亮区域（默认孔隙为暗区域）')
+    parser.add_argument('--chunk', type=int, default=DEFAULT_CHUNK_SLICES, help='每块的切片数')
+    parser.add_argument('--connectivity', type=int, choices=(1, 2, 3), default=1,
+                        help='三维连通性：1为6邻域，2为18邻域，3为26邻域')
+    parser.add_argument('--no-morphology', action='store_true', help='不做开、闭运算')
+    parser.add_argument('--min-volume', type=float, default=1, help='计入孔隙表的最小体积（体素）')
+    parser.add_argument('--voxel-size', type=float, default=1.0, help='体素边长')
+    parser.add_argument('-o', '--output', help='汇总结果JSON文件（默认输出到终端）')
+    parser.add_argument('--pores', help='孔隙表文件（.npz或.csv）')
+    args = parser.parse_args(argv)
+
+    stack = SliceStack.open(args.input, args.shape, args.dtype)
+    print(f"[体数据分析] {args.input}: {stack.shape}，{stack.dtype}", file=sys.stderr)
+    result, pores = analyze_volume(stack, args.threshold, args.pore_bright, args.chunk, args.connectivity,
+                                   not args.no_morphology, args.min_volume, args.voxel_size)
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        try:
+            print(text)
+        except BrokenPipeError:
+            # 输出到head等提前退出的管道时静默结束
+            sys.stderr.close()
+    if args.pores:
+        save_pores(pores, args.pores)
+        print(f"[体数据分析] 已保存 {len(pores)} 个孔隙到 {args.pores}", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())